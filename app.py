@@ -1,10 +1,13 @@
+import io
+import tempfile
 from dataclasses import dataclass
+from datetime import datetime
 from pathlib import Path
 
-import pandas as pd
 import streamlit as st
 
-from src.main import predict, start_model_training
+from src.main import start_model_training
+from src.serving.predict import predict_row, predict_to_csv
 
 st.set_page_config('Prevention System', 'random', initial_sidebar_state='collapsed')
 st.markdown(
@@ -18,7 +21,7 @@ class BaseDF:
     sourceid: int
     destinationid: int
     amountofmoney: int
-    month: int
+    date: datetime
     typeofaction: str
     typeoffraud: str
 
@@ -26,7 +29,9 @@ class BaseDF:
         yield 'sourceid', self.sourceid
         yield 'destinationid', self.destinationid
         yield 'amountofmoney', self.amountofmoney
-        yield 'month', self.month
+        # The model is trained on the month, velocity features on the full date.
+        yield 'date', self.date
+        yield 'month', self.date.month
         yield 'typeofaction', self.typeofaction
         yield 'typeoffraud', self.typeoffraud
 
@@ -67,12 +72,20 @@ if option == 'Prediction from Form':
         sourceid = int(st.number_input('Source ID', format='%d', value=30105))
         destinationid = int(st.number_input('Destination ID', format='%d', value=8692))
         amountofmoney = int(st.number_input('Amount of Money', format='%d', value=494528))
-        month = int(st.number_input('Month of transaction', format='%d', value=5))
+        date = st.date_input('Date of transaction', value=datetime(2019, 5, 1))
+        time = st.time_input('Time of transaction', value=datetime(2019, 5, 1, 12).time())
         typeofaction = str(st.selectbox('Type of Action', ['cash-in', 'transfer']))
         typeoffraud = str(st.selectbox('Type of Fraud', ['type1', 'type2', 'type3', 'none']))
 
         if st.form_submit_button():
-            base = BaseDF(sourceid, destinationid, amountofmoney, month, typeofaction, typeoffraud)
+            base = BaseDF(
+                sourceid,
+                destinationid,
+                amountofmoney,
+                datetime.combine(date, time),
+                typeofaction,
+                typeoffraud,
+            )
 else:
     with st.form('batch-prediction'):
         upload = st.file_uploader(label='Upload CSV file', type='csv')
@@ -80,34 +93,38 @@ else:
         if st.form_submit_button():
             if upload is None:
                 raise FileNotFoundError('File does not uploaded.')
-            base = pd.read_csv(upload)
+            base = upload
 
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
 # Process after getting the `base` DataFrame
 # --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
 if base is not None and isinstance(base, BaseDF):
-    df = pd.DataFrame([dict(base)])
     try:
-        _, prediction = predict(df)
+        prediction = predict_row(dict(base))
     except FileNotFoundError:
         msg.error('Model is not trained yet. Please train model first.', icon='🔥')
         st.stop()
     else:
         result, color = ('Fraud', 'red') if prediction == 1 else ('Not Fraud', 'green')
         st.subheader(f':{color}[The entry is {result}.]')
-elif base is not None and isinstance(base, pd.DataFrame):
-    df = base
+elif base is not None:
+    # Predictions are streamed chunk by chunk into a temporary file. It is unbuffered,
+    # so that the download button takes its bytes as they are instead of decoding them.
+    pred_file = tempfile.TemporaryFile(buffering=0)
     try:
-        pred_df, _ = predict(df)
+        pred_text = io.TextIOWrapper(io.BufferedWriter(pred_file), 'utf-8', newline='')
+        predict_to_csv(base, pred_text)
+        pred_text.detach().detach()  # Flushed, without closing `pred_file`.
     except FileNotFoundError:
         msg.error('Model is not trained yet. Please train model first.', icon='🤖')
         st.stop()
     else:
         st.balloons()
         msg.success('Download the predicted data file.')
+        pred_file.seek(0)
         st.download_button(
             label='Download Prediction DataFrame',
-            data=pred_df.to_csv(index=False),
+            data=pred_file,
             file_name='Money-Laundering-Prediction.csv',
             mime='csv',
             use_container_width=True,
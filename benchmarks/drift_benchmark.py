@@ -0,0 +1,60 @@
+"""
+Benchmark the drift engine against the previous column-by-column `ks_2samp` loop.
+
+Usage: `python -m benchmarks.drift_benchmark --rows 1000000 --num-cols 20`
+"""
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from scipy.stats import ks_2samp
+
+from src.components.data import drift
+
+
+def make_frame(rows: int, num_cols: int, seed: int) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    data = {f'num_{i}': rng.lognormal(10, 2, rows).round() for i in range(num_cols)}
+    data['typeofaction'] = rng.choice(['cash-in', 'transfer'], rows)
+    data['typeoffraud'] = rng.choice(['type1', 'type2', 'type3', 'none'], rows)
+    return pd.DataFrame(data)
+
+
+def legacy_drift(base_df: pd.DataFrame, curr_dfs: dict[str, pd.DataFrame]) -> None:
+    for curr_df in curr_dfs.values():
+        for col in base_df.columns:
+            ks_2samp(base_df[col], curr_df[col])
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--num-cols', type=int, default=20)
+    parser.add_argument('--n-jobs', type=int, default=None)
+    args = parser.parse_args()
+
+    base_df = make_frame(args.rows, args.num_cols, seed=0)
+    curr_dfs = {
+        'train_df': make_frame(int(args.rows * 0.8), args.num_cols, seed=1),
+        'test_df': make_frame(int(args.rows * 0.2), args.num_cols, seed=2),
+    }
+    cat_cols = ['typeofaction', 'typeoffraud']
+    print(f'{args.rows:,} base rows x {base_df.shape[1]} columns')
+
+    start = time.perf_counter()
+    legacy_drift(base_df, curr_dfs)
+    legacy = time.perf_counter() - start
+    print(f'legacy ks_2samp loop : {legacy:8.2f}s')
+
+    for n_jobs in (1, args.n_jobs):
+        start = time.perf_counter()
+        drift.data_drift(base_df, curr_dfs, list(base_df.columns), cat_cols, n_jobs=n_jobs)
+        elapsed = time.perf_counter() - start
+        label = f'engine (n_jobs={n_jobs or "all"})'
+        print(f'{label:<21}: {elapsed:8.2f}s  ({legacy / elapsed:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
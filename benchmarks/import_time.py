@@ -0,0 +1,69 @@
+"""
+Import time of the inference entry points in fresh interpreters.
+
+Usage: `python -m benchmarks.import_time --repeat 5 --max-seconds 1.0`
+
+Exits with a non-zero status if a module imports a training-only dependency or if
+its median import time is over `--max-seconds`, so startup regressions are caught.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+MODULES = ('src.serving.predict', 'src.main', 'src.serving.server')
+# Training, database and drift dependencies that scoring must not pay for.
+FORBIDDEN = ('pymongo', 'dotenv', 'scipy.stats', 'src.components', 'src.database')
+
+_PROBE = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'modules': list(sys.modules)}}))
+'''
+
+
+def measure(module: str) -> tuple[float, list[str]]:
+    out = subprocess.run(
+        [sys.executable, '-c', _PROBE.format(module=module)],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    result = json.loads(out.splitlines()[-1])
+    return result['seconds'], result['modules']
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    failed = False
+    for module in MODULES:
+        timings = []
+        for _ in range(args.repeat):
+            seconds, modules = measure(module)
+            timings.append(seconds)
+        median = statistics.median(timings)
+        forbidden = [
+            name for name in FORBIDDEN
+            if any(m == name or m.startswith(name + '.') for m in modules)
+        ]
+        status = 'ok'
+        if forbidden:
+            status = f'imports {forbidden}'
+        elif args.max_seconds is not None and median > args.max_seconds:
+            status = f'over {args.max_seconds}s'
+        failed = failed or status != 'ok'
+        print(f'{module:<22}: median {median:6.3f}s  min {min(timings):6.3f}s  {status}')
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
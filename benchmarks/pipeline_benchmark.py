@@ -0,0 +1,214 @@
+"""
+End-to-end benchmark of the training pipeline and of serving, on synthetic data.
+
+Usage: `python -m benchmarks.pipeline_benchmark --rows 1000000`
+
+Trains from scratch in a scratch directory (the repository's `saved_models` is left
+alone) on rows from `benchmarks.synthetic`, then measures single-row prediction
+latency and batch prediction throughput. Stage timings come from the pipeline's
+run report, see `src.core.metrics`.
+
+Results are saved as `<commit>.json` in `--results-dir` (`benchmarks/results` by
+default, not versioned) and compared with the most recent result of another commit for
+the same number of rows, so regressions between commits show up as relative changes.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic import SCHEMA_PATH, TransactionGenerator, write_csv
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+RESULTS_DIR = REPO_DIR / 'benchmarks' / 'results'
+# Changes below this relative threshold are reported as noise.
+REGRESSION_THRESHOLD = 0.1
+
+
+def _git_commit() -> str:
+    try:
+        out = subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True,
+        )
+        commit = out.stdout.strip()
+        dirty = subprocess.run(
+            ['git', 'diff', '--quiet', 'HEAD', '--', 'src'], cwd=REPO_DIR,
+        ).returncode
+        return commit + ('-dirty' if dirty else '')
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def _scoring_frame(df: pd.DataFrame, date_col: str, target: str) -> pd.DataFrame:
+    """Rows as sent for prediction: the `month` feature instead of the date, no target."""
+    df = df.drop(columns=[target])
+    df['month'] = pd.to_datetime(df.pop(date_col)).dt.month
+    return df
+
+
+def bench_training(data_path: Path, in_memory: bool) -> dict:
+    from src.core import metrics
+    from src.main import start_model_training
+
+    start = time.perf_counter()
+    start_model_training(data_path, in_memory=in_memory)
+    total = time.perf_counter() - start
+    report = metrics.load_latest_report()
+    stages = {s['stage']: s for s in report['stages']}
+    return {
+        'total_seconds': round(total, 3),
+        'stages': {
+            name: {
+                'wall_seconds': s['wall_seconds'],
+                'cpu_seconds': s['cpu_seconds'],
+                'peak_rss_bytes': s['peak_rss_bytes'],
+            }
+            for name, s in stages.items()
+        },
+    }
+
+
+def bench_single_row(rows: list[dict]) -> dict:
+    from src.serving.predict import predict_row
+
+    predict_row(rows[0])  # Loads the models.
+    latencies = np.empty(len(rows))
+    for i, row in enumerate(rows):
+        start = time.perf_counter()
+        predict_row(row)
+        latencies[i] = time.perf_counter() - start
+    return {
+        'n': len(rows),
+        'p50_ms': round(float(np.percentile(latencies, 50)) * 1e3, 4),
+        'p99_ms': round(float(np.percentile(latencies, 99)) * 1e3, 4),
+    }
+
+
+def bench_batch(input_path: Path, output_path: Path, chunksize: int) -> dict:
+    from src.serving.predict import predict_to_csv
+
+    start = time.perf_counter()
+    n_rows = predict_to_csv(input_path, output_path, chunksize)
+    elapsed = time.perf_counter() - start
+    return {
+        'rows': n_rows,
+        'seconds': round(elapsed, 3),
+        'rows_per_second': round(n_rows / elapsed, 1),
+    }
+
+
+def _flatten(result: dict) -> dict[str, float]:
+    """Metrics compared between commits, lower is better except for throughput."""
+    flat = {'training.total_seconds': result['training']['total_seconds']}
+    for name, stage in result['training']['stages'].items():
+        flat[f'training.{name}.wall_seconds'] = stage['wall_seconds']
+        flat[f'training.{name}.peak_rss_bytes'] = stage['peak_rss_bytes']
+    flat['predict_row.p50_ms'] = result['predict_row']['p50_ms']
+    flat['predict_row.p99_ms'] = result['predict_row']['p99_ms']
+    flat['batch.rows_per_second'] = result['batch']['rows_per_second']
+    return flat
+
+
+def previous_result(result: dict, results_dir: Path) -> dict | None:
+    """Most recent result of another commit with the same number of rows."""
+    candidates = []
+    for fp in results_dir.glob('*.json'):
+        other = json.loads(fp.read_text())
+        if other['commit'] != result['commit'] and other['rows'] == result['rows']:
+            candidates.append(other)
+    return max(candidates, key=lambda r: r['timestamp'], default=None)
+
+
+def compare(result: dict, previous: dict) -> list[str]:
+    lines = [f'Compared with {previous["commit"]} ({previous["timestamp"]}):']
+    current, before = _flatten(result), _flatten(previous)
+    for key, value in current.items():
+        if not before.get(key):
+            continue
+        change = value / before[key] - 1
+        worse = -change if key.endswith('rows_per_second') else change
+        flag = ' REGRESSION' if worse > REGRESSION_THRESHOLD else ''
+        lines.append(f'  {key}: {before[key]} -> {value} ({change:+.1%}){flag}')
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--score-rows', type=int, default=1_000_000)
+    parser.add_argument('--single-rows', type=int, default=2_000)
+    parser.add_argument('--predict-chunksize', type=int, default=100_000)
+    parser.add_argument('--in-memory', action='store_true')
+    parser.add_argument('--data', type=Path, default=None, help='Reuse a generated CSV.')
+    parser.add_argument('--workdir', type=Path, default=None, help='Kept after the run.')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--results-dir', type=Path, default=RESULTS_DIR)
+    args = parser.parse_args()
+    # Resolved before changing into the working directory.
+    results_dir = args.results_dir.resolve()
+
+    commit = _git_commit()
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix='pipeline-benchmark-'))
+    workdir = workdir.resolve()
+    (workdir / SCHEMA_PATH.parent).mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(REPO_DIR / SCHEMA_PATH, workdir / SCHEMA_PATH)
+
+    generator = TransactionGenerator.from_base_data(seed=args.seed)
+    data_path = args.data.resolve() if args.data else workdir / 'train.csv'
+    score_path = workdir / 'score.csv'
+    single_rows = _scoring_frame(
+        generator.generate(args.single_rows), generator.date_col, generator.target
+    ).to_dict('records')
+    if args.data is None:
+        start = time.perf_counter()
+        write_csv(generator, args.rows, data_path)
+        print(f'Generated {args.rows:,} rows in {time.perf_counter() - start:.1f}s')
+    with open(score_path, 'w', newline='') as f:
+        for i, chunk in enumerate(generator.iter_chunks(args.score_rows, 1_000_000)):
+            chunk = _scoring_frame(chunk, generator.date_col, generator.target)
+            chunk.to_csv(f, header=i == 0, index=False)
+
+    # The pipeline resolves its paths against the working directory.
+    os.chdir(workdir)
+    try:
+        result = {
+            'commit': commit,
+            'timestamp': datetime.now().isoformat(timespec='seconds'),
+            'rows': args.rows,
+            'in_memory': args.in_memory,
+            'machine': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+            },
+            'training': bench_training(data_path, args.in_memory),
+            'predict_row': bench_single_row(single_rows),
+            'batch': bench_batch(score_path, workdir / 'predictions.csv', args.predict_chunksize),
+        }
+    finally:
+        os.chdir(REPO_DIR)
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    results_dir.mkdir(parents=True, exist_ok=True)
+    (results_dir / f'{commit}.json').write_text(json.dumps(result, indent=2))
+    print(json.dumps(result, indent=2))
+
+    previous = previous_result(result, results_dir)
+    if previous is not None:
+        print('\n'.join(compare(result, previous)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+"""
+Synthetic transactions at production scale, fitted on `data/base_data.csv`.
+
+Usage: `python -m benchmarks.synthetic --rows 10000000 --out data/synthetic.csv`
+
+The columns follow `src/database/schema.json` and reproduce the base dataset's:
+
+- joint frequencies of `typeofaction`, `typeoffraud` and `isfraud` (fraud ratio),
+- amount distribution of each fraud type (resampled with a small multiplicative
+  jitter, so the skew is kept without copying values),
+- ID reuse: how many IDs occur once, twice, ... per row, drawn from the ID range,
+- dates: resampled base dates shifted by up to half a day.
+
+Rows are generated and appended to the CSV chunk by chunk, so memory stays flat
+whatever the number of rows.
+"""
+
+import argparse
+import json
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Iterator
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_PATH = Path('src/database/schema.json')
+BASE_DATA_PATH = Path('data/base_data.csv')
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+
+@dataclass
+class _IdModel:
+    low: int
+    high: int
+    # Share of the rows whose ID occurs k times, for each observed k.
+    occurrences: np.ndarray
+    probabilities: np.ndarray
+
+    @classmethod
+    def fit(cls, ids: pd.Series) -> '_IdModel':
+        counts = ids.value_counts().value_counts().sort_index()
+        return cls(
+            int(ids.min()),
+            int(ids.max()),
+            counts.index.to_numpy(),
+            (counts / counts.sum()).to_numpy(),
+        )
+
+    def sample(self, rng: np.random.Generator, n: int) -> np.ndarray:
+        # Draw IDs with their number of occurrences until there are enough rows.
+        mean_occurrences = float(self.occurrences @ self.probabilities)
+        n_ids = int(n / mean_occurrences * 1.1) + 1
+        repeats = rng.choice(self.occurrences, n_ids, p=self.probabilities)
+        ids = rng.integers(self.low, self.high + 1, n_ids)
+        rows = np.repeat(ids, repeats)[:n]
+        if len(rows) < n:
+            rows = np.concatenate([rows, rng.integers(self.low, self.high + 1, n - len(rows))])
+        return rng.permutation(rows)
+
+
+class TransactionGenerator:
+    def __init__(self, base_df: pd.DataFrame, seed: int = 0) -> None:
+        schema = json.loads(SCHEMA_PATH.read_text())
+        self.columns: list[str] = list(base_df.columns)
+        self.target: str = schema['targetColumn']
+        self.date_col: str = schema['dateColumnsNames'][0]
+        self.rng = np.random.default_rng(seed)
+
+        keys = ['typeofaction', 'typeoffraud', self.target]
+        combos = base_df.groupby(keys).size()
+        self.combos = combos.index.to_frame(index=False)
+        self.combo_p = (combos / combos.sum()).to_numpy()
+        self.amounts = {
+            fraud_type: group.to_numpy()
+            for fraud_type, group in base_df.groupby('typeoffraud')['amountofmoney']
+        }
+        self.source_ids = _IdModel.fit(base_df['sourceid'])
+        self.destination_ids = _IdModel.fit(base_df['destinationid'])
+        self.dates = pd.to_datetime(base_df[self.date_col]).to_numpy()
+
+    @classmethod
+    def from_base_data(cls, path: Path = BASE_DATA_PATH, seed: int = 0):
+        return cls(pd.read_csv(path), seed)
+
+    def generate(self, n: int) -> pd.DataFrame:
+        rng = self.rng
+        df = self.combos.iloc[rng.choice(len(self.combos), n, p=self.combo_p)]
+        df = df.reset_index(drop=True)
+
+        amounts = np.empty(n, dtype=np.int64)
+        for fraud_type, observed in self.amounts.items():
+            mask = (df['typeoffraud'] == fraud_type).to_numpy()
+            sampled = rng.choice(observed, mask.sum()) * rng.lognormal(0, 0.05, mask.sum())
+            amounts[mask] = np.maximum(sampled.round(), 1)
+
+        half_day = np.timedelta64(12 * 60, 'm')
+        minutes = rng.integers(-half_day.astype(int), half_day.astype(int) + 1, n)
+        dates = rng.choice(self.dates, n) + minutes.astype('timedelta64[m]')
+
+        df['sourceid'] = self.source_ids.sample(rng, n)
+        df['destinationid'] = self.destination_ids.sample(rng, n)
+        df['amountofmoney'] = amounts
+        df[self.date_col] = pd.Series(dates).dt.strftime(DATE_FORMAT)
+        return df[self.columns]
+
+    def iter_chunks(self, rows: int, chunksize: int) -> Iterator[pd.DataFrame]:
+        for start in range(0, rows, chunksize):
+            yield self.generate(min(chunksize, rows - start))
+
+
+def write_csv(
+    generator: TransactionGenerator,
+    rows: int,
+    out: Path,
+    chunksize: int = 1_000_000,
+) -> None:
+    """Stream `rows` synthetic transactions into the CSV file `out`."""
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, 'w', newline='') as f:
+        for i, chunk in enumerate(generator.iter_chunks(rows, chunksize)):
+            chunk.to_csv(f, header=i == 0, index=False)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--out', type=Path, default=Path('data/synthetic.csv'))
+    parser.add_argument('--chunksize', type=int, default=1_000_000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    generator = TransactionGenerator.from_base_data(seed=args.seed)
+    write_csv(generator, args.rows, args.out, args.chunksize)
+    elapsed = time.perf_counter() - start
+    print(f'{args.rows:,} rows written to {args.out} in {elapsed:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
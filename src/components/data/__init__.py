@@ -1 +1 @@
-from . import ingestion, transformation, validation
+from . import graph, ingestion, transformation, validation
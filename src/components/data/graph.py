@@ -0,0 +1,221 @@
+"""
+Transaction graph features.
+
+Accounts are the nodes and transactions the directed edges of a sparse adjacency
+matrix, built from the training transactions. Every feature is a sparse reduction or
+matrix-vector product over that matrix, so the cost is linear in the number of edges:
+
+- `out_degree`, `in_degree`: Distinct destination and source counterparties.
+- `out_amount`, `in_amount`: Total amount sent (fan-out) and received (fan-in).
+- `guilty`: Weight of the account in `MLtag.csv` by level of crime, 0 if untagged.
+- `guilty_1hop`: Summed weight of tagged counterparties.
+- `guilty_2hop`: Summed weight of tagged accounts two hops away, by number of paths.
+- `shared_counterparties`: Accounts sharing a counterparty with this one, counted once
+  per shared counterparty.
+
+Counterparties are undirected for the proximity features.
+
+Test rows and transactions scored later are joined with the features of the whole
+training graph, which does not hold them. Train rows are joined out-of-fold, with the
+features of the graph of the other folds, so that they do not see their own edges
+either.
+"""
+
+from dataclasses import replace
+
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+from src.core import get_logger, io
+from src.core.metrics import profiled, record_rows
+from src.entity.artifact import DataValidationArtifact
+from src.entity.config import DataGraphConfig
+from src.serving.features import ACCOUNT_COLUMNS, AccountFeatures
+
+logger = get_logger(__name__)
+
+
+def _index_ids(ids: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Sorted unique IDs and the position of every entry of `ids` among them.
+
+    Non-negative IDs up to a few times as many as there are entries are indexed with a
+    presence mask, which is linear; other IDs are sorted.
+    """
+    if len(ids) and ids.dtype.kind in 'iu' and ids.min() >= 0 and ids.max() < 4 * len(ids):
+        present = np.zeros(ids.max() + 1, dtype=bool)
+        present[ids] = True
+        positions = np.cumsum(present) - 1
+        return np.flatnonzero(present).astype(ids.dtype), positions[ids]
+    unique, inverse = np.unique(ids, return_inverse=True)
+    return unique, inverse
+
+
+def build_account_features(
+    source: np.ndarray,
+    destination: np.ndarray,
+    amount: np.ndarray,
+    tags: pd.Series | None = None,
+    dtype: str = 'float32',
+) -> AccountFeatures:
+    """
+    :param source, destination, amount: One entry per transaction.
+    :param tags: Weight of each tagged account, indexed by account ID.
+    """
+    tag_ids = tags.index.to_numpy() if tags is not None else np.array([], dtype=source.dtype)
+    ids, inverse = _index_ids(np.concatenate([source, destination, tag_ids]))
+    n, m = len(ids), len(source)
+    src, dst = inverse[:m], inverse[m : 2 * m]
+
+    # Duplicate edges are summed when converting to CSR, so the structure of `amounts`
+    # holds one entry per distinct counterparty.
+    amounts = sparse.csr_matrix((np.asarray(amount, dtype=np.float64), (src, dst)), shape=(n, n))
+    out_degree = np.diff(amounts.indptr)
+    in_degree = np.bincount(amounts.indices, minlength=n)
+
+    # Undirected counterparties, without self-transfers.
+    linked = sparse.csr_matrix(
+        (np.ones_like(amounts.data), amounts.indices, amounts.indptr), shape=(n, n),
+    )
+    rows = np.repeat(np.arange(n), out_degree)
+    linked.data[linked.indices == rows] = 0.0
+    linked.eliminate_zeros()
+    neighbours = (linked + linked.T).tocsr()
+    neighbours.data[:] = 1.0
+    n_neighbours = np.diff(neighbours.indptr)
+
+    guilty = np.zeros(n)
+    if tags is not None:
+        guilty[inverse[2 * m :]] = tags.to_numpy()
+    guilty_1hop = neighbours @ guilty
+    # Walks of length 2 that come back to the account itself are not proximity.
+    guilty_2hop = neighbours @ guilty_1hop - n_neighbours * guilty
+
+    values = np.column_stack([
+        out_degree,
+        in_degree,
+        np.asarray(amounts.sum(axis=1)).ravel(),
+        np.asarray(amounts.sum(axis=0)).ravel(),
+        guilty,
+        guilty_1hop,
+        guilty_2hop,
+        neighbours @ np.maximum(n_neighbours - 1, 0),
+    ]).astype(dtype)
+    columns = [
+        'out_degree',
+        'in_degree',
+        'out_amount',
+        'in_amount',
+        'guilty',
+        'guilty_1hop',
+        'guilty_2hop',
+        'shared_counterparties',
+    ]
+    logger.info('Account features of %s account(s) from %s transaction(s).', n, m)
+    return AccountFeatures(ids, values, columns)
+
+
+class DataGraph(DataGraphConfig):
+    def __init__(
+        self,
+        validation_artifact: DataValidationArtifact,
+        in_memory: bool = False,
+        persist: bool = True,
+        account_features: AccountFeatures | None = None,
+    ) -> None:
+        """
+        :param account_features: Join these features instead of building them from the
+            training transactions, like the current model's for an incremental update.
+        """
+        super().__init__()
+        logger.critical('%s %s %s', '>>>' * 10, self.__class__.__name__, '<<<' * 10)
+        self.validation = validation_artifact
+        self.in_memory = in_memory
+        self.persist = persist or not in_memory
+        self.account_features = account_features
+
+    def _load_tags(self) -> pd.Series | None:
+        """Weight of every guilty account, the highest one for accounts tagged twice."""
+        if not self.tags_path.exists():
+            logger.warning('No tagged accounts at %s, proximity features are 0.', self.tags_path)
+            return None
+        tags = pd.read_csv(self.tags_path)
+        weights = tags['levelofcrime'].map(self.crime_level_weights).fillna(1.0)
+        return weights.groupby(tags['guiltyid']).max()
+
+    def _join_out_of_fold(self, train_df: pd.DataFrame, tags: pd.Series | None) -> pd.DataFrame:
+        """`train_df` with the features of the other `train_folds` folds' transactions."""
+        source = train_df['sourceid'].to_numpy()
+        destination = train_df['destinationid'].to_numpy()
+        amount = train_df['amountofmoney'].to_numpy()
+        rng = np.random.default_rng(42)
+        folds = rng.permutation(len(train_df)) % self.train_folds
+
+        columns: dict[str, np.ndarray] = {}
+        for fold in range(self.train_folds):
+            rows = np.flatnonzero(folds == fold)
+            others = folds != fold
+            features = build_account_features(
+                source[others], destination[others], amount[others], tags, self.feature_dtype,
+            )
+            joined = features.join(train_df.iloc[rows][list(ACCOUNT_COLUMNS)])
+            for column in features.output_columns:
+                values = columns.setdefault(
+                    column, np.zeros(len(train_df), dtype=self.feature_dtype)
+                )
+                values[rows] = joined[column].to_numpy()
+        return train_df.drop(columns=list(columns), errors='ignore').assign(**columns)
+
+    @profiled('graph')
+    def initiate(self) -> DataValidationArtifact:
+        train_df = self.validation.train_df
+        test_df = self.validation.test_df
+        if train_df is None or test_df is None:
+            train_df = io.load_frame(self.validation.train_path, mmap=True)
+            test_df = io.load_frame(self.validation.test_path, mmap=True)
+
+        features = self.account_features
+        if features is None:
+            # Only the training transactions form the graph, like the history at
+            # prediction time.
+            tags = self._load_tags()
+            features = build_account_features(
+                train_df['sourceid'].to_numpy(),
+                train_df['destinationid'].to_numpy(),
+                train_df['amountofmoney'].to_numpy(),
+                tags,
+                self.feature_dtype,
+            )
+            train_df = self._join_out_of_fold(train_df, tags)
+        else:
+            # The saved model's graph does not hold the new transactions.
+            train_df = features.join(train_df)
+        test_df = features.join(test_df)
+        record_rows(len(train_df) + len(test_df), len(train_df) + len(test_df))
+        logger.info('Adding column: %s', features.output_columns)
+
+        if self.persist:
+            background = self.in_memory
+            io.persist(io.dump_frame, train_df, self.train_path, background=background)
+            io.persist(io.dump_frame, test_df, self.test_path, background=background)
+            io.persist(
+                io.dump_frame,
+                features.to_frame(),
+                self.account_features_path,
+                background=background,
+            )
+
+        artifact = replace(
+            self.validation,
+            train_path=self.train_path,
+            test_path=self.test_path,
+            account_features_path=self.account_features_path,
+            extra_num_cols=self.validation.extra_num_cols + features.output_columns,
+        )
+        # Live frames of the previous stages would no longer match the paths.
+        artifact.train_df = artifact.test_df = None
+        if self.in_memory:
+            artifact.train_df, artifact.test_df = train_df, test_df
+            artifact.account_features = features
+        return artifact
@@ -1,26 +1,70 @@
+import shutil
+from functools import partial
 from pathlib import Path
+from typing import Iterator
 
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
-from src.core.logger import get_logger
-from src.database import DataSchema, from_mongodb_to_dataframe
+from src.components.data.profile import DatasetStats
+from src.core import get_logger, io
+from src.core.metrics import profiled, record_rows
+from src.database import (
+    DataSchema,
+    count_documents,
+    from_mongodb_to_dataframe,
+    iter_mongodb_dataframes,
+)
 from src.database.schema import SchemaColumnType
 from src.entity.artifact import DataIngestionArtifact
 from src.entity.config import DataIngestionConfig
+from src.serving.velocity import VelocityStore, feature_columns, history_features
 
 logger = get_logger(__name__)
 
 
+def _id_seconds(object_id: str) -> int:
+    """Creation time of an ObjectId in hex, in seconds."""
+    return int(object_id[:8], 16)
+
+
 class DataIngestion(DataIngestionConfig):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        in_memory: bool = False,
+        persist: bool = True,
+        velocity_features: bool = False,
+        velocity_store: VelocityStore | None = None,
+        snapshot_offset: int | None = None,
+    ) -> None:
+        """
+        :param in_memory: Hand the DataFrames to the next stages through the artifact
+            and persist them on a background thread.
+        :param persist: Whether an in-memory pipeline persists its artifacts at all.
+        :param velocity_features: Add the velocity of the source account to every
+            transaction and seed the online velocity store with the history.
+        :param velocity_store: Continue this store with the ingested transactions instead
+            of seeding a new one, implies `velocity_features`.
+        :param snapshot_offset: Rows of the database snapshot the model to update was
+            trained on: only the rows after them are read from the snapshot. Ingesting a
+            file keeps the offset as it is.
+        """
         super().__init__()
         logger.critical('%s %s %s', '>>>' * 10, self.__class__.__name__, '<<<' * 10)
         self.schema = DataSchema()
+        self.in_memory = in_memory
+        self.persist = persist or not in_memory
+        self.velocity_store = velocity_store
+        self.velocity_features = velocity_features or velocity_store is not None
+        self.snapshot_offset = snapshot_offset
+        self.snapshot_rows: int | None = None
 
     def _drop_extra_cols(self, df: pd.DataFrame) -> pd.DataFrame:
         # Check for extra columns in ingested dataset from database.
-        drop_cols = [col for col in df.columns.values if col not in self.schema.all_cols]
+        # Date columns are kept even if an earlier run already replaced them in the schema.
+        schema_cols = self.schema.all_cols + self.schema.date_cols
+        drop_cols = [col for col in df.columns.values if col not in schema_cols]
         if len(drop_cols) > 0:
             logger.info('We have extra column(s) in the ingested dataset from the base dataset.')
             df = df.drop(columns=drop_cols)
@@ -36,45 +80,311 @@ class DataIngestion(DataIngestionConfig):
 
     def _feature_extraction(self, df: pd.DataFrame) -> pd.DataFrame:
         """Feature extraction from DataFrame."""
-        df['month'] = df[self.schema.date_cols[0]].dt.month
+        df = df.assign(month=df[self.schema.date_cols[0]].dt.month)
         df = df.drop(columns=self.schema.date_cols)
 
-        self.schema.update_column(SchemaColumnType.ALL, 'month')
-        self.schema.remove_value_from_column(SchemaColumnType.ALL, self.schema.date_cols)
+        # `DataSchema` is a singleton, so keep this idempotent for repeated runs.
+        if 'month' not in self.schema.all_cols:
+            self.schema.update_column(SchemaColumnType.ALL, 'month')
+        date_cols = [col for col in self.schema.date_cols if col in self.schema.all_cols]
+        self.schema.remove_value_from_column(SchemaColumnType.ALL, date_cols)
 
         logger.info('Adding column: %s', ['month'])
         logger.info('Dropping column: %s', self.schema.date_cols)
         return df
 
-    def initiate(self, ingestion_data_path: Path | None = None) -> DataIngestionArtifact:
-        if ingestion_data_path is None:
+    def _add_velocity(self, df: pd.DataFrame) -> tuple[pd.DataFrame, VelocityStore]:
+        """
+        Velocity of every transaction from the ones before it, across train and test
+        like the online store sees them, and the store seeded with the whole history.
+        """
+        ids = df['sourceid'].to_numpy()
+        timestamps = df[self.schema.date_cols[0]].to_numpy()
+        amounts = df['amountofmoney'].to_numpy()
+        if self.velocity_store is not None:
+            return self._continue_velocity(df, ids, timestamps, amounts), self.velocity_store
+
+        features = history_features(df, self.velocity_windows, self.velocity_bucket_minutes)
+        columns = feature_columns(self.velocity_windows)
+        df = df.assign(**dict(zip(columns, features.T)))
+        store = VelocityStore.from_history(
+            ids,
+            timestamps,
+            amounts,
+            windows=self.velocity_windows,
+            bucket_minutes=self.velocity_bucket_minutes,
+            capacity=self.velocity_capacity,
+        )
+        logger.info('Adding column: %s', columns)
+        return df, store
+
+    def _continue_velocity(
+        self,
+        df: pd.DataFrame,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        amounts: np.ndarray,
+    ) -> pd.DataFrame:
+        """Velocity of new transactions from `velocity_store`, which they are added to."""
+        store = self.velocity_store
+        order = np.argsort(timestamps, kind='stable')
+        features = np.empty((len(df), len(store.columns)))
+        for start in range(0, len(order), store.capacity):
+            part = order[start : start + store.capacity]
+            features[part] = store.score(ids[part], timestamps[part], amounts[part])
+        logger.info('Adding column: %s', store.columns)
+        return df.assign(**dict(zip(store.columns, features.T)))
+
+    def _refresh_snapshot(self, rebuild: bool = True) -> bool:
+        """
+        Append the documents newer than the snapshot's `_id` high-water mark to the
+        snapshot as a new part.
+
+        ObjectIds of different writers are only ordered by their seconds, so the last
+        `snapshot_overlap_seconds` up to the mark are fetched again and the documents
+        already in the snapshot are dropped by `_id`. The snapshot is rebuilt when the
+        collection then holds another number of documents up to the mark (one arrived
+        later than the overlap, or was deleted), or documents with new columns.
+        Updates of documents already in the snapshot are not picked up, delete the
+        snapshot to rebuild it.
+
+        :returns: Whether the snapshot exists.
+        """
+        snapshot_exists = io.frame_exists(self.snapshot_dir)
+        attrs = io.load_frame_attrs(self.snapshot_dir) if snapshot_exists else {}
+        mark, recent_ids = attrs.get('high_water_mark'), set(attrs.get('recent_ids', []))
+        after_id = None
+        if mark is not None:
+            after_id = f'{max(_id_seconds(mark) - self.snapshot_overlap_seconds, 0):08x}'
+            after_id += '0' * 16
+        delta = from_mongodb_to_dataframe(after_id=after_id, with_id=True)
+        ids = delta['_id'].astype(str) if len(delta) else pd.Series([], dtype=str)
+        delta = delta[~ids.isin(recent_ids).to_numpy()]
+        logger.info('Fetched %s new document(s) after high-water mark %s.', len(delta), mark)
+
+        if len(delta) > 0:
+            delta = delta.drop(columns='_id')
+            # Columns without any value in this delta are not fetched at all, those are
+            # appended as missing, but new columns need all documents again.
+            if snapshot_exists and not set(delta.columns) <= set(
+                io.load_frame_columns(self.snapshot_dir)
+            ):
+                return self._rebuild_snapshot('documents with new columns', rebuild)
+            mark = max(ids.max(), mark or '')
+            recent_ids = [
+                _id
+                for _id in recent_ids.union(ids)
+                if _id_seconds(_id) >= _id_seconds(mark) - self.snapshot_overlap_seconds
+            ]
+            attrs = {'high_water_mark': mark, 'recent_ids': sorted(recent_ids)}
+            io.append_frame(delta, self.snapshot_dir, attrs)
+            snapshot_exists = True
+
+        if snapshot_exists:
+            expected = count_documents(up_to_id=mark)
+            rows = io.load_frame_rows(self.snapshot_dir)
+            if rows != expected:
+                reason = f'{expected} document(s) up to the mark in the snapshot of {rows}'
+                return self._rebuild_snapshot(reason, rebuild)
+        return snapshot_exists
+
+    def _rebuild_snapshot(self, reason: str, rebuild: bool) -> bool:
+        if not rebuild:
+            raise ValueError(f'Snapshot {self.snapshot_dir} out of sync: {reason}.')
+        logger.warning('Rebuilding snapshot %s: %s.', self.snapshot_dir, reason)
+        shutil.rmtree(self.snapshot_dir)
+        return self._refresh_snapshot(rebuild=False)
+
+    def _load_from_database(self) -> pd.DataFrame:
+        """Load the collection, through the local snapshot for incremental ingestion."""
+        if not self.incremental_ingestion:
+            self._check_no_snapshot_offset()
+            return from_mongodb_to_dataframe()
+        if not self._refresh_snapshot():
+            return pd.DataFrame()
+        df = io.load_frame(self.snapshot_dir)
+        self.snapshot_rows = len(df)
+        if self.snapshot_offset:
+            self._check_snapshot_offset()
+            logger.info('Skipping %s already ingested row(s).', self.snapshot_offset)
+            df = df.iloc[self.snapshot_offset :].reset_index(drop=True)
+        return df
+
+    def _check_no_snapshot_offset(self) -> None:
+        if self.snapshot_offset is not None:
+            raise ValueError(
+                'New rows of the database are only known through the snapshot, '
+                'set incremental_ingestion to update a model.'
+            )
+
+    def _check_snapshot_offset(self) -> None:
+        if self.snapshot_rows < self.snapshot_offset:
+            raise ValueError(
+                f'The snapshot has {self.snapshot_rows} row(s), fewer than the '
+                f'{self.snapshot_offset} the model was trained on. It was rebuilt since.'
+            )
+
+    def _load(self, ingestion_data_path: Path | None) -> pd.DataFrame:
+        if ingestion_data_path is not None:
+            logger.info('Reading "ingestion_data_path" parameter.')
+            return pd.read_csv(ingestion_data_path)
+        try:
+            return self._load_from_database()
+        except Exception:
+            logger.error('Error while importing data from database.')
+            logger.error(
+                'Please provide either "ingestion_data_path" or '
+                '"MONGODB_URL" to establish database connection.'
+            )
+            raise
+
+    def _iter_chunks(self, ingestion_data_path: Path | None) -> Iterator[pd.DataFrame]:
+        """Read the dataset in chunks of `chunksize` rows without loading all of it."""
+        if ingestion_data_path is not None:
+            logger.info('Streaming "ingestion_data_path" parameter.')
+            yield from pd.read_csv(ingestion_data_path, chunksize=self.chunksize)
+        elif self.incremental_ingestion:
             try:
-                df = from_mongodb_to_dataframe()
+                snapshot_exists = self._refresh_snapshot()
             except Exception:
                 logger.error('Error while importing data from database.')
-                logger.error(
-                    'Please provide either "ingestion_data_path" or '
-                    '"MONGODB_URL" to establish database connection.'
-                )
                 raise
+            if snapshot_exists:
+                self.snapshot_rows, skip = 0, self.snapshot_offset or 0
+                for chunk in io.iter_frame(self.snapshot_dir, self.chunksize):
+                    self.snapshot_rows += len(chunk)
+                    if skip >= len(chunk):
+                        skip -= len(chunk)
+                        continue
+                    yield chunk.iloc[skip:].reset_index(drop=True)
+                    skip = 0
+                if self.snapshot_offset:
+                    self._check_snapshot_offset()
         else:
-            logger.info('Reading "ingestion_data_path" parameter.')
-            df = pd.read_csv(ingestion_data_path)
+            self._check_no_snapshot_offset()
+            try:
+                yield from iter_mongodb_dataframes(self.chunksize)
+            except Exception:
+                logger.error('Error while importing data from database.')
+                raise
+
+    def _initiate_streaming(self, ingestion_data_path: Path | None) -> DataIngestionArtifact:
+        """
+        Ingest the dataset chunk by chunk: every chunk is written to the base, train and
+        test frames and folded into their validation statistics, so the validation stage
+        never has to read the data back.
+        """
+        rng = np.random.default_rng(42)
+        cat_cols = self.schema.cat_cols
+        date_cols = self.schema.date_cols
+        stats = {
+            'base_df': DatasetStats(cat_cols, date_cols, self.profile_sketch_size),
+            'train_df': DatasetStats(cat_cols, sketch_size=self.profile_sketch_size),
+            'test_df': DatasetStats(cat_cols, sketch_size=self.profile_sketch_size),
+        }
+        to_csv = partial(pd.DataFrame.to_csv, index=False)
+
+        n_chunks, test_rows = 0, []
+        for chunk in self._iter_chunks(ingestion_data_path):
+            first = n_chunks == 0
+            write_frame = io.dump_frame if first else io.append_frame
+
+            chunk = self._drop_extra_cols(chunk)
+            chunk = self._convert_to_datetime(chunk)
+            stats['base_df'].update(chunk)
+            write_frame(chunk, self.base_path)
 
+            chunk = self._feature_extraction(chunk)
+            is_test = rng.random(len(chunk)) < self.test_size
+            test_rows.append(stats['base_df'].rows - len(chunk) + np.flatnonzero(is_test))
+            for name, fp, csv_fp, part in (
+                ('train_df', self.train_path, self.train_csv_path, chunk[~is_test]),
+                ('test_df', self.test_path, self.test_csv_path, chunk[is_test]),
+            ):
+                part = part.reset_index(drop=True)
+                stats[name].update(part)
+                write_frame(part, fp)
+                if self.export_csv:
+                    to_csv(part, csv_fp, mode='w' if first else 'a', header=first)
+            n_chunks += 1
+
+        if n_chunks == 0:
+            raise ValueError('Ingested dataset is empty.')
+        logger.info('Ingested %s row(s) in %s chunk(s).', stats['base_df'].rows, n_chunks)
+        logger.info('Train df rows: %s', stats['train_df'].rows)
+        logger.info('Test df rows: %s', stats['test_df'].rows)
+        record_rows(stats['base_df'].rows, stats['train_df'].rows + stats['test_df'].rows)
+        io.dump_array(np.concatenate(test_rows), self.test_rows_path)
+
+        artifact = DataIngestionArtifact(
+            self.base_path,
+            self.train_path,
+            self.test_path,
+            test_rows_path=self.test_rows_path,
+            snapshot_rows=self.snapshot_rows,
+        )
+        artifact.validation_stats = stats
+        return artifact
+
+    @profiled('ingestion')
+    def initiate(self, ingestion_data_path: Path | None = None) -> DataIngestionArtifact:
+        # A file is not part of the snapshot, the snapshot rows trained on stay the same.
+        if ingestion_data_path is not None:
+            self.snapshot_rows = self.snapshot_offset
+        if self.chunksize is not None:
+            if self.velocity_features:
+                raise ValueError('Velocity features need the whole history, set chunksize to None.')
+            # Out-of-core: the frames are always written, DataFrames are never held in memory.
+            return self._initiate_streaming(ingestion_data_path)
+
+        df = self._load(ingestion_data_path)
+        # E.g. an empty collection, or no new rows of the snapshot to update a model with.
+        if len(df) == 0:
+            raise ValueError('Ingested dataset is empty.')
+        record_rows(rows_in=len(df))
         df = self._drop_extra_cols(df)
         df = self._convert_to_datetime(df)
+        base_df = df
+        store = None
+        if self.velocity_features:
+            df, store = self._add_velocity(df)
         df = self._feature_extraction(df)
 
         logger.info('Splitting the dataset into train_df and test_df and exporting it.')
-        train_df, test_df = train_test_split(df, test_size=self.test_size, random_state=42)
+        train_rows, test_rows = train_test_split(
+            np.arange(len(df)), test_size=self.test_size, random_state=42,
+        )
+        train_df = df.iloc[train_rows].reset_index(drop=True)
+        test_df = df.iloc[test_rows].reset_index(drop=True)
         logger.info('Train df shape: %s', train_df.shape)
         logger.info('Test df shape: %s', test_df.shape)
+        record_rows(rows_out=len(train_df) + len(test_df))
 
-        train_df.to_csv(self.train_path, index=False)
-        test_df.to_csv(self.test_path, index=False)
+        if self.persist:
+            background = self.in_memory
+            io.persist(io.dump_frame, base_df, self.base_path, background=background)
+            io.persist(io.dump_frame, train_df, self.train_path, background=background)
+            io.persist(io.dump_frame, test_df, self.test_path, background=background)
+            io.persist(io.dump_array, test_rows, self.test_rows_path, background=background)
+            if self.export_csv:
+                to_csv = partial(pd.DataFrame.to_csv, index=False)
+                io.persist(to_csv, train_df, self.train_csv_path, background=background)
+                io.persist(to_csv, test_df, self.test_csv_path, background=background)
+            if store is not None:
+                io.persist(io.dump_model, store, self.velocity_store_path, background=background)
 
-        return DataIngestionArtifact(
-            ingestion_data_path,
+        artifact = DataIngestionArtifact(
+            self.base_path,
             self.train_path,
             self.test_path,
+            test_rows_path=self.test_rows_path,
+            snapshot_rows=self.snapshot_rows,
         )
+        if store is not None:
+            artifact.velocity_store_path = self.velocity_store_path
+            artifact.extra_num_cols = store.columns
+        if self.in_memory:
+            artifact.base_df, artifact.train_df, artifact.test_df = base_df, train_df, test_df
+            artifact.velocity_store = store
+            artifact.test_rows = test_rows
+        return artifact
@@ -0,0 +1,241 @@
+"""
+Compact, mergeable reference profile of a dataset for drift checks.
+
+A profile holds a fixed-size quantile sketch per numeric column and a category
+frequency table per categorical column, plus the missing value counts. Profiles
+of two chunks of data can be merged, so a profile can be built chunk by chunk
+and drift checks never need the raw reference rows.
+"""
+
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+from scipy.stats import kstwo
+
+from src.components.data.drift import PVALUE_THRESHOLD, chi2_pvalue, is_categorical
+
+DEFAULT_SKETCH_SIZE = 2048
+
+
+class QuantileSketch:
+    def __init__(
+        self,
+        values: np.ndarray | None = None,
+        weights: np.ndarray | None = None,
+        size: int | None = DEFAULT_SKETCH_SIZE,
+    ) -> None:
+        """
+        Weighted points approximating a distribution with at most `size` points.
+
+        The CDF error is bounded by about `1 / size` per merge, `size=None` keeps every
+        value and is exact.
+        """
+        self.size = size
+        self.values = np.empty(0) if values is None else np.asarray(values, dtype=np.float64)
+        self.weights = np.ones(len(self.values)) if weights is None else np.asarray(weights)
+        self._compress()
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum())
+
+    def _compress(self) -> None:
+        order = np.argsort(self.values, kind='stable')
+        self.values, self.weights = self.values[order], self.weights[order]
+        if self.size is None or len(self.values) <= self.size:
+            return
+
+        # Keep the values at `size` evenly spaced ranks, each one carrying an equal weight.
+        cum_weights = np.cumsum(self.weights)
+        total = cum_weights[-1]
+        ranks = (np.arange(self.size) + 0.5) * total / self.size
+        self.values = self.values[np.searchsorted(cum_weights, ranks)]
+        self.weights = np.full(self.size, total / self.size)
+
+    def update(self, values: np.ndarray) -> None:
+        self.merge(QuantileSketch(values, size=None))
+
+    def merge(self, other: 'QuantileSketch') -> None:
+        self.values = np.concatenate([self.values, other.values])
+        self.weights = np.concatenate([self.weights, other.weights])
+        self._compress()
+
+    def cdf(self, x: np.ndarray) -> np.ndarray:
+        cum_weights = np.concatenate([[0.0], np.cumsum(self.weights)])
+        return cum_weights[np.searchsorted(self.values, x, side='right')] / self.count
+
+    def ks_pvalue(self, other: 'QuantileSketch') -> float:
+        """Asymptotic two-sided KS p-value between two sketches."""
+        n1, n2 = self.count, other.count
+        if n1 == 0 or n2 == 0:
+            return float('nan')
+        grid = np.concatenate([self.values, other.values])
+        d = float(np.max(np.abs(self.cdf(grid) - other.cdf(grid))))
+        return float(kstwo.sf(d, np.round(n1 * n2 / (n1 + n2))))
+
+    def to_dict(self) -> dict:
+        return {
+            'size': self.size,
+            'values': self.values.tolist(),
+            'weights': self.weights.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'QuantileSketch':
+        return cls(np.array(d['values']), np.array(d['weights']), d['size'])
+
+
+class ColumnProfile:
+    def __init__(self, categorical: bool, sketch_size: int | None = DEFAULT_SKETCH_SIZE) -> None:
+        self.categorical = categorical
+        self.rows = 0
+        self.missing = 0
+        self.counts: pd.Series = pd.Series(dtype=np.float64)
+        self.sketch = QuantileSketch(size=sketch_size)
+
+    def update(self, series: pd.Series) -> None:
+        self.rows += len(series)
+        values = series.dropna()
+        self.missing += len(series) - len(values)
+        if self.categorical:
+            counts = values.astype(str).value_counts()
+            self.counts = self.counts.add(counts, fill_value=0)
+        else:
+            self.sketch.update(values.to_numpy(dtype=np.float64))
+
+    def merge(self, other: 'ColumnProfile') -> None:
+        self.rows += other.rows
+        self.missing += other.missing
+        self.counts = self.counts.add(other.counts, fill_value=0)
+        self.sketch.merge(other.sketch)
+
+    def pvalue(self, other: 'ColumnProfile') -> float:
+        if self.categorical:
+            return chi2_pvalue(self.counts, other.counts)
+        return self.sketch.ks_pvalue(other.sketch)
+
+    def to_dict(self) -> dict:
+        d = {'categorical': self.categorical, 'rows': self.rows, 'missing': self.missing}
+        if self.categorical:
+            d['counts'] = {str(k): float(v) for k, v in self.counts.items()}
+        else:
+            d['sketch'] = self.sketch.to_dict()
+        return d
+
+    @classmethod
+    def from_dict(cls, d: dict) -> 'ColumnProfile':
+        profile = cls(d['categorical'])
+        profile.rows, profile.missing = d['rows'], d['missing']
+        if profile.categorical:
+            profile.counts = pd.Series(d['counts'], dtype=np.float64)
+        else:
+            profile.sketch = QuantileSketch.from_dict(d['sketch'])
+        return profile
+
+
+class ReferenceProfile:
+    def __init__(self, columns: dict[str, ColumnProfile] | None = None) -> None:
+        self.columns = columns or {}
+
+    @classmethod
+    def from_frame(
+        cls,
+        df: pd.DataFrame,
+        columns: list[str],
+        cat_cols: list[str],
+        sketch_size: int | None = DEFAULT_SKETCH_SIZE,
+    ) -> 'ReferenceProfile':
+        """Profile of `columns` of `df`, `sketch_size=None` keeps numeric columns exact."""
+        profile = cls(
+            {
+                col: ColumnProfile(is_categorical(df[col], cat_cols), sketch_size)
+                for col in columns
+                if col in df.columns
+            }
+        )
+        profile.update(df)
+        return profile
+
+    @property
+    def rows(self) -> int:
+        return max((col.rows for col in self.columns.values()), default=0)
+
+    def update(self, df: pd.DataFrame) -> None:
+        for col, col_profile in self.columns.items():
+            if col in df.columns:
+                col_profile.update(df[col])
+
+    def merge(self, other: 'ReferenceProfile') -> None:
+        for col, col_profile in other.columns.items():
+            if col in self.columns:
+                self.columns[col].merge(col_profile)
+            else:
+                self.columns[col] = col_profile
+
+    def missing_cols(self, threshold: float) -> list[str]:
+        """Columns whose ratio of missing values is above `threshold`."""
+        return [
+            col for col, p in self.columns.items() if p.rows and p.missing / p.rows > threshold
+        ]
+
+    def drift_report(self, other: 'ReferenceProfile', columns: list[str]) -> dict[str, dict]:
+        """Drift of `other` against this (reference) profile for each of `columns`."""
+        report = {}
+        for col in columns:
+            pvalue = self.columns[col].pvalue(other.columns[col])
+            report[col] = {
+                'pvalue': round(pvalue, 3),
+                'same_distribution': pvalue > PVALUE_THRESHOLD,
+            }
+        return report
+
+    def dump(self, fp: Path) -> None:
+        with open(fp, 'w') as f:
+            json.dump({col: p.to_dict() for col, p in self.columns.items()}, f)
+
+    @classmethod
+    def load(cls, fp: Path) -> 'ReferenceProfile':
+        with open(fp) as f:
+            return cls({col: ColumnProfile.from_dict(d) for col, d in json.load(f).items()})
+
+
+class DatasetStats:
+    def __init__(
+        self,
+        cat_cols: list[str],
+        exclude_cols: list[str] | None = None,
+        sketch_size: int | None = DEFAULT_SKETCH_SIZE,
+    ) -> None:
+        """
+        Validation statistics of a dataset accumulated chunk by chunk: row count, missing
+        values per column and a profile of every column except `exclude_cols`.
+        """
+        self.cat_cols = cat_cols
+        self.exclude_cols = exclude_cols or []
+        self.sketch_size = sketch_size
+        self.rows = 0
+        self.missing = pd.Series(dtype=np.float64)
+        self.profile: ReferenceProfile | None = None
+
+    @property
+    def columns(self) -> list[str]:
+        return list(self.missing.index)
+
+    def update(self, chunk: pd.DataFrame) -> None:
+        self.rows += len(chunk)
+        self.missing = self.missing.add(chunk.isna().sum(), fill_value=0)
+        if self.profile is None:
+            columns = [col for col in chunk.columns if col not in self.exclude_cols]
+            self.profile = ReferenceProfile.from_frame(
+                chunk, columns, self.cat_cols, self.sketch_size,
+            )
+        else:
+            self.profile.update(chunk)
+
+    def missing_cols(self, threshold: float) -> list[str]:
+        if self.rows == 0:
+            return []
+        ratio = self.missing / self.rows
+        return list(ratio[ratio > threshold].index)
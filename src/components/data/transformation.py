@@ -1,10 +1,11 @@
-import numpy as np
-import pandas as pd
+from typing import Any
+
 from sklearn.compose import ColumnTransformer
 from sklearn.pipeline import Pipeline
 from sklearn.preprocessing import LabelEncoder, OneHotEncoder, StandardScaler
 
 from src.core import get_logger, io
+from src.core.metrics import profiled, record_rows
 from src.database.schema import DataSchema
 from src.entity.artifact import DataIngestionArtifact, DataTransformationArtifact
 from src.entity.config import DataTransformationConfig
@@ -13,27 +14,46 @@ logger = get_logger(__name__)
 
 
 class DataTransformation(DataTransformationConfig):
-    def __init__(self, ingestion_artifact: DataIngestionArtifact):
+    def __init__(
+        self,
+        ingestion_artifact: DataIngestionArtifact,
+        in_memory: bool = False,
+        persist: bool = True,
+        transformer: Any = None,
+        target_enc: Any = None,
+    ):
+        """
+        :param transformer, target_enc: Fitted objects to transform with instead of
+            fitting new ones, like the current model's for an incremental update.
+        """
         super().__init__()
         logger.critical("%s %s %s", ">>>" * 10, self.__class__.__name__, "<<<" * 10)
         self.ingestion = ingestion_artifact
         self.schema = DataSchema()
+        self.in_memory = in_memory
+        self.persist = persist or not in_memory
+        self.transformer = transformer
+        self.target_enc = target_enc
 
     def get_transformer_object(self):
         num_pipe = Pipeline([("scaler", StandardScaler())])
         obj_pipe = Pipeline([("encoder", OneHotEncoder(drop="first"))])
         preprocessor = ColumnTransformer(
             [
-                ("num_pipe", num_pipe, self.schema.num_cols),
+                ("num_pipe", num_pipe, self.schema.num_cols + self.ingestion.extra_num_cols),
                 ("obj_pipe", obj_pipe, self.schema.cat_cols),
             ]
         )
         return preprocessor
 
+    @profiled("transformation")
     def initiate(self) -> DataTransformationArtifact:
         # Reading training and testing file
-        train_df = pd.read_csv(self.train_path)
-        test_df = pd.read_csv(self.test_path)
+        train_df = self.ingestion.train_df
+        test_df = self.ingestion.test_df
+        if train_df is None or test_df is None:
+            train_df = io.load_frame(self.ingestion.train_path, mmap=True)
+            test_df = io.load_frame(self.ingestion.test_path, mmap=True)
 
         # Selecting input feature from train and test data
         X_train_df = train_df.drop(columns=[self.schema.target_name])
@@ -44,30 +64,45 @@ class DataTransformation(DataTransformationConfig):
         y_test_df = test_df[self.schema.target_name]
 
         # Transformation on target columns
-        target_enc = LabelEncoder()
-        y_train_arr = target_enc.fit_transform(y_train_df)
-        y_test_arr = target_enc.transform(y_test_df)
-
-        preprocessor = self.get_transformer_object()
-        preprocessor.fit(X_train_df)
+        target_enc = self.target_enc
+        if target_enc is None:
+            target_enc = LabelEncoder().fit(y_train_df)
+        y_train_arr = target_enc.transform(y_train_df).astype(self.target_dtype)
+        y_test_arr = target_enc.transform(y_test_df).astype(self.target_dtype)
 
-        # Transforming input features
-        X_train_arr = preprocessor.transform(X_train_df)
-        X_test_arr = preprocessor.transform(X_test_df)
+        # A given transformer is not refitted: the trees of the model it was fitted
+        # with split on its scaled values.
+        preprocessor = self.transformer
+        if preprocessor is None:
+            preprocessor = self.get_transformer_object()
+            preprocessor.fit(X_train_df)
 
-        train_arr = np.c_[X_train_arr, y_train_arr]
-        test_arr = np.c_[X_test_arr, y_test_arr]
+        # Transforming input features, sparse output (if any) stays sparse
+        X_train_arr = preprocessor.transform(X_train_df).astype(self.feature_dtype)
+        X_test_arr = preprocessor.transform(X_test_df).astype(self.feature_dtype)
+        record_rows(len(train_df) + len(test_df), X_train_arr.shape[0] + X_test_arr.shape[0])
 
         # Objects dumping
-        io.dump_array(train_arr, self.train_arr_path)
-        io.dump_array(test_arr, self.test_arr_path)
+        if self.persist:
+            background = self.in_memory
+            io.persist(io.dump_array, X_train_arr, self.X_train_path, background=background)
+            io.persist(io.dump_array, y_train_arr, self.y_train_path, background=background)
+            io.persist(io.dump_array, X_test_arr, self.X_test_path, background=background)
+            io.persist(io.dump_array, y_test_arr, self.y_test_path, background=background)
 
-        io.dump_model(preprocessor, self.transformer_path)
-        io.dump_model(target_enc, self.target_enc_path)
+            io.persist(io.dump_model, preprocessor, self.transformer_path, background=background)
+            io.persist(io.dump_model, target_enc, self.target_enc_path, background=background)
 
-        return DataTransformationArtifact(
+        artifact = DataTransformationArtifact(
             self.transformer_path,
             self.target_enc_path,
-            self.train_arr_path,
-            self.test_arr_path,
+            self.X_train_path,
+            self.y_train_path,
+            self.X_test_path,
+            self.y_test_path,
         )
+        if self.in_memory:
+            artifact.transformer, artifact.target_enc = preprocessor, target_enc
+            artifact.X_train, artifact.y_train = X_train_arr, y_train_arr
+            artifact.X_test, artifact.y_test = X_test_arr, y_test_arr
+        return artifact
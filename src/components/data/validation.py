@@ -1,26 +1,33 @@
 import json
 from warnings import warn
 
-import pandas as pd
 from pandas import DataFrame
-from scipy.stats import ks_2samp
 
-from src.core import get_logger
+from src.components.data import drift
+from src.components.data.profile import DatasetStats, ReferenceProfile
+from src.core import get_logger, io
+from src.core.metrics import profiled, record_rows
 from src.database.schema import DataSchema
 from src.entity.artifact import DataIngestionArtifact, DataValidationArtifact
 from src.entity.config import DataValidationConfig
+from src.entity.saved_model import SavedModelConfig
 
 logger = get_logger(__name__)
 
 
 class DataValidation(DataValidationConfig):
-    def __init__(self, ingestion_artifact: DataIngestionArtifact):
+    def __init__(self, ingestion_artifact: DataIngestionArtifact, merge_reference: bool = False):
         """
         Initiate validation process between base, train and test dataset.
+
+        :param merge_reference: The base dataset only holds rows added since the latest
+            model, so its profile is merged into the saved reference profile instead of
+            replacing it, see `_reference_profiles`.
         """
         super().__init__()
         logger.critical('%s %s %s', '>>>' * 10, self.__class__.__name__, '<<<' * 10)
         self.ingestion_artifact = ingestion_artifact
+        self.merge_reference = merge_reference
         self.schema = DataSchema()
         self.validation_report = {}
 
@@ -69,83 +76,216 @@ class DataValidation(DataValidationConfig):
             return False
         return True
 
-    def _data_drift(
-        self,
-        base_df: DataFrame,
-        curr_df: DataFrame,
-        dataset_type: str,
-    ) -> None:
-        report_name = 'data_drift_within_' + dataset_type
-        drift_report = {}
+    def _drift_columns(self, available_cols, dataset_types) -> list[str]:
+        """Schema columns available in the base, warning about the other ones."""
+        columns = []
         for base_col in self.schema.all_cols:
-            try:
-                base_data = base_df[base_col]
-            except KeyError:
+            if base_col in available_cols:
+                columns.append(base_col)
+                continue
+            for dataset_type in dataset_types:
                 msg = (
                     f'"{base_col}" is not a column in {dataset_type}. '
                     f'Maybe "{base_col}" is a new column in schema.'
                 )
                 logger.error(msg)
                 warn(msg, FutureWarning)
-                continue
-            curr_data = curr_df[base_col]
+        return columns
+
+    def _data_drift(
+        self,
+        base_df: DataFrame,
+        curr_dfs: dict[str, DataFrame],
+    ) -> None:
+        """Drift of every current dataset against the base, each base column is prepared once."""
+        columns = self._drift_columns(base_df.columns, curr_dfs)
+        reports = drift.data_drift(
+            base_df,
+            curr_dfs,
+            columns,
+            self.schema.cat_cols,
+            n_jobs=self.drift_n_jobs,
+            parallel_min_rows=self.drift_parallel_min_rows,
+        )
+        for dataset_type, drift_report in reports.items():
+            self.validation_report['data_drift_within_' + dataset_type] = drift_report
+
+    def _profile_drift(
+        self,
+        reference: ReferenceProfile,
+        curr_dfs: dict[str, DataFrame],
+    ) -> None:
+        """Drift of every current dataset against the reference profile of the base."""
+        columns = self._drift_columns(reference.columns, curr_dfs)
+        for dataset_type, curr_df in curr_dfs.items():
+            curr = ReferenceProfile.from_frame(
+                curr_df, columns, self.schema.cat_cols, sketch_size=None,
+            )
+            drift_report = reference.drift_report(curr, columns)
+            self.validation_report['data_drift_within_' + dataset_type] = drift_report
+
+    def _load_base_df(self) -> DataFrame:
+        logger.info('Reading base dataset.')
+        base_df = self.ingestion_artifact.base_df
+        if base_df is None:
+            if self.ingestion_artifact.base_data_path is None:
+                raise ValueError('base_data_path must not None.')
+            base_df = io.load_frame(self.ingestion_artifact.base_data_path, mmap=True)
+        return base_df
+
+    def _reference_profiles(
+        self,
+        base_profile: ReferenceProfile,
+    ) -> tuple[ReferenceProfile, ReferenceProfile]:
+        """
+        Profile to measure drift against, and profile to save with the new model.
+
+        Drift is measured against the profile saved with the latest model, if any. The
+        new model is saved with the profile of its base dataset, merged into the saved
+        one with `merge_reference`.
+        """
+        saved_profile_path = SavedModelConfig().latest_profile_path
+        if saved_profile_path is None:
+            return base_profile, base_profile
+        logger.info('Using reference profile %s.', saved_profile_path)
+        reference = ReferenceProfile.load(saved_profile_path)
+        if not self.merge_reference:
+            return reference, base_profile
+        merged = ReferenceProfile.load(saved_profile_path)
+        merged.merge(base_profile)
+        return reference, merged
+
+    def _validate_from_stats(self, stats: dict[str, DatasetStats]) -> ReferenceProfile:
+        """
+        Fill the report from statistics accumulated while ingesting, without any data.
+
+        :returns: Profile to save with the new model.
+        """
+        for dataset_type, dataset_stats in stats.items():
+            missing_cols = dataset_stats.missing_cols(self.missing_threshold)
+            self.validation_report['missing_values_within_' + dataset_type] = missing_cols
 
-            logger.info('Hypothesis "%s": %s, %s', base_col, base_data.dtype, curr_data.dtype)
-            distribution = ks_2samp(base_data, curr_data)
-            pvalue = float(distribution.pvalue)  # type: ignore
+        reference, new_reference = self._reference_profiles(
+            stats['base_df'].profile or ReferenceProfile()
+        )
+
+        drift_log_msg = 'All columns are available in %s. Hence calculating data drift.'
+        curr_profiles = {}
+        for dataset_type in ('train_df', 'test_df'):
+            dataset_stats = stats[dataset_type]
+            columns_df = DataFrame(columns=dataset_stats.columns)
+            if self._is_required_cols_exists(columns_df, dataset_type):
+                logger.info(drift_log_msg % dataset_type)
+                curr_profiles[dataset_type] = dataset_stats.profile or ReferenceProfile()
 
-            if pvalue > 0.05:
-                drift_report[base_col] = {'pvalue': round(pvalue, 3), 'same_distribution': True}
-            else:
-                drift_report[base_col] = {'pvalue': round(pvalue, 3), 'same_distribution': False}
-        self.validation_report[report_name] = drift_report
+        columns = self._drift_columns(reference.columns, curr_profiles)
+        for dataset_type, curr_profile in curr_profiles.items():
+            drift_report = reference.drift_report(curr_profile, columns)
+            self.validation_report['data_drift_within_' + dataset_type] = drift_report
+        return new_reference
 
+    def _carried_fields(self) -> dict:
+        """Fields of the ingestion artifact the later stages need as they are."""
+        artifact = self.ingestion_artifact
+        return {
+            'velocity_store_path': artifact.velocity_store_path,
+            'velocity_store': artifact.velocity_store,
+            'test_rows_path': artifact.test_rows_path,
+            'test_rows': artifact.test_rows,
+            'snapshot_rows': artifact.snapshot_rows,
+            'extra_num_cols': artifact.extra_num_cols,
+        }
+
+    @profiled('validation')
     def initiate(self) -> DataValidationArtifact:
+        if self.ingestion_artifact.validation_stats is not None:
+            logger.info('Using validation statistics collected during ingestion.')
+            stats = self.ingestion_artifact.validation_stats
+            rows = stats['train_df'].rows + stats['test_df'].rows
+            record_rows(rows_in=rows, rows_out=rows)
+            self._validate_from_stats(stats).dump(self.profile_path)
+            json.dump(self.validation_report, open(self.drift_report_path, 'w'), indent=2)
+            return DataValidationArtifact(
+                self.ingestion_artifact.base_data_path,
+                self.ingestion_artifact.train_path,
+                self.ingestion_artifact.test_path,
+                self.drift_report_path,
+                self.profile_path,
+                **self._carried_fields(),
+            )
+
         # --- --- Base Dataset --- --- #
-        logger.info('Reading base dataset.')
-        if self.ingestion_artifact.base_data_path is None:
-            raise ValueError('base_data_path must not None.')
-        base_df = pd.read_csv(self.ingestion_artifact.base_data_path)
-        base_df = self._drop_missing_values_cols(base_df, 'base_df')
+        reference = None
+        if self.use_reference_profile:
+            logger.info('Building reference profile from base dataset.')
+            base_profile = ReferenceProfile.from_frame(
+                self._load_base_df(),
+                self.schema.all_cols,
+                self.schema.cat_cols,
+                self.profile_sketch_size,
+            )
+            reference, new_reference = self._reference_profiles(base_profile)
+            new_reference.dump(self.profile_path)
+            base_missing_cols = base_profile.missing_cols(self.missing_threshold)
+            self.validation_report['missing_values_within_base_df'] = base_missing_cols
+        else:
+            base_df = self._drop_missing_values_cols(self._load_base_df(), 'base_df')
+            if base_df is None:
+                raise ValueError('Base Dataset cannot be None.')
 
         # --- --- Train dataset --- --- #
         logger.info('Reading train dataset.')
-        train_df = pd.read_csv(self.train_path)
+        train_df = self.ingestion_artifact.train_df
+        if train_df is None:
+            train_df = io.load_frame(self.ingestion_artifact.train_path, mmap=True)
         train_df = self._drop_missing_values_cols(train_df, 'train_df')
 
         # --- --- Test Dataset --- --- #
         logger.info('Reading test dataset.')
-        test_df = pd.read_csv(self.test_path)
+        test_df = self.ingestion_artifact.test_df
+        if test_df is None:
+            test_df = io.load_frame(self.ingestion_artifact.test_path, mmap=True)
         test_df = self._drop_missing_values_cols(test_df, 'test_df')
 
         # --- --- Check datasets exists --- --- #
-        if base_df is None:
-            raise ValueError('Base Dataset cannot be None.')
         if train_df is None:
             raise ValueError('Train Dataset cannot be None.')
         if test_df is None:
             raise ValueError('Test Dataset cannot be None.')
+        rows = len(train_df) + len(test_df)
+        record_rows(rows_in=rows, rows_out=rows)
 
         # --- --- Checking Data Drift --- --- #
         drift_log_msg = 'All columns are available in %s. Hence calculating data drift.'
+        curr_dfs = {}
 
         # --- --- Train Dataset --- --- #
         train_df_cols_status = self._is_required_cols_exists(train_df, 'train_df')
         if train_df_cols_status:
             logger.info(drift_log_msg % 'train_df')
-            self._data_drift(base_df, train_df, 'train_df')
+            curr_dfs['train_df'] = train_df
 
         # --- --- Test Dataset --- --- #
         test_df_cols_status = self._is_required_cols_exists(test_df, 'test_df')
         if test_df_cols_status:
             logger.info(drift_log_msg % 'test_df')
-            self._data_drift(base_df, test_df, 'test_df')
+            curr_dfs['test_df'] = test_df
+
+        if curr_dfs and reference is not None:
+            self._profile_drift(reference, curr_dfs)
+        elif curr_dfs:
+            self._data_drift(base_df, curr_dfs)
 
         json.dump(self.validation_report, open(self.drift_report_path, 'w'), indent=2)
 
         return DataValidationArtifact(
             self.ingestion_artifact.base_data_path,
-            self.train_path,
-            self.test_path,
+            self.ingestion_artifact.train_path,
+            self.ingestion_artifact.test_path,
             self.drift_report_path,
+            self.profile_path if reference is not None else None,
+            base_df=self.ingestion_artifact.base_df,
+            train_df=self.ingestion_artifact.train_df,
+            test_df=self.ingestion_artifact.test_df,
+            **self._carried_fields(),
         )
@@ -1 +1 @@
-from . import evaluation, trainer
+from . import benchmark, evaluation, incremental, trainer
@@ -0,0 +1,87 @@
+"""
+Serving cost of a fitted model and transformer, measured on the test set.
+
+- Batch throughput: rows per second of `transform` + `predict` over the whole set.
+- Single-row latency: p50/p99 of `transform` + `predict` on one-row frames.
+- Serialized size: bytes written by `src.core.io.dump_model`.
+- Resident memory: bytes allocated to hold both objects once loaded.
+"""
+
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from src.core import get_logger, io
+from src.entity.artifact import ModelBenchmark
+
+logger = get_logger(__name__)
+
+
+def _batch_rows_per_sec(model, transformer, X: pd.DataFrame, repeats: int) -> float:
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        model.predict(transformer.transform(X))
+        best = min(best, time.perf_counter() - start)
+    return len(X) / best
+
+
+def _single_row_latencies_ms(model, transformer, X: pd.DataFrame, n_rows: int) -> np.ndarray:
+    rows = X.sample(min(n_rows, len(X)), random_state=42)
+    latencies = np.empty(len(rows))
+    for i in range(len(rows)):
+        row = rows.iloc[[i]]
+        start = time.perf_counter()
+        model.predict(transformer.transform(row))
+        latencies[i] = time.perf_counter() - start
+    return latencies * 1000
+
+
+def _tree_bytes(model) -> int:
+    """Node and value buffers of fitted trees, allocated outside of tracemalloc's view."""
+    from sklearn.tree._tree import NODE_DTYPE
+
+    total = 0
+    for estimator in getattr(model, 'estimators_', [model]):
+        tree = getattr(estimator, 'tree_', None)
+        if tree is not None:
+            total += tree.node_count * NODE_DTYPE.itemsize + tree.value.nbytes
+    return total
+
+
+def _resident_bytes(*objects) -> int:
+    """Memory allocated by loading `objects` back from their serialized form."""
+    blobs = [io.dumps_model(obj) for obj in objects]
+    tracemalloc.start()
+    try:
+        loaded = [io.loads_model(blob) for blob in blobs]
+        resident, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return resident + sum(_tree_bytes(obj) for obj in loaded)
+
+
+def benchmark_model(
+    model,
+    transformer,
+    test_df: pd.DataFrame,
+    n_single_rows: int = 200,
+    repeats: int = 3,
+) -> ModelBenchmark:
+    """
+    :param n_single_rows: Number of test rows scored one by one for the latency percentiles.
+    :param repeats: Number of batch runs, the fastest one is kept.
+    """
+    X = test_df[transformer.feature_names_in_]
+    latencies = _single_row_latencies_ms(model, transformer, X, n_single_rows)
+    result = ModelBenchmark(
+        batch_rows_per_sec=_batch_rows_per_sec(model, transformer, X, repeats),
+        latency_p50_ms=float(np.percentile(latencies, 50)),
+        latency_p99_ms=float(np.percentile(latencies, 99)),
+        size_bytes=len(io.dumps_model(model)) + len(io.dumps_model(transformer)),
+        memory_bytes=_resident_bytes(model, transformer),
+    )
+    logger.info('Benchmark: %s', result)
+    return result
@@ -1,20 +1,32 @@
+import json
+import os
+import tempfile
+from dataclasses import asdict
 from pathlib import Path
 from typing import Any
 from warnings import warn
 
-import pandas as pd
+import numpy as np
+from pandas import DataFrame
 from sklearn.metrics import accuracy_score
 
+from src.components.model.benchmark import benchmark_model
 from src.core import get_logger, io
+from src.core.metrics import profiled, record_rows
 from src.database.schema import DataSchema
 from src.entity.artifact import (
-    DataIngestionArtifact,
     DataTransformationArtifact,
+    DataValidationArtifact,
+    ModelBenchmark,
     ModelEvaluationArtifact,
     ModelTrainerArtifact,
 )
 from src.entity.config import ModelEvaluationConfig
 from src.entity.saved_model import SavedModelConfig
+from src.serving.bundle import Bundle, write_bundle
+from src.serving.compiled import compile_models
+from src.serving.features import AccountFeatures
+from src.serving.velocity import VelocityStore, history_features
 
 logger = get_logger(__name__)
 
@@ -22,18 +34,18 @@ logger = get_logger(__name__)
 class ModelEvaluation(ModelEvaluationConfig):
     def __init__(
         self,
-        ingestion_artifact: DataIngestionArtifact,
+        validation_artifact: DataValidationArtifact,
         transformation_artifact: DataTransformationArtifact,
         trainer_artifact: ModelTrainerArtifact,
     ) -> None:
         super().__init__()
         logger.critical('%s %s %s', '>>>' * 10, self.__class__.__name__, '<<<' * 10)
 
-        self.ingestion_artifact = ingestion_artifact
+        self.validation_artifact = validation_artifact
         self.schema = DataSchema()
         self.transformer_artifact = transformation_artifact
         self.trainer_artifact = trainer_artifact
-        self.saved_models = SavedModelConfig()
+        self.saved_models = SavedModelConfig(self.keep_saved_versions)
 
     def __load_saved_objects(
         self,
@@ -44,68 +56,253 @@ class ModelEvaluation(ModelEvaluationConfig):
         transformer = io.load_model(transformer_fp)
         return model, transformer
 
-    def __copy_to_path(self, from_: Path, to: Path) -> None:
-        with open(from_, 'rb') as f:
-            with open(to, 'wb') as x:
-                x.write(f.read())
+    def __publish_models(self) -> None:
+        """Publish the new model, transformer and target encoder as the current version."""
+        sources = {
+            'model.pkl': (self.trainer_artifact.model_path, self.trainer_artifact.model),
+            'transformer.pkl': (
+                self.transformer_artifact.transformer_path,
+                self.transformer_artifact.transformer,
+            ),
+            'target_encoder.pkl': (
+                self.transformer_artifact.target_enc_path,
+                self.transformer_artifact.target_enc,
+            ),
+        }
+        with tempfile.TemporaryDirectory(dir=self.saved_models.dir) as staging:
+            files, objects = {}, []
+            for name, (path, obj) in sources.items():
+                # In-memory pipelines may not have persisted the artifact (yet).
+                if obj is not None:
+                    objects.append(obj)
+                    path = Path(staging, name)
+                    io.dump_model(obj, path)
+                else:
+                    objects.append(io.load_model(path))
+                files[name] = path
 
-    def __dump_models_into_saved_models_dir(self) -> None:
-        from_paths = [
-            self.trainer_artifact.model_path,
-            self.transformer_artifact.transformer_path,
-            self.transformer_artifact.target_enc_path,
+            # The same trio as a single memory-mappable file for the scoring processes.
+            files['bundle.bin'] = Path(staging, 'bundle.bin')
+            write_bundle(
+                files['bundle.bin'],
+                *objects,
+                compile_models(*objects),
+                self._account_features(),
+                self._velocity_store(),
+            )
+
+            # The reference profile of the base data is kept next to the model it validated.
+            if self.validation_artifact.profile_path is not None:
+                files['reference_profile.json'] = self.validation_artifact.profile_path
+
+            # Where the next incremental run picks up, see `load_champion`.
+            files['training_state.json'] = Path(staging, 'training_state.json')
+            files['training_state.json'].write_text(
+                json.dumps({'snapshot_rows': self.validation_artifact.snapshot_rows})
+            )
+
+            self.saved_models.publish(files)
+
+    def _account_features(self) -> AccountFeatures | None:
+        """Account features the new model was trained with, if any."""
+        features = self.validation_artifact.account_features
+        path = self.validation_artifact.account_features_path
+        if features is None and path is not None:
+            features = AccountFeatures.from_frame(io.load_frame(path))
+        return features
+
+    def _velocity_store(self) -> VelocityStore | None:
+        """Velocity store seeded with the history the new model was trained on, if any."""
+        store = self.validation_artifact.velocity_store
+        path = self.validation_artifact.velocity_store_path
+        if store is None and path is not None:
+            store = io.load_model(path)
+        return store
+
+    def _champion_features(self, test_df: DataFrame, bundle: Bundle) -> DataFrame:
+        """
+        `test_df` with the features the saved model was trained with: its own account
+        features, and its velocity over the ingested history if the new model has none.
+        """
+        features = bundle.account_features()
+        if features is not None:
+            test_df = features.join(test_df)
+        store = bundle.velocity_store()
+        if store is not None and not set(store.columns) <= set(test_df.columns):
+            logger.info('Computing velocity features of the saved model.')
+            velocity = history_features(
+                self._load_base_df(), store.windows, store.bucket_minutes,
+            )
+            test_rows = self.validation_artifact.test_rows
+            if test_rows is None:
+                test_rows = io.load_array(self.validation_artifact.test_rows_path)
+            test_df = test_df.assign(**dict(zip(store.columns, velocity[test_rows].T)))
+        return test_df
+
+    def _load_base_df(self) -> DataFrame:
+        base_df = self.validation_artifact.base_df
+        if base_df is None:
+            base_df = io.load_frame(self.validation_artifact.base_data_path, mmap=True)
+        return base_df
+
+    def _benchmark(self, model, transformer, test_df) -> ModelBenchmark:
+        return benchmark_model(
+            model,
+            transformer,
+            test_df,
+            n_single_rows=self.benchmark_single_rows,
+            repeats=self.benchmark_repeats,
+        )
+
+    def _budget_violations(
+        self,
+        challenger: ModelBenchmark,
+        champion: ModelBenchmark | None,
+    ) -> list[str]:
+        """Budgets exceeded by the challenger, ratio budgets only apply with a champion."""
+        mb = 1024 * 1024
+        checks = [
+            ('max_latency_p99_ms', challenger.latency_p99_ms, self.max_latency_p99_ms),
+            ('max_size_mb', challenger.size_bytes / mb, self.max_size_mb),
+            ('max_memory_mb', challenger.memory_bytes / mb, self.max_memory_mb),
         ]
-        to_paths = [
-            self.saved_models.path_to_save_model,
-            self.saved_models.path_to_save_transformer,
-            self.saved_models.path_to_save_target_enc,
+        if champion is not None:
+            checks += [
+                (
+                    'max_latency_ratio',
+                    challenger.latency_p99_ms / champion.latency_p99_ms,
+                    self.max_latency_ratio,
+                ),
+                (
+                    'max_size_ratio',
+                    challenger.size_bytes / champion.size_bytes,
+                    self.max_size_ratio,
+                ),
+                (
+                    'max_memory_ratio',
+                    challenger.memory_bytes / champion.memory_bytes,
+                    self.max_memory_ratio,
+                ),
+            ]
+
+        violations = [
+            f'{name}: {value:.3f} > {budget}'
+            for name, value, budget in checks
+            if budget is not None and value > budget
         ]
+        if champion is not None and self.min_throughput_ratio is not None:
+            ratio = challenger.batch_rows_per_sec / champion.batch_rows_per_sec
+            if ratio < self.min_throughput_ratio:
+                budget = self.min_throughput_ratio
+                violations.append(f'min_throughput_ratio: {ratio:.3f} < {budget}')
+        for violation in violations:
+            logger.warning('Serving budget exceeded, %s', violation)
+        return violations
+
+    def _load_test_df(self):
+        test_df = self.validation_artifact.test_df
+        if test_df is None:
+            test_df = io.load_frame(self.validation_artifact.test_path, mmap=True)
+        return test_df
+
+    def _challenger_outputs(self) -> tuple[np.ndarray, np.ndarray]:
+        y_test = self.transformer_artifact.y_test
+        if y_test is None:
+            y_test = io.load_array(self.transformer_artifact.y_test_path, mmap=True)
+        y_pred = self.trainer_artifact.y_pred_test
+        if y_pred is None:
+            if self.trainer_artifact.test_pred_path is None:
+                raise ValueError('test_pred_path must not None.')
+            y_pred = io.load_array(self.trainer_artifact.test_pred_path, mmap=True)
+        return y_test, y_pred
+
+    def _score_champion(self, test_df: DataFrame) -> tuple[float, ModelBenchmark]:
+        """Accuracy and benchmark of the saved model on `test_df`."""
+        model_fp, transformer_fp, target_enc_fp = self.saved_models.get_saved_models_path()
+        target_enc = io.load_model(target_enc_fp)
+        logger.info('Importing saved trained objects.')
+        model, transformer = self.__load_saved_objects(model_fp, transformer_fp)
+        y_true = test_df[self.schema.target_name]
+        bundle_path = self.saved_models.bundle_path
+        if bundle_path is not None:
+            test_df = self._champion_features(test_df, Bundle(bundle_path))
+
+        y_pred = model.predict(transformer.transform(test_df[transformer.feature_names_in_]))
+        score = accuracy_score(y_true, target_enc.inverse_transform(y_pred.astype(int)))
+        return score, self._benchmark(model, transformer, test_df)
 
-        for from_, to in zip(from_paths, to_paths):
-            from_.parent.mkdir(parents=True, exist_ok=True)
-            to.parent.mkdir(parents=True, exist_ok=True)
+    def _champion_outputs(self, test_df: DataFrame) -> tuple[float, ModelBenchmark]:
+        """
+        Accuracy and benchmark of the saved model on `test_df`.
 
-            logger.info('File: "%s" copying to "%s"', from_, to)
-            self.__copy_to_path(from_, to)
+        Both are cached, keyed by the saved version and the content of `test_df`, so
+        evaluating new models against the same champion and test data does not load or
+        run the champion at all.
+        """
+        cache_path = self.saved_models.champion_cache_path(io.frame_fingerprint(test_df))
+        if cache_path is not None and cache_path.exists():
+            logger.info('Using cached evaluation of saved model: %s', cache_path)
+            cached = json.loads(cache_path.read_text())
+            return cached['score'], ModelBenchmark(**cached['benchmark'])
 
+        score, benchmark = self._score_champion(test_df)
+        if cache_path is not None:
+            # Written aside and renamed, so a partial cache is never picked up.
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = cache_path.with_name('.tmp-' + cache_path.name)
+            tmp_path.write_text(json.dumps({'score': score, 'benchmark': asdict(benchmark)}))
+            os.replace(tmp_path, cache_path)
+        return score, benchmark
+
+    def _load_new_objects(self) -> tuple[Any, Any]:
+        new_model = self.trainer_artifact.model
+        new_transformer = self.transformer_artifact.transformer
+        if new_model is None or new_transformer is None:
+            new_model, new_transformer = self.__load_saved_objects(
+                self.trainer_artifact.model_path,
+                self.transformer_artifact.transformer_path,
+            )
+        return new_model, new_transformer
+
+    @profiled('evaluation')
     def initiate(self) -> ModelEvaluationArtifact:
         if self.saved_models.latest_saved_dir is None:
             logger.info('There are no Pre-Trained model. ' 'So this is the first trained model.')
-            self.__dump_models_into_saved_models_dir()
-            return ModelEvaluationArtifact(True, 0.0)
+            # Without a champion there is nothing to fall back to, so the first model is
+            # saved even if it exceeds an absolute budget.
+            new_model, new_transformer = self._load_new_objects()
+            challenger = self._benchmark(new_model, new_transformer, self._load_test_df())
+            violations = self._budget_violations(challenger, None)
+            self.__publish_models()
+            return ModelEvaluationArtifact(
+                True,
+                0.0,
+                challenger_benchmark=challenger,
+                budget_violations=violations,
+            )
 
         logger.info('Pre-Trained model found. Initialize ModelEvaluation.')
-
-        logger.info('Importing saved trained objects.')
-        model, transformer = self.__load_saved_objects(
-            *self.saved_models.get_saved_models_path()[:2],
-        )
-
-        logger.info('Newly trained model objects')
-        new_model, new_transformer = self.__load_saved_objects(
-            self.trainer_artifact.model_path,
-            self.transformer_artifact.transformer_path,
-        )
+        test_df = self._load_test_df()
+        record_rows(rows_in=len(test_df))
 
         # --- --- Old Model Evaluation --- --- #
         logger.info('%s Old Model Evaluation %s', '===' * 10, '===' * 10)
-        test_df = pd.read_csv(self.ingestion_artifact.test_path)
-        y_true = test_df[self.schema.target_name]
-
-        input_arr = transformer.transform(test_df[transformer.feature_names_in_])
-        y_pred = model.predict(input_arr)
-
-        old_score = accuracy_score(y_true, y_pred)
+        old_score, champion = self._champion_outputs(test_df)
         logger.info('Score of old model: %s', old_score)
 
         # --- --- New Model Evaluation --- --- #
         logger.info('%s New Model Evaluation %s', '===' * 10, '===' * 10)
-        input_arr = new_transformer.transform(test_df[transformer.feature_names_in_])
-        y_pred = new_model.predict(input_arr)
-
-        current_score = accuracy_score(y_true, y_pred)
+        # Scored by the trainer on the transformed X_test of this run.
+        y_test, y_pred = self._challenger_outputs()
+        current_score = accuracy_score(y_test, y_pred)
         logger.info('Score of current model: %s', current_score)
 
+        # --- --- Serving cost --- --- #
+        logger.info('%s Serving Benchmark %s', '===' * 10, '===' * 10)
+        new_model, new_transformer = self._load_new_objects()
+        challenger = self._benchmark(new_model, new_transformer, test_df)
+        violations = self._budget_violations(challenger, champion)
+
         is_model_accepted = True
         if current_score <= old_score:
             msg = 'New trained model is not better than old model.'
@@ -114,9 +311,20 @@ class ModelEvaluation(ModelEvaluationConfig):
 
             is_model_accepted = False
 
-        logger.info('New model is better than old model. So save the new model.')
-        self.__dump_models_into_saved_models_dir()
+        if violations:
+            msg = f'New trained model exceeds serving budgets: {violations}'
+            logger.warning(msg)
+            warn(msg, UserWarning)
+
+            is_model_accepted = False
+
+        if is_model_accepted:
+            logger.info('New model is better than old model. So save the new model.')
+            self.__publish_models()
         return ModelEvaluationArtifact(
             is_model_accepted,
             current_score - old_score,  # type: ignore
+            challenger_benchmark=challenger,
+            champion_benchmark=champion,
+            budget_violations=violations,
         )
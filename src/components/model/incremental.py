@@ -0,0 +1,57 @@
+"""
+Incremental updates of the saved model.
+
+Rather than retraining on the whole history, the new rows only are prepared with the
+objects saved with the current model and fitted as extra trees of its forest:
+
+- The transformer and target encoder are reused as they are, so the existing trees
+  keep seeing the inputs they were split on.
+- The account features are joined from the saved table, and the velocity store is
+  continued with the new transactions.
+- The updated model goes through `ModelEvaluation` like any other challenger.
+"""
+
+from dataclasses import dataclass
+from typing import Any
+
+from src.core import get_logger, io
+from src.entity.saved_model import SavedModelConfig
+from src.serving.bundle import Bundle
+from src.serving.features import AccountFeatures
+from src.serving.velocity import VelocityStore
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class Champion:
+    model: Any
+    transformer: Any
+    target_enc: Any
+    account_features: AccountFeatures | None = None
+    velocity_store: VelocityStore | None = None
+    # Rows of the database snapshot the model was trained up to, None if unknown.
+    snapshot_rows: int | None = None
+
+
+def load_champion() -> Champion | None:
+    """Fresh copies of the saved model and its objects, None if no model is saved yet."""
+    saved_models = SavedModelConfig()
+    if saved_models.latest_saved_dir is None:
+        return None
+    logger.info('Loading saved model %s to update.', saved_models.latest_saved_dir)
+
+    bundle_path = saved_models.bundle_path
+    if bundle_path is not None:
+        bundle = Bundle(bundle_path)
+        champion = Champion(
+            bundle.load('model'),
+            bundle.load('transformer'),
+            bundle.load('target_enc'),
+            bundle.account_features(),
+            bundle.velocity_store(),
+        )
+    else:
+        champion = Champion(*map(io.load_model, saved_models.get_saved_models_path()))
+    champion.snapshot_rows = saved_models.load_training_state().get('snapshot_rows')
+    return champion
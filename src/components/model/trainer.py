@@ -1,35 +1,180 @@
+import time
+
+import numpy as np
+import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401
 from sklearn.metrics import accuracy_score
+from sklearn.model_selection import HalvingRandomSearchCV
 
 from src.core import get_logger, io
-from src.entity.artifact import ModelTrainerArtifact
+from src.core.metrics import profiled, record_rows
+from src.entity.artifact import DataTransformationArtifact, ModelTrainerArtifact
 from src.entity.config import DataTransformationConfig, ModelTrainerConfig
 
 logger = get_logger(__name__)
 
 
 class ModelTrainer(ModelTrainerConfig):
-    def __init__(self):
+    def __init__(
+        self,
+        transformation_artifact: DataTransformationArtifact | None = None,
+        in_memory: bool = False,
+        persist: bool = True,
+        base_model: RandomForestClassifier | None = None,
+    ):
+        """
+        :param base_model: Fitted forest to update with the new rows instead of training
+            a new model, see `_incremental_model`.
+        """
         super().__init__()
         logger.critical('%s %s %s', '>>>' * 10, self.__class__.__name__, '<<<' * 10)
-        self.transformation = DataTransformationConfig()
+        if transformation_artifact is None:
+            config = DataTransformationConfig()
+            transformation_artifact = DataTransformationArtifact(
+                config.transformer_path,
+                config.target_enc_path,
+                config.X_train_path,
+                config.y_train_path,
+                config.X_test_path,
+                config.y_test_path,
+            )
+        self.transformation = transformation_artifact
+        self.in_memory = in_memory
+        self.persist = persist or not in_memory
+        self.base_model = base_model
 
     def _get_train_test_data(self):
-        logger.info('Loading train and test array.')
-        train_arr = io.load_array(self.transformation.train_arr_path)
-        test_arr = io.load_array(self.transformation.test_arr_path)
-
-        logger.info('Splitting into X and y from train and test array.')
-        X_train, y_train = train_arr[:, :-1], train_arr[:, -1]
-        X_test, y_test = test_arr[:, :-1], test_arr[:, -1]
+        t = self.transformation
+        if t.X_train is not None and t.X_test is not None:
+            return t.X_train, t.X_test, t.y_train, t.y_test
 
+        # Memory-mapped, so the arrays are not copied into memory before fitting.
+        logger.info('Loading train and test array.')
+        X_train = io.load_array(t.X_train_path, mmap=True)
+        y_train = io.load_array(t.y_train_path, mmap=True)
+        X_test = io.load_array(t.X_test_path, mmap=True)
+        y_test = io.load_array(t.y_test_path, mmap=True)
         return X_train, X_test, y_train, y_test
 
     def _model(self, X, y):
+        if self.base_model is not None:
+            return self._incremental_model(X, y)
+        if self.search:
+            return self._search_model(X, y)
         clf = RandomForestClassifier()
         clf.fit(X, y)
         return clf
 
+    def _incremental_model(self, X, y):
+        """
+        Add `incremental_n_estimators` trees fitted on the new rows only to `base_model`,
+        then retire its oldest trees beyond `incremental_max_estimators`. The cost
+        depends on the new rows, not on the history the existing trees were fitted on.
+
+        Trees fitted without a sample of every class could not predict them, so without
+        one the update is skipped and `base_model` is returned as it is. It is then not
+        better than itself and is not saved again, and the new rows are left for the
+        next update.
+        """
+        clf = self.base_model
+        missing = set(clf.classes_.tolist()) - set(np.unique(y).tolist())
+        if missing:
+            logger.warning(
+                'New rows have no sample of class(es) %s, skipping the model update.',
+                sorted(missing),
+            )
+            return clf
+        n_trees = len(clf.estimators_)
+        clf.set_params(warm_start=True, n_estimators=n_trees + self.incremental_n_estimators)
+        clf.fit(X, y)
+
+        retired = max(len(clf.estimators_) - self.incremental_max_estimators, 0)
+        clf.estimators_ = clf.estimators_[retired:]
+        clf.set_params(warm_start=False, n_estimators=len(clf.estimators_))
+        logger.info(
+            'Added %s tree(s) on %s new row(s), retired %s, %s tree(s) in total.',
+            self.incremental_n_estimators,
+            X.shape[0],
+            retired,
+            len(clf.estimators_),
+        )
+        return clf
+
+    def _search_model(self, X, y):
+        """
+        Successive halving over `search_space`: every round fits the remaining candidates
+        on `search_factor` times more rows and keeps the best `1 / search_factor` of them.
+
+        Trials run in worker processes. joblib hands them the (memory-mapped) training
+        matrix as a read-only memory map rather than a copy per worker.
+        """
+        search = HalvingRandomSearchCV(
+            RandomForestClassifier(random_state=42),
+            self.search_space,
+            n_candidates=self.search_n_candidates,
+            factor=self.search_factor,
+            min_resources='exhaust',
+            cv=self.search_cv,
+            scoring='accuracy',
+            refit=False,
+            return_train_score=True,
+            random_state=42,
+            n_jobs=self.search_n_jobs,
+        )
+        start = time.perf_counter()
+        search.fit(X, y)
+        logger.info(
+            'Searched %s trial(s) in %s round(s) in %.1fs.',
+            len(search.cv_results_['params']),
+            search.n_iterations_,
+            time.perf_counter() - start,
+        )
+
+        results = pd.DataFrame(search.cv_results_)
+        results = results[
+            [
+                'iter',
+                'n_resources',
+                'params',
+                'mean_fit_time',
+                'mean_score_time',
+                'mean_train_score',
+                'mean_test_score',
+                'std_test_score',
+            ]
+        ]
+        results.to_csv(self.search_results_path, index_label='trial')
+        logger.info('Search results saved at %s.', self.search_results_path)
+
+        # Prefer the candidates that survived the most rounds, then the best CV score,
+        # skipping those whose CV scores would not pass `_check_model_fitting`.
+        ranked = results.sort_values(['iter', 'mean_test_score'], ascending=False)
+        passing = ranked[
+            [
+                self._passes_expected_scores(train_score, test_score)
+                for train_score, test_score in zip(
+                    ranked['mean_train_score'], ranked['mean_test_score']
+                )
+            ]
+        ]
+        if len(passing) == 0:
+            logger.warning('No candidate meets the expected scores, using the best one.')
+            passing = ranked
+        params = passing.iloc[0]['params']
+        logger.info('Best parameters: %s', params)
+
+        clf = RandomForestClassifier(random_state=42, n_jobs=self.search_n_jobs, **params)
+        clf.fit(X, y)
+        return clf.set_params(n_jobs=None)
+
+    def _passes_expected_scores(self, train_score, test_score) -> bool:
+        return (
+            train_score >= self.expected_training_score
+            and test_score >= self.expected_testing_score
+            and abs(train_score - test_score) <= self.overfitting_threshold
+        )
+
     def _evaluate(self, model, X_train, X_test, y_train, y_test):
         y_hat_train = model.predict(X_train)
         y_hat_test = model.predict(X_test)
@@ -39,7 +184,7 @@ class ModelTrainer(ModelTrainerConfig):
 
         logger.info('Train score: %s', train_score)
         logger.info('Test score: %s', test_score)
-        return train_score, test_score
+        return train_score, test_score, y_hat_test
 
     def _check_model_fitting(self, train_score, test_score):
         logger.info('Checking if our model is under-fit or not.')
@@ -70,19 +215,31 @@ class ModelTrainer(ModelTrainerConfig):
         else:
             logger.info('Model is not over-fit.')
 
+    @profiled('model_training')
     def initiate(self) -> ModelTrainerArtifact:
         X_train, X_test, y_train, y_test = self._get_train_test_data()
+        record_rows(rows_in=X_train.shape[0] + X_test.shape[0])
 
         logger.info('Train the model')
         model = self._model(X_train, y_train)
 
-        train_score, test_score = self._evaluate(model, X_train, X_test, y_train, y_test)
+        train_score, test_score, y_pred_test = self._evaluate(
+            model, X_train, X_test, y_train, y_test,
+        )
         self._check_model_fitting(train_score, test_score)
+        record_rows(rows_out=len(y_pred_test))
 
-        io.dump_model(model, self.model_path)
+        if self.persist:
+            io.persist(io.dump_model, model, self.model_path, background=self.in_memory)
+            io.persist(io.dump_array, y_pred_test, self.test_pred_path, background=self.in_memory)
 
-        return ModelTrainerArtifact(
+        artifact = ModelTrainerArtifact(
             self.model_path,
             train_score,  # type: ignore
             test_score,  # type: ignore
+            self.test_pred_path if self.persist else None,
         )
+        if self.in_memory:
+            artifact.model = model
+            artifact.y_pred_test = y_pred_test
+        return artifact
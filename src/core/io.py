@@ -1,7 +1,16 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
+from typing import Callable, Iterator
 
 import dill
 import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
 
 from src.core import get_logger
 
@@ -20,11 +29,257 @@ def load_model(fp: Path):
         return dill.load(f)
 
 
-def dump_array(array: np.ndarray, fp: Path) -> None:
-    array.dump(fp)
+def dumps_model(model) -> bytes:
+    """Bytes `dump_model` would write for `model`."""
+    return dill.dumps(model)
+
+
+def loads_model(data: bytes):
+    return dill.loads(data)
+
+
+def _sparse_dir(fp: Path) -> Path:
+    return fp.with_suffix('.csr')
+
+
+def dump_array(array, fp: Path) -> None:
+    """
+    Dump a dense array as pickle-free `.npy` file.
+
+    Sparse matrices are dumped as CSR into the `<fp stem>.csr` directory instead,
+    `load_array` picks up either form from the same `fp`.
+    """
+    if hasattr(array, 'tocsr'):
+        array = array.tocsr()
+        dir_ = _sparse_dir(fp)
+        dir_.mkdir(parents=True, exist_ok=True)
+        for name in ('data', 'indices', 'indptr'):
+            np.save(dir_ / f'{name}.npy', getattr(array, name), allow_pickle=False)
+        np.save(dir_ / 'shape.npy', np.array(array.shape), allow_pickle=False)
+        logger.info('Sparse array %s dumped.', dir_)
+        return
+
+    np.save(fp, array, allow_pickle=False)
     logger.info('Array %s dumped.', fp)
 
 
-def load_array(fp: Path) -> np.ndarray:
+def load_array(fp: Path, mmap: bool = False):
+    """
+    :param mmap: Memory-map the array read-only, which makes loading zero-copy.
+    """
+    mmap_mode = 'r' if mmap else None
+    dir_ = _sparse_dir(fp)
+    if not fp.exists() and dir_.is_dir():
+        from scipy.sparse import csr_matrix
+
+        data, indices, indptr, shape = (
+            np.load(dir_ / f'{name}.npy', mmap_mode=mmap_mode, allow_pickle=False)
+            for name in ('data', 'indices', 'indptr', 'shape')
+        )
+        logger.info('Sparse array %s loaded.', dir_)
+        return csr_matrix((data, indices, indptr), shape=tuple(shape))
+
     logger.info('Array %s loaded.', fp)
-    return np.load(fp, allow_pickle=True)
+    return np.load(fp, mmap_mode=mmap_mode, allow_pickle=False)
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
+# Columnar frames
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
+# A frame is a directory with one `.npy` file per column and part, and a
+# `_meta.json` file listing the committed parts. Numeric, bool and datetime
+# columns are stored as-is (memory-mappable), other columns as categorical
+# codes plus a JSON list of categories. Appending writes a new part and then
+# atomically replaces `_meta.json`, so readers never see a half-written part.
+
+FRAME_META = '_meta.json'
+
+
+def _read_frame_meta(fp: Path) -> dict:
+    with open(fp / FRAME_META) as f:
+        return json.load(f)
+
+
+def _write_frame_meta(fp: Path, meta: dict) -> None:
+    tmp = fp / f'{FRAME_META}.{os.getpid()}.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(meta, f, indent=2)
+    os.replace(tmp, fp / FRAME_META)
+
+
+def _dump_part(df: pd.DataFrame, part_dir: Path) -> list[dict]:
+    part_dir.mkdir(parents=True, exist_ok=True)
+    columns = []
+    for i, (name, series) in enumerate(df.items()):
+        dtype = series.dtype
+        file = f'{i}.npy'
+        if (
+            pd.api.types.is_numeric_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype)
+        ) or pd.api.types.is_bool_dtype(dtype) or dtype.kind == 'M':
+            np.save(part_dir / file, series.to_numpy(), allow_pickle=False)
+            columns.append({'name': name, 'kind': 'array', 'file': file})
+        else:
+            categorical = pd.Categorical(series)
+            np.save(part_dir / file, categorical.codes, allow_pickle=False)
+            categories = f'{i}.categories.json'
+            with open(part_dir / categories, 'w') as f:
+                json.dump(categorical.categories.tolist(), f)
+            columns.append(
+                {'name': name, 'kind': 'categorical', 'file': file, 'categories': categories}
+            )
+    return columns
+
+
+def frame_exists(fp: Path) -> bool:
+    return (fp / FRAME_META).exists()
+
+
+def _missing_column(fp: Path, part: dict, name: str, rows: int) -> pd.Series:
+    """Column of `rows` missing values, of the same kind as column `name` of `part`."""
+    col = next(col for col in part['columns'] if col['name'] == name)
+    if col['kind'] == 'categorical':
+        return pd.Series([None] * rows, dtype=object)
+    dtype = np.load(fp / part['name'] / col['file'], mmap_mode='r').dtype
+    if dtype.kind == 'M':
+        return pd.Series(np.full(rows, np.datetime64('NaT'), dtype=dtype))
+    return pd.Series(np.full(rows, np.nan))
+
+
+def append_frame(df: pd.DataFrame, fp: Path, attrs: dict | None = None) -> None:
+    """
+    Append `df` as a new part of the frame at `fp`, creating it if required.
+
+    Columns of the frame missing from `df` are appended as missing values.
+    """
+    fp.mkdir(parents=True, exist_ok=True)
+    meta = _read_frame_meta(fp) if frame_exists(fp) else {'rows': 0, 'parts': [], 'attrs': {}}
+    if meta['parts'] and meta['columns'] != [str(i) for i in df.columns]:
+        if not {str(i) for i in df.columns} <= set(meta['columns']):
+            raise ValueError(f'Columns {list(df.columns)} does not match frame {fp}.')
+        df = df.assign(**{
+            name: _missing_column(fp, meta['parts'][-1], name, len(df)).to_numpy()
+            for name in meta['columns']
+            if name not in df.columns
+        })[meta['columns']]
+
+    part = f'part-{len(meta["parts"]):05d}'
+    columns = _dump_part(df, fp / part)
+    meta['columns'] = [i['name'] for i in columns]
+    meta['parts'].append({'name': part, 'rows': len(df), 'columns': columns})
+    meta['rows'] += len(df)
+    meta['attrs'].update(attrs or {})
+    _write_frame_meta(fp, meta)
+    logger.info('Frame part %s with %s rows dumped.', fp / part, len(df))
+
+
+def dump_frame(df: pd.DataFrame, fp: Path, attrs: dict | None = None) -> None:
+    if fp.exists():
+        shutil.rmtree(fp)
+    append_frame(df, fp, attrs)
+
+
+def load_frame_attrs(fp: Path) -> dict:
+    return _read_frame_meta(fp)['attrs']
+
+
+def load_frame_columns(fp: Path) -> list[str]:
+    return _read_frame_meta(fp)['columns']
+
+
+def load_frame_rows(fp: Path) -> int:
+    return _read_frame_meta(fp)['rows']
+
+
+def load_frame(fp: Path, mmap: bool = False) -> pd.DataFrame:
+    """
+    Load a columnar frame.
+
+    :param mmap: Memory-map the column files read-only instead of reading them.
+        Single-part numeric columns are then used without any copy.
+    """
+    return _frame_from_meta(fp, _read_frame_meta(fp), mmap)
+
+
+def _frame_from_meta(fp: Path, meta: dict, mmap: bool) -> pd.DataFrame:
+    mmap_mode = 'r' if mmap else None
+    data: dict[str, list] = {name: [] for name in meta['columns']}
+    for part in meta['parts']:
+        part_dir = fp / part['name']
+        for col in part['columns']:
+            values = np.load(part_dir / col['file'], mmap_mode=mmap_mode, allow_pickle=False)
+            if col['kind'] == 'categorical':
+                with open(part_dir / col['categories']) as f:
+                    # Without categories (all missing) they would default to float.
+                    categories = json.load(f) or pd.Index([], dtype=str)
+                values = pd.Categorical.from_codes(values, categories)
+            data[col['name']].append(values)
+
+    columns = {}
+    for name, values in data.items():
+        if len(values) == 1:
+            columns[name] = values[0]
+        elif isinstance(values[0], pd.Categorical):
+            columns[name] = union_categoricals(values)
+        else:
+            columns[name] = np.concatenate(values)
+    logger.info('Frame %s with %s rows loaded.', fp, meta['rows'])
+    return pd.DataFrame(columns, columns=meta['columns'], copy=False)
+
+
+def frame_fingerprint(df: pd.DataFrame) -> str:
+    """Content hash of `df` (columns, index and values), stable across processes."""
+    digest = hashlib.sha1(json.dumps([str(c) for c in df.columns]).encode())
+    digest.update(pd.util.hash_pandas_object(df).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def iter_frame(fp: Path, chunksize: int) -> Iterator[pd.DataFrame]:
+    """Iterate over a columnar frame in chunks of at most `chunksize` rows."""
+    meta = _read_frame_meta(fp)
+    for part in meta['parts']:
+        part_meta = {**meta, 'parts': [part], 'rows': part['rows']}
+        df = _frame_from_meta(fp, part_meta, mmap=True)
+        for start in range(0, len(df), chunksize):
+            yield df.iloc[start : start + chunksize].reset_index(drop=True)
+
+
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
+# Background persistence
+# --- --- --- --- --- --- --- --- --- --- --- --- --- --- #
+_persist_executor: ThreadPoolExecutor | None = None
+_persist_futures: list[Future] = []
+_persist_lock = threading.Lock()
+
+
+def _log_persist_error(future: Future) -> None:
+    if future.exception() is not None:
+        logger.error('Background persist failed: %s', future.exception())
+
+
+def persist(dump_fn: Callable, *args, background: bool = False) -> None:
+    """
+    Call `dump_fn(*args)`, or queue it on a single background writer thread.
+
+    Background writes are executed in submission order, use `wait_for_persist` to
+    block until they are on disk.
+    """
+    if not background:
+        dump_fn(*args)
+        return
+
+    global _persist_executor
+    with _persist_lock:
+        if _persist_executor is None:
+            _persist_executor = ThreadPoolExecutor(1, thread_name_prefix='persist')
+        future = _persist_executor.submit(dump_fn, *args)
+        future.add_done_callback(_log_persist_error)
+        _persist_futures.append(future)
+
+
+def wait_for_persist() -> None:
+    """Block until all background writes are done, re-raising the first failure."""
+    with _persist_lock:
+        futures = list(_persist_futures)
+        _persist_futures.clear()
+    for future in futures:
+        future.result()
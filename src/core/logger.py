@@ -1,20 +1,187 @@
+"""
+Queued, structured logging.
+
+Loggers only put records on an in-memory queue; a single writer thread formats them
+as JSON lines and appends them to the log file. Every line is written with a single
+`os.write` on a file opened with `O_APPEND`, so several processes can share one file
+without interleaving partial lines. The writer thread is started by the first record,
+and forked children (e.g. process pool workers) write their records synchronously.
+
+Environment variables:
+
+- `LOG_FILE`: Log file, defaults to `logs/<YYYYMMDD>.jsonl`.
+- `LOG_LEVEL`: Default level, defaults to `DEBUG`.
+- `LOG_LEVELS`: Per-module levels, e.g. `src.core.io=WARNING,src.serving=INFO`.
+  The longest matching module prefix wins.
+- `LOG_SAMPLING`: Per-module fraction of plain records below WARNING that are kept,
+  e.g. `src.serving.cache=0.01`.
+"""
+
+import atexit
+import json
 import logging
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
 from datetime import datetime as dt
+from logging.handlers import QueueHandler, QueueListener
 from pathlib import Path
+from typing import Iterator
 
 logger_instances = {}
 
+# One id per process (and its forked workers), to group the records of a run.
+run_id = f"{dt.now().strftime('%Y%m%d-%H%M%S')}-{os.getpid()}"
+
+_LAZY_ARG_TYPES = (str, int, float, bool, type(None), Path)
+
+
+def _parse_mapping(value: str | None) -> dict[str, str]:
+    if not value:
+        return {}
+    pairs = (item.split("=", 1) for item in value.split(",") if "=" in item)
+    return {name.strip(): setting.strip() for name, setting in pairs}
+
+
+def _lookup(settings: dict[str, str], logger_name: str) -> str | None:
+    """Setting of the longest module prefix of `logger_name`."""
+    parts = logger_name.split(".")
+    for i in range(len(parts), 0, -1):
+        setting = settings.get(".".join(parts[:i]))
+        if setting is not None:
+            return setting
+    return None
+
+
+class JsonLinesHandler(logging.Handler):
+    def __init__(self, file_path: Path) -> None:
+        super().__init__()
+        self.file_path = file_path
+        self._fd: int | None = None
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": dt.fromtimestamp(record.created).isoformat(timespec="microseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "line": record.lineno,
+            "msg": record.getMessage(),
+            "run_id": run_id,
+            "pid": record.process,
+            "thread": record.threadName,
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = logging.Formatter().formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            if self._fd is None:
+                self.file_path.parent.mkdir(parents=True, exist_ok=True)
+                flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND
+                self._fd = os.open(self.file_path, flags, 0o644)
+            os.write(self._fd, (self.format(record) + "\n").encode())
+        except Exception:
+            self.handleError(record)
+
+    def close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+        super().close()
+
+
+class _DeferredQueueHandler(QueueHandler):
+    def enqueue(self, record: logging.LogRecord) -> None:
+        if _direct_handler is not None:
+            _direct_handler.handle(record)
+            return
+        if _listener is None:
+            _start_listener()
+        super().enqueue(record)
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        """
+        Leave the formatting to the writer thread. The message is only rendered here
+        when an argument is mutable, as it could change before the writer gets to it.
+        """
+        if record.args and not all(isinstance(a, _LAZY_ARG_TYPES) for a in record.args):
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+
+class _SamplingFilter(logging.Filter):
+    def __init__(self, rate: float) -> None:
+        super().__init__()
+        self.rate = rate
 
-def __configure_logger(logger: logging.Logger, file_path: Path):
-    logger.setLevel(logging.DEBUG)
+    def filter(self, record: logging.LogRecord) -> bool:
+        # Warnings, errors and structured records (e.g. stage timings) are always kept.
+        if record.levelno >= logging.WARNING or hasattr(record, "fields"):
+            return True
+        return random.random() < self.rate
 
-    file_path.parent.mkdir(exist_ok=True)
-    file_handler = logging.FileHandler(file_path)
-    formatter = logging.Formatter(
-        "[%(asctime)s]:%(levelname)s:[%(lineno)d]:%(name)s - %(message)s"
-    )
-    file_handler.setFormatter(formatter)
-    logger.addHandler(file_handler)
+
+_queue: queue.SimpleQueue = queue.SimpleQueue()
+_queue_handler = _DeferredQueueHandler(_queue)
+_listener: QueueListener | None = None
+_listener_lock = threading.Lock()
+_log_path: Path | None = None
+# Writes the records of forked children synchronously, see `_restart_in_child`.
+_direct_handler: JsonLinesHandler | None = None
+
+
+def _log_file() -> Path:
+    default_path = Path("logs", f"{dt.now().strftime('%Y%m%d')}.jsonl")
+    # Absolute, so that forked children write to the same file whatever their cwd.
+    return Path(os.environ.get("LOG_FILE", default_path)).absolute()
+
+
+def _start_listener() -> None:
+    """Start the writer thread, on the first record rather than on import."""
+    global _listener, _log_path
+    with _listener_lock:
+        if _listener is not None:
+            return
+        _log_path = _log_file()
+        listener = QueueListener(_queue, JsonLinesHandler(_log_path))
+        listener.start()
+        _listener = listener
+
+
+def _stop_listener() -> None:
+    """Flush the queued records, called at exit. A later record starts a new writer."""
+    global _listener
+    with _listener_lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+            _listener = None
+
+
+def _restart_in_child() -> None:
+    """
+    The writer thread does not survive a fork, and pool workers exit with `os._exit`,
+    without running `atexit` to flush a queue of their own. Forked children therefore
+    write their records synchronously, to the file of the parent.
+    """
+    global _queue, _listener, _listener_lock, _direct_handler
+    _queue = queue.SimpleQueue()
+    _queue_handler.queue = _queue
+    _listener, _listener_lock = None, threading.Lock()
+    _direct_handler = JsonLinesHandler(_log_path or _log_file())
+
+
+atexit.register(_stop_listener)
+os.register_at_fork(after_in_child=_restart_in_child)
 
 
 def get_logger(logger_name: str) -> logging.Logger:
@@ -27,11 +194,34 @@ def get_logger(logger_name: str) -> logging.Logger:
     if logger_name in logger_instances:
         return logger_instances[logger_name]
 
-    run_id = dt.now().strftime("%d%m%y-%H%M")
-    log_file_path = Path(f"logs/{run_id}.log")
-
     logger = logging.getLogger(logger_name)
-    __configure_logger(logger, log_file_path)
+    level = _lookup(_parse_mapping(os.environ.get("LOG_LEVELS")), logger_name)
+    logger.setLevel((level or os.environ.get("LOG_LEVEL", "DEBUG")).upper())
+    sampling = _lookup(_parse_mapping(os.environ.get("LOG_SAMPLING")), logger_name)
+    if sampling is not None:
+        logger.addFilter(_SamplingFilter(float(sampling)))
+    logger.addHandler(_queue_handler)
     logger_instances[logger_name] = logger
 
     return logger
+
+
+@contextmanager
+def log_duration(logger: logging.Logger, stage: str, **fields) -> Iterator[dict]:
+    """
+    Log the wall time of the block as a structured record with `stage` and `seconds`
+    fields. The yielded dict can be filled with more fields inside the block.
+    """
+    fields = {"stage": stage, **fields}
+    start = time.perf_counter()
+    try:
+        yield fields
+    finally:
+        fields["seconds"] = round(time.perf_counter() - start, 6)
+        logger.info(
+            "Stage %s took %.3fs.",
+            stage,
+            fields["seconds"],
+            extra={"fields": fields},
+            stacklevel=3,  # The `with` statement, past contextlib's `__exit__`.
+        )
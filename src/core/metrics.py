@@ -0,0 +1,236 @@
+"""
+Per-stage resource metrics of the training pipeline.
+
+`StageProfiler.stage` measures a block: wall and CPU time (including worker
+processes), peak RSS, bytes read and written through system calls and the rows
+the stage consumed and produced. Stages decorated with `profiled` are recorded
+in the active profiler, see `start_model_training`.
+
+The results are written as a JSON run report and can be rendered in the
+Prometheus text exposition format.
+"""
+
+import cProfile
+import json
+import os
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from functools import wraps
+from pathlib import Path
+from typing import Callable, Iterator
+
+from src.core import get_logger
+from src.core.logger import log_duration, run_id
+
+logger = get_logger(__name__)
+
+LATEST_REPORT_PATH = Path('reports', 'run_report.json')
+
+
+@dataclass
+class StageMetrics:
+    stage: str
+    wall_seconds: float = 0.0
+    cpu_seconds: float = 0.0
+    peak_rss_bytes: int = 0
+    read_bytes: int = 0
+    write_bytes: int = 0
+    rows_in: int | None = None
+    rows_out: int | None = None
+    extra: dict = field(default_factory=dict)
+
+
+def _cpu_seconds() -> float:
+    self_usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return self_usage.ru_utime + self_usage.ru_stime + children.ru_utime + children.ru_stime
+
+
+def _io_bytes() -> tuple[int, int]:
+    """Bytes read and written through system calls by this process, 0 if unknown."""
+    try:
+        with open('/proc/self/io') as f:
+            counters = dict(line.split(':') for line in f)
+        return int(counters['rchar']), int(counters['wchar'])
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+def _reset_peak_rss() -> bool:
+    """Reset the kernel's peak RSS (VmHWM) of this process, if allowed."""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_bytes() -> int:
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak of the whole process life, in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class StageProfiler:
+    def __init__(
+        self,
+        profile_stage: str | None = None,
+        profile_dir: Path | None = None,
+    ) -> None:
+        """
+        :param profile_stage: Stage to capture with cProfile and tracemalloc.
+        :param profile_dir: Where the captures are written, `<stage>.prof` (load it with
+            `pstats` or snakeviz) and `<stage>.tracemalloc.txt`.
+        """
+        self.profile_stage = profile_stage
+        self.profile_dir = profile_dir or Path('profiles')
+        self.stages: list[StageMetrics] = []
+        self.started = datetime.now()
+        self._open: list[StageMetrics] = []
+
+    @contextmanager
+    def stage(self, name: str, **extra) -> Iterator[StageMetrics]:
+        metrics = StageMetrics(name, extra=extra)
+        capture = name == self.profile_stage
+        if capture:
+            profile = cProfile.Profile()
+            tracemalloc.start()
+            profile.enable()
+
+        self._open.append(metrics)
+        peak_reset = _reset_peak_rss()
+        read_start, write_start = _io_bytes()
+        cpu_start = _cpu_seconds()
+        start = time.perf_counter()
+        # The stage is logged as the same structured record as `log_duration` blocks.
+        with log_duration(logger, name) as fields:
+            try:
+                yield metrics
+            finally:
+                metrics.wall_seconds = round(time.perf_counter() - start, 6)
+                metrics.cpu_seconds = round(_cpu_seconds() - cpu_start, 6)
+                read_end, write_end = _io_bytes()
+                metrics.read_bytes = read_end - read_start
+                metrics.write_bytes = write_end - write_start
+                # Nested stages reset the peak too, so take the max with theirs.
+                metrics.peak_rss_bytes = max(metrics.peak_rss_bytes, _peak_rss_bytes())
+                self._open.pop()
+                if self._open and peak_reset:
+                    parent = self._open[-1]
+                    parent.peak_rss_bytes = max(parent.peak_rss_bytes, metrics.peak_rss_bytes)
+                if capture:
+                    profile.disable()
+                    self._dump_capture(name, profile)
+                self.stages.append(metrics)
+                fields.update(asdict(metrics))
+
+    def _dump_capture(self, name: str, profile: cProfile.Profile) -> None:
+        snapshot = tracemalloc.take_snapshot()
+        tracemalloc.stop()
+        self.profile_dir.mkdir(parents=True, exist_ok=True)
+        profile.dump_stats(self.profile_dir / f'{name}.prof')
+        top = snapshot.statistics('lineno')[:50]
+        (self.profile_dir / f'{name}.tracemalloc.txt').write_text(
+            '\n'.join(str(stat) for stat in top)
+        )
+        logger.info('Profile of stage %s written to %s.', name, self.profile_dir)
+
+    def report(self) -> dict:
+        return {
+            'run_id': run_id,
+            'started': self.started.isoformat(timespec='seconds'),
+            'stages': [asdict(metrics) for metrics in self.stages],
+        }
+
+    def write_report(self, fp: Path) -> None:
+        """Write the run report to `fp` and as the latest one, read by the metrics endpoint."""
+        report = json.dumps(self.report(), indent=2)
+        for path in (fp, LATEST_REPORT_PATH):
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + '.tmp')
+            tmp.write_text(report)
+            os.replace(tmp, path)
+        logger.info('Run report written to %s.', fp)
+
+
+_active: StageProfiler | None = None
+
+
+@contextmanager
+def activate(profiler: StageProfiler) -> Iterator[StageProfiler]:
+    """Record the stages decorated with `profiled` into `profiler`."""
+    global _active
+    previous, _active = _active, profiler
+    try:
+        yield profiler
+    finally:
+        _active = previous
+
+
+def profiled(name: str) -> Callable:
+    """Record the decorated function as stage `name` of the active profiler, if any."""
+
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _active is None:
+                return fn(*args, **kwargs)
+            with _active.stage(name):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def record_rows(rows_in: int | None = None, rows_out: int | None = None) -> None:
+    """Rows consumed and produced by the innermost running stage."""
+    if _active is None or not _active._open:
+        return
+    metrics = _active._open[-1]
+    if rows_in is not None:
+        metrics.rows_in = rows_in
+    if rows_out is not None:
+        metrics.rows_out = rows_out
+
+
+_PROMETHEUS_METRICS = (
+    ('wall_seconds', 'Wall time of the stage.'),
+    ('cpu_seconds', 'CPU time of the stage, including worker processes.'),
+    ('peak_rss_bytes', 'Peak resident set size during the stage.'),
+    ('read_bytes', 'Bytes read through system calls.'),
+    ('write_bytes', 'Bytes written through system calls.'),
+    ('rows_in', 'Rows consumed by the stage.'),
+    ('rows_out', 'Rows produced by the stage.'),
+)
+
+
+def to_prometheus(report: dict) -> str:
+    """Render a run report in the Prometheus text exposition format."""
+    lines = []
+    for key, help_text in _PROMETHEUS_METRICS:
+        name = f'pipeline_stage_{key}'
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        for metrics in report['stages']:
+            if metrics[key] is not None:
+                labels = f'stage="{metrics["stage"]}",run_id="{report["run_id"]}"'
+                lines.append(f'{name}{{{labels}}} {metrics[key]}')
+    return '\n'.join(lines) + '\n'
+
+
+def load_latest_report() -> dict | None:
+    try:
+        return json.loads(LATEST_REPORT_PATH.read_text())
+    except FileNotFoundError:
+        return None
@@ -1,2 +1,2 @@
-from .mongodb import from_mongodb_to_dataframe
+from .mongodb import count_documents, from_mongodb_to_dataframe, iter_mongodb_dataframes
 from .schema import DataSchema
@@ -1,17 +1,29 @@
-import json
+import atexit
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
 from enum import Enum
 from os import getenv
+from typing import Iterator
 
+import numpy as np
 import pandas as pd
+from bson import ObjectId
 from dotenv import load_dotenv
 from pymongo import MongoClient
 from pymongo.collection import Collection
+from pymongo.errors import BulkWriteError, ConnectionFailure
 
 from src.core import get_logger
+from src.database.schema import DataSchema
 
 load_dotenv()
 logger = get_logger(__name__)
 
+_clients: dict[str, MongoClient] = {}
+_clients_lock = threading.Lock()
+
 
 class MongoDB(Enum):
     database_name = 'money_laundering'
@@ -37,38 +49,307 @@ def get_mongodb_url() -> str:
         return mongodb_url
 
 
+def get_mongo_client(mongodb_url: str, max_pool_size: int = 20) -> MongoClient:
+    """ Process-wide pooled client, shared between readers and writers. """
+    with _clients_lock:
+        client = _clients.get(mongodb_url)
+        if client is None:
+            client = MongoClient(mongodb_url, maxPoolSize=max_pool_size)
+            _clients[mongodb_url] = client
+            logger.info('Connection with MONGODB is established.')
+    return client
+
+
+@atexit.register
+def close_mongo_clients() -> None:
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
 def get_collection_connection(
     mongodb_url: str, database_name: MongoDB, collection_name: MongoDB,
 ) -> Collection:
-    client = MongoClient(mongodb_url)
-    logger.info('Connection with MONGODB is established.')
+    client = get_mongo_client(mongodb_url)
     return client[database_name.value][collection_name.value]
 
 
-def dump_data_to_mongodb(df: pd.DataFrame) -> None:
-    """ Dump your `base_data` to MongoDB. """
-    mongodb_url = get_mongodb_url()
-    coll = get_collection_connection(
-        mongodb_url, MongoDB.database_name, MongoDB.collection_name,
+@dataclass
+class BulkLoadReport:
+    load_id: ObjectId
+    inserted: int = 0
+    # Documents already in the collection, sent by an interrupted earlier attempt.
+    duplicates: int = 0
+    elapsed: float = 0.0
+    failed_rows: list[int] = field(default_factory=list)  # Start row of each failed chunk.
+
+    @property
+    def docs_per_sec(self) -> float:
+        return self.inserted / self.elapsed if self.elapsed else 0.0
+
+
+# Every loaded document records its load and row, unique together (see `_create_load_index`),
+# so that retried and resumed chunks are idempotent. The `_id` is left to the driver, as
+# the snapshot of `src.components.data.ingestion` relies on its ObjectId order.
+LOAD_ID_FIELD = '_load_id'
+ROW_FIELD = '_row'
+
+
+def _create_load_index(coll: Collection) -> None:
+    coll.create_index(
+        [(LOAD_ID_FIELD, 1), (ROW_FIELD, 1)],
+        unique=True,
+        # Documents inserted otherwise have neither field.
+        partialFilterExpression={LOAD_ID_FIELD: {'$exists': True}},
     )
 
-    data_as_list: list[dict] = list(json.loads(df.T.to_json()).values())
-    coll.insert_many(data_as_list)
-    logger.info('Dumped %s data into MONGODB.', len(data_as_list))
+
+def _chunk_to_documents(chunk: pd.DataFrame, load_id: ObjectId, start: int) -> list[dict]:
+    docs = chunk.astype(object).where(chunk.notna(), None).to_dict('records')
+    for row, doc in enumerate(docs, start):
+        doc[LOAD_ID_FIELD] = load_id
+        doc[ROW_FIELD] = row
+    return docs
+
+
+def _insert_chunk(coll: Collection, docs: list[dict], max_retries: int) -> tuple[int, int]:
+    """:returns: Number of documents inserted and of those already in the collection."""
+    inserted = duplicates = 0
+    for attempt in range(max_retries + 1):
+        try:
+            coll.insert_many(docs, ordered=False)
+            return inserted + len(docs), duplicates
+        except BulkWriteError as e:
+            inserted += e.details.get('nInserted', 0)
+            errors = e.details.get('writeErrors', [])
+            # Duplicate load rows are documents which reached the server in an earlier attempt.
+            duplicates += sum(err.get('code') == 11000 for err in errors)
+            docs = [docs[err['index']] for err in errors if err.get('code') != 11000]
+            if not docs:
+                return inserted, duplicates
+            if attempt == max_retries:
+                raise
+        except ConnectionFailure:
+            if attempt == max_retries:
+                raise
+        time.sleep(0.5 * 2**attempt)
 
 
-def from_mongodb_to_dataframe() -> pd.DataFrame:
+def dump_data_to_mongodb(
+    df: pd.DataFrame,
+    chunk_size: int = 10_000,
+    max_workers: int = 4,
+    chunk_rows: list[int] | None = None,
+    max_retries: int = 3,
+    collection: Collection | None = None,
+    load_id: ObjectId | None = None,
+) -> BulkLoadReport:
     """
-    Get your `base_data` from MongoDB as DataFrame.
+    Dump your `base_data` to MongoDB.
+
+    Rows are converted to documents chunk by chunk and sent as unordered `insert_many`
+    batches by up to `max_workers` threads. A failed chunk is retried `max_retries`
+    times, after that its start row is reported in `BulkLoadReport.failed_rows`.
 
-    DataFrame contains the `_id` column so you need to `drop` it.
+    :param chunk_rows: Start rows of the chunks to load, pass `report.failed_rows` of an
+        earlier call (with the same `chunk_size`) to resume it. Defaults to all chunks.
+    :param load_id: Pass `report.load_id` of the call to resume, so that its documents
+        which did reach the server are not inserted twice. Defaults to a new load.
     """
-    mongodb_url = get_mongodb_url()
-    coll = get_collection_connection(
-        mongodb_url, MongoDB.database_name, MongoDB.collection_name,
+    if collection is None:
+        mongodb_url = get_mongodb_url()
+        collection = get_collection_connection(
+            mongodb_url, MongoDB.database_name, MongoDB.collection_name,
+        )
+
+    _create_load_index(collection)
+    report = BulkLoadReport(load_id or ObjectId())
+    start = time.perf_counter()
+    pending: dict[Future, int] = {}
+
+    def collect(futures) -> None:
+        for future in futures:
+            row = pending.pop(future)
+            try:
+                inserted, duplicates = future.result()
+            except Exception as e:
+                logger.error('Failed to insert chunk starting at row %s: %s', row, e)
+                report.failed_rows.append(row)
+            else:
+                report.inserted += inserted
+                report.duplicates += duplicates
+
+    with ThreadPoolExecutor(max_workers) as executor:
+        if chunk_rows is None:
+            chunk_rows = list(range(0, len(df), chunk_size))
+        for row in chunk_rows:
+            # Bound the number of converted chunks held in memory.
+            if len(pending) >= max_workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            docs = _chunk_to_documents(df.iloc[row : row + chunk_size], report.load_id, row)
+            future = executor.submit(_insert_chunk, collection, docs, max_retries)
+            pending[future] = row
+        collect(list(pending))
+
+    report.failed_rows.sort()
+    report.elapsed = time.perf_counter() - start
+    logger.info(
+        'Dumped %s data into MONGODB (%.0f docs/sec), %s already there, '
+        'failed chunks at rows: %s.',
+        report.inserted, report.docs_per_sec, report.duplicates, report.failed_rows,
     )
+    return report
+
+
+class _ColumnBuffer:
+    def __init__(self, numeric: bool) -> None:
+        """Typed buffer of a single column, filled batch by batch."""
+        self.numeric = numeric
+        self.present = False
+        self.values: list = []
+        self.chunks: list[np.ndarray] = []
+
+    def flush(self) -> None:
+        if self.values:
+            dtype = np.float64 if self.numeric else object
+            self.chunks.append(np.array(self.values, dtype=dtype))
+            self.values = []
+
+    def to_array(self) -> np.ndarray:
+        self.flush()
+        if not self.chunks:
+            return np.array([], dtype=np.float64 if self.numeric else object)
+        arr = np.concatenate(self.chunks)
+        # Keep integer columns as int64, like `pd.DataFrame` inference does.
+        if self.numeric and not np.isnan(arr).any() and np.array_equal(arr, np.trunc(arr)):
+            arr = arr.astype(np.int64)
+        return arr
+
+
+def count_documents(
+    collection: Collection | None = None,
+    up_to_id: ObjectId | str | None = None,
+) -> int:
+    """Number of documents of `base_data`, only those with an `_id` up to `up_to_id`."""
+    if collection is None:
+        mongodb_url = get_mongodb_url()
+        collection = get_collection_connection(
+            mongodb_url, MongoDB.database_name, MongoDB.collection_name,
+        )
+    query = {} if up_to_id is None else {'_id': {'$lte': ObjectId(up_to_id)}}
+    return collection.count_documents(query)
+
+
+def _find(
+    collection: Collection | None,
+    batch_size: int,
+    after_id: ObjectId | str | None,
+    with_id: bool,
+):
+    """Cursor over the schema columns of `base_data`, see `from_mongodb_to_dataframe`."""
+    if collection is None:
+        mongodb_url = get_mongodb_url()
+        collection = get_collection_connection(
+            mongodb_url, MongoDB.database_name, MongoDB.collection_name,
+        )
+
+    schema = DataSchema()
+    columns = list(dict.fromkeys(schema.all_cols + schema.date_cols))
+    numeric_cols = set(schema.num_cols + [schema.target_name])
+    if with_id:
+        columns.append('_id')
+
+    projection = {col: 1 for col in columns}
+    projection['_id'] = int(with_id)
+    query = {} if after_id is None else {'_id': {'$gt': ObjectId(after_id)}}
+    cursor = collection.find(query, projection, batch_size=batch_size)
+    return cursor, {col: col in numeric_cols for col in columns}
+
+
+def _iter_frames(
+    cursor,
+    numeric: dict[str, bool],
+    batch_size: int,
+    chunksize: int | None,
+) -> Iterator[pd.DataFrame]:
+    """
+    Frames of `chunksize` documents of `cursor`, or a single frame of all of them.
+
+    Projected columns which doesn't exist in the collection (e.g. derived ones) are
+    skipped, as decided by the first frame so that all frames have the same columns.
+    """
+    columns: list[str] | None = None
+
+    def to_frame(buffers: dict[str, _ColumnBuffer]) -> pd.DataFrame:
+        nonlocal columns
+        if columns is None:
+            columns = [col for col, buffer in buffers.items() if buffer.present]
+        return pd.DataFrame({col: buffers[col].to_array() for col in columns})
+
+    buffers = {col: _ColumnBuffer(is_numeric) for col, is_numeric in numeric.items()}
+    n_rows = 0
+    for doc in cursor:
+        for col, buffer in buffers.items():
+            value = doc.get(col)
+            if value is not None:
+                buffer.present = True
+            buffer.values.append(value)
+        n_rows += 1
+        if chunksize is not None and n_rows % chunksize == 0:
+            yield to_frame(buffers)
+            buffers = {col: _ColumnBuffer(is_numeric) for col, is_numeric in numeric.items()}
+        elif n_rows % batch_size == 0:
+            for buffer in buffers.values():
+                buffer.flush()
 
-    base_data = coll.find()
-    df = pd.DataFrame(base_data)
-    logger.info('Loaded %s shaped DataFrame from MONGODB.', df.shape)
+    if chunksize is None or n_rows % chunksize:
+        yield to_frame(buffers)
+
+
+def from_mongodb_to_dataframe(
+    collection: Collection | None = None,
+    batch_size: int = 10_000,
+    after_id: ObjectId | str | None = None,
+    with_id: bool = False,
+) -> pd.DataFrame:
+    """
+    Get your `base_data` from MongoDB as DataFrame.
+
+    Only the schema columns are projected (without `_id`) and the cursor is consumed
+    in batches of `batch_size` documents straight into typed column buffers.
+
+    :param collection: Collection to read from, any object with a pymongo compatible
+        `find` method works (e.g. a `mongomock` collection). Defaults to `base_data`.
+    :param after_id: Only fetch documents with an `_id` greater than this high-water mark.
+    :param with_id: Also return the `_id` column.
+    """
+    cursor, numeric = _find(collection, batch_size, after_id, with_id)
+    start = time.perf_counter()
+    df = next(_iter_frames(cursor, numeric, batch_size, chunksize=None))
+    elapsed = time.perf_counter() - start
+    logger.info(
+        'Loaded %s shaped DataFrame from MONGODB in %.2fs (%.0f rows/sec).',
+        df.shape, elapsed, len(df) / elapsed if elapsed else float('inf'),
+    )
     return df
+
+
+def iter_mongodb_dataframes(
+    chunksize: int,
+    collection: Collection | None = None,
+    batch_size: int = 10_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    `from_mongodb_to_dataframe` in frames of `chunksize` documents, read from the
+    cursor as they are consumed, so that only one frame is in memory at a time.
+    """
+    cursor, numeric = _find(collection, min(batch_size, chunksize), None, False)
+    n_rows, start = 0, time.perf_counter()
+    for df in _iter_frames(cursor, numeric, batch_size, chunksize):
+        n_rows += len(df)
+        yield df
+    logger.info(
+        'Streamed %s row(s) from MONGODB in %.2fs.', n_rows, time.perf_counter() - start,
+    )
@@ -1,28 +1,65 @@
 """ Entity for artifact folder to store all data and models. """
 
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+
+def live(**kwargs):
+    """Live object of an in-memory pipeline, None when the stage only persisted to disk."""
+    return field(default=None, kw_only=True, repr=False, compare=False, **kwargs)
 
 
 @dataclass
 class DataIngestionArtifact:
+    # Columnar frames, load them with `src.core.io.load_frame`.
     base_data_path: Path | None
     train_path: Path
     test_path: Path
+    base_df: pd.DataFrame | None = live()
+    train_df: pd.DataFrame | None = live()
+    test_df: pd.DataFrame | None = live()
+    # `DatasetStats` per dataset type, collected by a streaming ingestion.
+    validation_stats: dict | None = live()
+    # Per-account features joined onto the frames, see `src.serving.features`.
+    account_features_path: Path | None = field(default=None, kw_only=True)
+    account_features: Any = live()
+    # Online velocity store seeded with the ingested history, see `src.serving.velocity`.
+    velocity_store_path: Path | None = field(default=None, kw_only=True)
+    velocity_store: Any = live()
+    # Positions of the test rows in the base frame.
+    test_rows_path: Path | None = field(default=None, kw_only=True)
+    test_rows: np.ndarray | None = live()
+    # Rows of the database snapshot ingested up to, None when not read from the snapshot.
+    snapshot_rows: int | None = field(default=None, kw_only=True)
+    # Numeric columns added to the frames on top of the schema's.
+    extra_num_cols: list[str] = field(default_factory=list, kw_only=True)
 
 
 # Maybe DataValidationArtifact is not required because it doesn't do with anything.
 @dataclass
 class DataValidationArtifact(DataIngestionArtifact):
     report_path: Path
+    profile_path: Path | None = None
 
 
 @dataclass
 class DataTransformationArtifact:
     transformer_path: Path
     target_enc_path: Path
-    train_arr_path: Path
-    test_arr_path: Path
+    X_train_path: Path
+    y_train_path: Path
+    X_test_path: Path
+    y_test_path: Path
+    transformer: Any = live()
+    target_enc: Any = live()
+    X_train: Any = live()  # np.ndarray or scipy CSR matrix
+    y_train: np.ndarray | None = live()
+    X_test: Any = live()
+    y_test: np.ndarray | None = live()
 
 
 @dataclass
@@ -30,12 +67,28 @@ class ModelTrainerArtifact:
     model_path: Path
     train_score: float
     test_score: float
+    test_pred_path: Path | None = None  # Encoded predictions on the transformed X_test.
+    model: Any = live()
+    y_pred_test: np.ndarray | None = live()
+
+
+@dataclass
+class ModelBenchmark:
+    batch_rows_per_sec: float
+    latency_p50_ms: float
+    latency_p99_ms: float
+    size_bytes: int
+    memory_bytes: int
 
 
 @dataclass
 class ModelEvaluationArtifact:
     is_model_accepted: bool
     improved_accuracy: float
+    challenger_benchmark: ModelBenchmark | None = None
+    champion_benchmark: ModelBenchmark | None = None
+    # Budgets of `ModelEvaluationConfig` the challenger exceeds.
+    budget_violations: list[str] = field(default_factory=list)
 
 
 @dataclass
@@ -1,14 +1,33 @@
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
+from typing import Iterator
 
 
 class PipelineConfig:
+    # Start of the current run, see `run`.
+    run_started: datetime | None = None
+
     def __init__(self):
         self.root = Path.cwd()
-        self.artifact_dir = Path('artifacts', datetime.now().strftime('%d%m%y_%H%M'))
+        started = PipelineConfig.run_started or datetime.now()
+        self.artifact_dir = Path('artifacts', started.strftime('%d%m%y_%H%M'))
         self.__create_all_dirs()
 
+    @classmethod
+    @contextmanager
+    def run(cls) -> Iterator['PipelineConfig']:
+        """
+        Share one artifact directory between the configs created within the block,
+        even if the run crosses the minute of the directory name.
+        """
+        previous, PipelineConfig.run_started = PipelineConfig.run_started, datetime.now()
+        try:
+            yield cls()
+        finally:
+            PipelineConfig.run_started = previous
+
     def __create_all_dirs(self):
         self.artifact_dir.mkdir(parents=True, exist_ok=True)
 
@@ -17,9 +36,31 @@ class DataIngestionConfig(PipelineConfig):
     def __init__(self):
         super().__init__()
         self.dir = self.artifact_dir / 'data_ingestion'
-        self.train_path = self.dir / 'train.csv'
-        self.test_path = self.dir / 'test.csv'
+        # Stage artifacts are columnar frames (see `src.core.io.load_frame`).
+        self.base_path = self.dir / 'base'
+        self.train_path = self.dir / 'train'
+        self.test_path = self.dir / 'test'
+        self.export_csv = False  # Also export train/test as CSV side outputs.
+        self.train_csv_path = self.dir / 'train.csv'
+        self.test_csv_path = self.dir / 'test.csv'
         self.test_size = 0.2
+        self.test_rows_path = self.dir / 'test_rows.npy'
+        # Stream ingestion and validation statistics in chunks of this many rows,
+        # None loads the whole dataset at once.
+        self.chunksize = None
+        self.profile_sketch_size = 2048
+        # Local columnar copy of the database collection, refreshed with new documents only.
+        self.snapshot_dir = self.root / 'snapshots' / 'base_data'
+        self.incremental_ingestion = True
+        # Seconds before the snapshot's high-water mark fetched again, since documents of
+        # other writers within the same second may have a lower ObjectId.
+        self.snapshot_overlap_seconds = 5
+        # Velocity of the source account over these windows of `velocity_bucket_minutes`,
+        # when enabled, see `src.serving.velocity`.
+        self.velocity_windows = (1, 6, 24)
+        self.velocity_bucket_minutes = 60
+        self.velocity_capacity = 500_000  # Accounts kept by the online store.
+        self.velocity_store_path = self.dir / 'velocity_store.pkl'
         self.__create_all_dirs()
 
     def __create_all_dirs(self):
@@ -33,6 +74,11 @@ class DataValidationConfig(DataIngestionConfig):
         self.reports_dir = self.root / 'reports'
         self.drift_report_path = self.reports_dir / 'drift_report.yaml'
         self.missing_threshold = 0.6
+        self.drift_n_jobs = None  # Worker processes for drift checks, None for all CPUs.
+        self.drift_parallel_min_rows = 200_000
+        # Compare against a sketch profile of the base data instead of its raw rows.
+        self.use_reference_profile = True
+        self.profile_path = self.dir / 'reference_profile.json'
         self.__create_all_dirs()
 
     def __create_all_dirs(self):
@@ -40,19 +86,44 @@ class DataValidationConfig(DataIngestionConfig):
         self.reports_dir.mkdir(exist_ok=True)
 
 
+class DataGraphConfig(DataIngestionConfig):
+    def __init__(self):
+        super().__init__()
+        self.dir = self.artifact_dir / 'data_graph'
+        self.train_path = self.dir / 'train'
+        self.test_path = self.dir / 'test'
+        self.account_features_path = self.dir / 'account_features'
+        # Guilty account IDs with their level and type of crime.
+        self.tags_path = self.root / 'data' / 'MLtag.csv'
+        # Weight of a tagged account in the proximity features, by level of crime.
+        self.crime_level_weights = {'head': 1.0, 'colleague': 0.5}
+        self.feature_dtype = 'float32'
+        # Train rows are joined with features built from the other folds, see `DataGraph`.
+        self.train_folds = 5
+        self.__create_all_dirs()
+
+    def __create_all_dirs(self):
+        self.dir.mkdir(exist_ok=True)
+
+
 class DataTransformationConfig(DataIngestionConfig):
     def __init__(self):
         super().__init__()
         self.dir = self.artifact_dir / 'data_transformation'
         self.transformer_path = self.dir / 'transformer.pkl'
         self.target_enc_path = self.dir / 'target_encoder.pkl'
-        self.train_arr_path = self.dir / 'transformed_arrays/train.npy'
-        self.test_arr_path = self.dir / 'transformed_arrays/test.npy'
+        self.X_train_path = self.dir / 'transformed_arrays/X_train.npy'
+        self.y_train_path = self.dir / 'transformed_arrays/y_train.npy'
+        self.X_test_path = self.dir / 'transformed_arrays/X_test.npy'
+        self.y_test_path = self.dir / 'transformed_arrays/y_test.npy'
+        # Trees compare features as float32 anyway, so float32 halves the size for free.
+        self.feature_dtype = 'float32'
+        self.target_dtype = 'int32'
         self.__create_all_dirs()
 
     def __create_all_dirs(self):
         self.dir.mkdir(exist_ok=True)
-        self.train_arr_path.parent.mkdir(parents=True, exist_ok=True)
+        self.X_train_path.parent.mkdir(parents=True, exist_ok=True)
 
 
 class ModelTrainerConfig(PipelineConfig):
@@ -60,9 +131,28 @@ class ModelTrainerConfig(PipelineConfig):
         super().__init__()
         self.dir = self.artifact_dir / 'model_trainer'
         self.model_path = self.dir / 'model.pkl'
+        self.test_pred_path = self.dir / 'y_pred_test.npy'
         self.expected_training_score = 0.9  # According to project
         self.expected_testing_score = 0.88  # According to project
         self.overfitting_threshold = 0.5  # According to project
+        # Hyperparameter search with successive halving instead of a single default fit.
+        self.search = False
+        self.search_space = {
+            'n_estimators': [50, 100, 200, 400],
+            'max_depth': [None, 8, 16, 32],
+            'max_features': ['sqrt', 'log2', 0.5],
+            'min_samples_leaf': [1, 2, 4, 8],
+            'class_weight': [None, 'balanced'],
+        }
+        self.search_n_candidates = 24
+        self.search_factor = 3  # Keep 1/factor of the candidates on factor times more rows.
+        self.search_cv = 3
+        self.search_n_jobs = -1  # Worker processes for trials, -1 for all CPUs.
+        self.search_results_path = self.dir / 'search_results.csv'
+        # Incremental training: trees fitted on the new rows only are added to the current
+        # model, and the oldest trees beyond the window are retired.
+        self.incremental_n_estimators = 20
+        self.incremental_max_estimators = 200
         self.__create_all_dirs()
 
     def __create_all_dirs(self):
@@ -72,6 +162,20 @@ class ModelTrainerConfig(PipelineConfig):
 @dataclass
 class ModelEvaluationConfig:
     model_score_diff_threshold = 0.05  # According to project
+    # Serving budgets of the challenger, a budget set to None is not checked.
+    # Ratios are relative to the champion, absolute budgets apply to every model.
+    # Timings are noisy (the p99 of `benchmark_single_rows` rows), so the latency and
+    # throughput budgets are off by default. Size and memory barely vary between runs.
+    max_latency_p99_ms: float | None = None
+    max_size_mb: float | None = None
+    max_memory_mb: float | None = None
+    max_latency_ratio: float | None = None
+    max_size_ratio: float | None = 2.0
+    max_memory_ratio: float | None = 2.0
+    min_throughput_ratio: float | None = None
+    benchmark_single_rows = 200  # Test rows scored one by one for latency percentiles.
+    benchmark_repeats = 3
+    keep_saved_versions = 5  # Versions kept in `saved_models`, older ones are pruned.
 
 
 class ModelPusherConfig(PipelineConfig):
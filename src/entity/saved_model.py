@@ -1,33 +1,83 @@
-""" Saved Model Entity to track recently saved trained model. """
+"""
+Saved Model Entity to track recently saved trained model.
 
+Models are kept in a small content-addressed registry::
+
+    saved_models/
+        objects/<sha256>      Immutable files, stored once whatever the number of versions.
+        versions/<n>/<name>   Hard links (or copies) of objects, one directory per version.
+        versions/<n>/objects.json  Object of every file of the version, by name.
+        CURRENT               Name of the version served as the latest model.
+
+A version directory is assembled aside and renamed into `versions/`, and `CURRENT`
+is replaced atomically, so readers never observe a half-written version. Directories
+named by an int directly under `saved_models/` are the previous layout and are still
+read when there is no `CURRENT` pointer yet.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
 from pathlib import Path
 
 from src.core import get_logger
 
 logger = get_logger(__name__)
 saved_model_dir = Path('saved_models')
+OBJECTS_FILE = 'objects.json'
+
+
+def _file_sha256(fp: Path) -> str:
+    digest = hashlib.sha256()
+    with open(fp, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _int_dirs(path: Path) -> list[int]:
+    return [int(i.name) for i in path.iterdir() if i.is_dir() and i.name.isdigit()]
+
+
+def _version_objects(version_dir: Path) -> set[str]:
+    """Objects a version directory is made of, hashed for versions without a list."""
+    try:
+        return set(json.loads((version_dir / OBJECTS_FILE).read_text()).values())
+    except FileNotFoundError:
+        return {_file_sha256(fp) for fp in version_dir.iterdir() if fp.is_file()}
 
 
 class SavedModelConfig:
-    def __init__(self) -> None:
+    def __init__(self, keep_versions: int = 5) -> None:
+        """
+        :param keep_versions: Number of most recent versions kept when publishing,
+            the current version is never pruned.
+        """
         self.dir = saved_model_dir
-        self.dir.mkdir(exist_ok=True)
+        self.objects_dir = self.dir / 'objects'
+        self.versions_dir = self.dir / 'versions'
+        self.current_path = self.dir / 'CURRENT'
+        self.cache_dir = self.dir / 'cache'
+        self.keep_versions = keep_versions
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        self.versions_dir.mkdir(exist_ok=True)
 
         self.latest_saved_dir = self.__get_latest_saved_dir_path()
-        self.new_dir_to_save_models = self.__get_new_dir_path_to_save()
 
     def __get_latest_saved_dir_path(self) -> Path | None:
-        dir_names = [int(i.name) for i in self.dir.iterdir()]
+        try:
+            return self.versions_dir / self.current_path.read_text().strip()
+        except FileNotFoundError:
+            pass
+
+        # Previous layout, without a `CURRENT` pointer.
+        dir_names = _int_dirs(self.dir)
         if len(dir_names) == 0:
             return None
         return self.dir / str(max(dir_names))
 
-    def __get_new_dir_path_to_save(self) -> Path:
-        if self.latest_saved_dir is None:
-            return self.dir / str(0)
-        latest_dir_number = int(self.latest_saved_dir.name) + 1
-        return self.dir / str(latest_dir_number)
-
     def get_saved_models_path(self) -> tuple[Path, Path, Path]:
         latest = self.latest_saved_dir
         if latest is None:
@@ -39,13 +89,107 @@ class SavedModelConfig:
         )
 
     @property
-    def path_to_save_model(self):
-        return self.new_dir_to_save_models / 'model.pkl'
+    def bundle_path(self) -> Path | None:
+        """Single-file bundle of the latest models, see `src.serving.bundle`, if any."""
+        if self.latest_saved_dir is None:
+            return None
+        path = self.latest_saved_dir / 'bundle.bin'
+        return path if path.exists() else None
 
     @property
-    def path_to_save_transformer(self):
-        return self.new_dir_to_save_models / 'transformer.pkl'
+    def latest_profile_path(self) -> Path | None:
+        """Reference profile of the base data saved with the latest model, if any."""
+        if self.latest_saved_dir is None:
+            return None
+        path = self.latest_saved_dir / 'reference_profile.json'
+        return path if path.exists() else None
 
-    @property
-    def path_to_save_target_enc(self):
-        return self.new_dir_to_save_models / 'target_encoder.pkl'
+    def load_training_state(self) -> dict:
+        """What the latest model was trained on, see `ModelEvaluation`, empty if unknown."""
+        if self.latest_saved_dir is None:
+            return {}
+        try:
+            return json.loads((self.latest_saved_dir / 'training_state.json').read_text())
+        except FileNotFoundError:
+            return {}
+
+    def champion_cache_path(self, key: str) -> Path | None:
+        """
+        Cached evaluation of the latest model on the test data identified by `key`.
+        Caches are kept outside of the versions, which are never modified once published.
+        """
+        if self.latest_saved_dir is None:
+            return None
+        return self.cache_dir / self.latest_saved_dir.name / f'{key}.json'
+
+    def _store_object(self, fp: Path) -> Path:
+        """Copy `fp` into the object store unless an identical file is already there."""
+        obj = self.objects_dir / _file_sha256(fp)
+        if obj.exists():
+            return obj
+        # Copied rather than linked: the source artifact may be rewritten in place later.
+        fd, tmp = tempfile.mkstemp(dir=self.objects_dir, prefix='.tmp-')
+        os.close(fd)
+        shutil.copyfile(fp, tmp)
+        os.chmod(tmp, 0o444)
+        os.replace(tmp, obj)
+        return obj
+
+    def _next_version(self) -> int:
+        versions = _int_dirs(self.versions_dir) + _int_dirs(self.dir)
+        return max(versions, default=-1) + 1
+
+    def publish(self, files: dict[str, Path]) -> Path:
+        """
+        Save `files` (`{name in the version: source path}`) as a new version and make
+        it the current one.
+
+        :returns: Directory of the new version.
+        """
+        tmp_dir = Path(tempfile.mkdtemp(dir=self.versions_dir, prefix='.tmp-'))
+        try:
+            objects = {}
+            for name, fp in files.items():
+                obj = self._store_object(fp)
+                objects[name] = obj.name
+                try:
+                    os.link(obj, tmp_dir / name)
+                except OSError:  # No hard links on this filesystem.
+                    shutil.copyfile(obj, tmp_dir / name)
+            (tmp_dir / OBJECTS_FILE).write_text(json.dumps(objects, indent=2))
+
+            version_dir = self.versions_dir / str(self._next_version())
+            os.rename(tmp_dir, version_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        fd, tmp_current = tempfile.mkstemp(dir=self.dir, prefix='.CURRENT-')
+        with os.fdopen(fd, 'w') as f:
+            f.write(version_dir.name)
+        os.replace(tmp_current, self.current_path)
+        self.latest_saved_dir = version_dir
+        logger.info('Published models as version %s.', version_dir.name)
+
+        self.prune()
+        return version_dir
+
+    def prune(self) -> None:
+        """Remove all but the `keep_versions` newest versions and their unused objects."""
+        current = self.latest_saved_dir.name if self.latest_saved_dir is not None else None
+        versions = sorted(_int_dirs(self.versions_dir), reverse=True)
+        for version in versions[self.keep_versions :]:
+            if str(version) != current:
+                shutil.rmtree(self.versions_dir / str(version))
+                shutil.rmtree(self.cache_dir / str(version), ignore_errors=True)
+                logger.info('Pruned saved models version %s.', version)
+
+        # Liveness comes from the objects of the remaining versions (and of versions
+        # being published), not from link counts: versions may hold copies.
+        live = set()
+        for version_dir in self.versions_dir.iterdir():
+            if version_dir.is_dir():
+                live |= _version_objects(version_dir)
+        for obj in self.objects_dir.iterdir():
+            if not obj.name.startswith('.') and obj.name not in live:
+                obj.unlink()
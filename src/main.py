@@ -1,35 +1,95 @@
 from pathlib import Path
-from typing import Any
 
-import pandas as pd
+from src.core import metrics
+from src.core.metrics import StageProfiler
+from src.entity.config import PipelineConfig
+from src.serving.cache import model_cache
+from src.serving.predict import (  # noqa: F401
+    get_latest_models,
+    predict,
+    predict_in_chunks,
+    predict_row,
+    predict_to_csv,
+)
 
-from src.components import data, model
-from src.core import io
-from src.entity.saved_model import SavedModelConfig
 
+def start_model_training(
+    ingestion_data_path: Path | None = None,
+    in_memory: bool = False,
+    persist: bool = True,
+    profile_stage: str | None = None,
+    graph_features: bool = False,
+    velocity_features: bool = False,
+    incremental: bool = False,
+):
+    """
+    Run the training pipeline.
 
-def start_model_training(ingestion_data_path: Path | None = None):
-    ingestion = data.ingestion.DataIngestion().initiate(ingestion_data_path)
-    data.validation.DataValidation(ingestion).initiate()
-    transformation = data.transformation.DataTransformation(ingestion).initiate()
-    trainer = model.trainer.ModelTrainer().initiate()
-    model.evaluation.ModelEvaluation(ingestion, transformation, trainer).initiate()
+    :param in_memory: Carry DataFrames, arrays and fitted objects from stage to stage
+        instead of reloading them from the artifact directory. Stage artifacts are then
+        written by a background thread, they are all on disk when the function returns.
+    :param persist: Whether an in-memory run writes its stage artifacts at all.
+        The accepted model is always saved into `saved_models`.
+    :param profile_stage: Capture one stage (`ingestion`, `validation`, `graph`,
+        `transformation`, `model_training`, `evaluation` or `pipeline`) with cProfile
+        and tracemalloc, into `profiles/` of the artifact directory.
+    :param graph_features: Add the transaction graph features of `src.components.data.graph`
+        to the model inputs. They are saved with the model and joined at prediction time.
+    :param velocity_features: Add the velocity of the source account, see
+        `src.serving.velocity`. The online store saved with the model is updated with
+        every transaction scored by `predict`.
+    :param incremental: Update the saved model with the new data instead of retraining,
+        see `src.components.model.incremental`. The new data is `ingestion_data_path`, or
+        the rows of the database snapshot added since the saved model was trained. The
+        features are those of the saved model, `graph_features` and `velocity_features`
+        are ignored. Without a saved model, a new one is trained. A model trained from a
+        file has no snapshot rows to start from, so it is only updated from files.
 
+    Per-stage metrics are written to `run_report.json` in the artifact directory,
+    see `src.core.metrics`.
+    """
+    # Training, database and drift dependencies are only imported to train.
+    from src.components import data, model
+    from src.core import io
 
-def get_latest_models():
-    saved_model_config = SavedModelConfig()
-    latest_models = saved_model_config.get_saved_models_path()
+    champion = model.incremental.load_champion() if incremental else None
+    if champion is None:
+        champion = model.incremental.Champion(None, None, None)
+    else:
+        if ingestion_data_path is None and champion.snapshot_rows is None:
+            raise ValueError(
+                'The saved model was not trained from the database snapshot, so its new rows '
+                'are unknown. Pass them as "ingestion_data_path" or train a new model.'
+            )
+        graph_features = champion.account_features is not None
+        velocity_features = champion.velocity_store is not None
 
-    model = io.load_model(latest_models[0])
-    transformer = io.load_model(latest_models[1])
-    target_enc = io.load_model(latest_models[2])
-    return model, transformer, target_enc
-
-
-def predict(df: pd.DataFrame) -> tuple[pd.DataFrame, Any]:
-    model, transformer, target_enc = get_latest_models()
-    input_arr = transformer.transform(df[transformer.feature_names_in_])
-    prediction = model.predict(input_arr)
-    prediction = target_enc.inverse_transform(prediction.astype(int))
-    df['prediction'] = prediction
-    return df, prediction
+    with PipelineConfig.run() as config:
+        run_dir = config.artifact_dir
+        profiler = StageProfiler(profile_stage, run_dir / 'profiles')
+        with metrics.activate(profiler), profiler.stage('pipeline', in_memory=in_memory):
+            ingestion = data.ingestion.DataIngestion(
+                in_memory,
+                persist,
+                velocity_features,
+                champion.velocity_store,
+                champion.snapshot_rows,
+            ).initiate(ingestion_data_path)
+            validation = data.validation.DataValidation(
+                ingestion, merge_reference=champion.model is not None,
+            ).initiate()
+            if graph_features:
+                validation = data.graph.DataGraph(
+                    validation, in_memory, persist, champion.account_features,
+                ).initiate()
+            transformation = data.transformation.DataTransformation(
+                validation, in_memory, persist, champion.transformer, champion.target_enc,
+            ).initiate()
+            trainer = model.trainer.ModelTrainer(
+                transformation, in_memory, persist, champion.model,
+            ).initiate()
+            model.evaluation.ModelEvaluation(validation, transformation, trainer).initiate()
+            # Re-raises a failed background write instead of only logging it.
+            io.wait_for_persist()
+        profiler.write_report(run_dir / 'run_report.json')
+    model_cache.invalidate()
@@ -0,0 +1,135 @@
+""" Dynamic micro-batching of concurrent prediction requests. """
+
+import asyncio
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Sequence
+
+from src.core import get_logger
+
+logger = get_logger(__name__)
+
+PredictFn = Callable[[list[dict]], Sequence[Any]]
+
+
+class Histogram:
+    def __init__(self, bounds: Sequence[float]) -> None:
+        """Cumulative-free histogram, `counts[i]` holds values `<= bounds[i]`."""
+        self.bounds = list(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += 1
+        self.sum += value
+
+    def to_dict(self) -> dict:
+        buckets = {f'le_{b:g}': c for b, c in zip(self.bounds, self.counts)}
+        buckets['le_inf'] = self.counts[-1]
+        return {'count': self.total, 'sum': round(self.sum, 3), 'buckets': buckets}
+
+
+class BatcherStats:
+    def __init__(self, max_batch_size: int) -> None:
+        batch_bounds = [2**i for i in range(max_batch_size.bit_length()) if 2**i < max_batch_size]
+        self.batch_size = Histogram(batch_bounds + [max_batch_size])
+        self.queue_depth = Histogram([0, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.latency_ms = Histogram([1, 2, 5, 10, 20, 50, 100, 200, 500, 1000])
+        self.errors = 0
+
+    def to_dict(self) -> dict:
+        return {
+            'batch_size': self.batch_size.to_dict(),
+            'queue_depth_histogram': self.queue_depth.to_dict(),
+            'latency_ms': self.latency_ms.to_dict(),
+            'errors': self.errors,
+        }
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        predict_fn: PredictFn,
+        max_batch_size: int = 64,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        """
+        Coalesce concurrent requests into batches before calling `predict_fn`.
+
+        A batch is flushed when it holds `max_batch_size` rows or when its first row
+        has waited `max_wait_ms` milliseconds, whichever happens first.
+
+        :param predict_fn: Scores a list of rows and returns one result per row.
+        """
+        self.predict_fn = predict_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.stats = BatcherStats(max_batch_size)
+        self._queue: asyncio.Queue[tuple[dict, asyncio.Future, float]] = asyncio.Queue()
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    async def submit(self, row: dict) -> Any:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((row, future, time.perf_counter()))
+        return await future
+
+    async def _next_batch(self) -> list[tuple[dict, asyncio.Future, float]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    def _score(self, rows: list[dict]) -> list[Any]:
+        """Score the batch; on failure score row by row so one bad row fails alone."""
+        try:
+            return list(self.predict_fn(rows))
+        except Exception:
+            if len(rows) == 1:
+                raise
+        results = []
+        for row in rows:
+            try:
+                results.append(self.predict_fn([row])[0])
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            self.stats.queue_depth.observe(self._queue.qsize())
+            self.stats.batch_size.observe(len(batch))
+
+            rows = [row for row, _, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, self._score, rows)
+            except Exception as e:
+                results = [e] * len(batch)
+
+            now = time.perf_counter()
+            for (_, future, submitted), result in zip(batch, results):
+                self.stats.latency_ms.observe((now - submitted) * 1000)
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    self.stats.errors += 1
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
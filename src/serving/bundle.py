@@ -0,0 +1,182 @@
+"""
+Single-file bundle of the model, transformer and target encoder.
+
+Layout::
+
+    b'FRDBNDL1' | uint64 manifest length | JSON manifest | sections...
+
+Every section starts on a 64-byte boundary, its offset is relative to the first
+section. The manifest lists each section with its kind, offset, size and SHA-256:
+
+- `pickle` sections hold the dill pickled sklearn objects, the compiled predictor
+  without its arrays and the seeded velocity store, if any. They are only unpickled
+  when first used.
+- `array` sections hold the raw buffers of the compiled forest and of the account
+  feature table, if any (`dtype`, `shape`).
+  They are memory-mapped read-only, so every process on a host shares the same
+  physical pages and opening a bundle costs a single mmap.
+"""
+
+import json
+import mmap
+import os
+import struct
+import tempfile
+from hashlib import sha256
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+from src.core import get_logger, io
+from src.serving.compiled import CompiledPredictor
+from src.serving.features import AccountFeatures
+from src.serving.velocity import VelocityStore
+
+logger = get_logger(__name__)
+
+MAGIC = b'FRDBNDL1'
+ALIGN = 64
+_HEADER = struct.Struct('<8sQ')
+
+
+def _align(n: int) -> int:
+    return -(-n // ALIGN) * ALIGN
+
+
+def write_bundle(
+    fp: Path,
+    model,
+    transformer,
+    target_enc,
+    compiled: CompiledPredictor | None = None,
+    account_features: AccountFeatures | None = None,
+    velocity_store: VelocityStore | None = None,
+) -> None:
+    """
+    Write the models (and the arrays of their compiled predictor) to `fp` atomically.
+
+    :param account_features: Feature table joined onto transactions before the transform.
+    :param velocity_store: Velocity store to start scoring from.
+    """
+    sections: dict[str, tuple[dict, bytes | np.ndarray]] = {}
+    for name, obj in (('model', model), ('transformer', transformer), ('target_enc', target_enc)):
+        sections[name] = ({'kind': 'pickle'}, io.dumps_model(obj))
+    if compiled is not None:
+        arrays, rest = compiled.split_arrays()
+        sections['compiled'] = ({'kind': 'pickle'}, io.dumps_model(rest))
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            meta = {'kind': 'array', 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            sections['compiled.' + name] = (meta, array)
+    if account_features is not None:
+        columns = io.dumps_model(account_features.columns)
+        sections['account_features'] = ({'kind': 'pickle'}, columns)
+        for name in ('ids', 'values'):
+            array = np.ascontiguousarray(getattr(account_features, name))
+            meta = {'kind': 'array', 'dtype': array.dtype.str, 'shape': list(array.shape)}
+            sections['account_features.' + name] = (meta, array)
+    if velocity_store is not None:
+        sections['velocity_store'] = ({'kind': 'pickle'}, io.dumps_model(velocity_store))
+
+    manifest: dict[str, Any] = {'format': 1, 'sections': {}}
+    offset = 0
+    for name, (meta, data) in sections.items():
+        buffer = memoryview(data).cast('B')
+        meta.update(offset=offset, nbytes=buffer.nbytes, sha256=sha256(buffer).hexdigest())
+        manifest['sections'][name] = meta
+        offset = _align(offset + buffer.nbytes)
+    manifest_bytes = json.dumps(manifest).encode()
+    data_start = _align(_HEADER.size + len(manifest_bytes))
+
+    fd, tmp = tempfile.mkstemp(dir=fp.parent, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, len(manifest_bytes)))
+            f.write(manifest_bytes)
+            for name, (meta, data) in sections.items():
+                f.seek(data_start + meta['offset'])
+                f.write(memoryview(data).cast('B'))
+        # `mkstemp` creates the file readable by its owner only, serving may run as another user.
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, fp)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    logger.info('Model bundle %s written.', fp)
+
+
+class Bundle:
+    def __init__(self, fp: Path, verify: bool = False) -> None:
+        """
+        Open a bundle written by `write_bundle`.
+
+        :param verify: Check the SHA-256 of every section now. Otherwise pickles are
+            checked when they are loaded and arrays are trusted, since hashing them
+            would read every page of the file.
+        :raises ValueError: If the file is not a bundle, is truncated or a checksum does
+            not match.
+        """
+        self.fp = fp
+        with open(fp, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError(f'{fp} is not a model bundle.')
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, manifest_len = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f'{fp} is not a model bundle.')
+        self._data_start = _align(_HEADER.size + manifest_len)
+        if _HEADER.size + manifest_len > len(self._mmap):
+            raise ValueError(f'Model bundle {fp} is truncated.')
+        self.manifest = json.loads(self._mmap[_HEADER.size : _HEADER.size + manifest_len])
+        sections = self.manifest['sections'].values()
+        end = max((meta['offset'] + meta['nbytes'] for meta in sections), default=0)
+        if self._data_start + end > len(self._mmap):
+            raise ValueError(f'Model bundle {fp} is truncated.')
+        if verify:
+            for name in self.manifest['sections']:
+                self._buffer(name, verify=True)
+
+    def _buffer(self, name: str, verify: bool) -> memoryview:
+        meta = self.manifest['sections'][name]
+        start = self._data_start + meta['offset']
+        buffer = memoryview(self._mmap)[start : start + meta['nbytes']]
+        if verify and sha256(buffer).hexdigest() != meta['sha256']:
+            raise ValueError(f'Checksum mismatch of section {name!r} in {self.fp}.')
+        return buffer
+
+    def load(self, name: str) -> Any:
+        """Unpickle one of the `model`, `transformer`, `target_enc` sections."""
+        return io.loads_model(self._buffer(name, verify=True))
+
+    def array(self, name: str) -> np.ndarray:
+        """Read-only array backed by the file's pages."""
+        meta = self.manifest['sections'][name]
+        buffer = self._buffer(name, verify=False)
+        return np.frombuffer(buffer, dtype=meta['dtype']).reshape(meta['shape'])
+
+    def compiled(self) -> CompiledPredictor | None:
+        if 'compiled' not in self.manifest['sections']:
+            return None
+        prefix = 'compiled.'
+        arrays = {
+            name[len(prefix) :]: self.array(name)
+            for name in self.manifest['sections']
+            if name.startswith(prefix)
+        }
+        return CompiledPredictor.join_arrays(self.load('compiled'), arrays)
+
+    def account_features(self) -> AccountFeatures | None:
+        if 'account_features' not in self.manifest['sections']:
+            return None
+        return AccountFeatures(
+            self.array('account_features.ids'),
+            self.array('account_features.values'),
+            self.load('account_features'),
+        )
+
+    def velocity_store(self) -> VelocityStore | None:
+        """A fresh, mutable copy of the saved velocity store, if any."""
+        if 'velocity_store' not in self.manifest['sections']:
+            return None
+        return self.load('velocity_store')
@@ -0,0 +1,162 @@
+""" Resident in-process cache of the latest saved models used for prediction. """
+
+import threading
+import time
+from dataclasses import dataclass, field
+from functools import cached_property
+from pathlib import Path
+from typing import Any, Callable
+
+from src.core import get_logger, io
+from src.entity.saved_model import SavedModelConfig
+from src.serving.bundle import Bundle
+from src.serving.compiled import CompiledPredictor, compile_models
+from src.serving.features import AccountFeatures
+from src.serving.velocity import VelocityStore
+
+logger = get_logger(__name__)
+
+
+@dataclass(frozen=True)
+class ModelBundle:
+    signature: tuple
+    compiled: CompiledPredictor | None
+    # `load('model' | 'transformer' | 'target_enc')`, called on first use of each object
+    # since the compiled predictor alone is enough to score.
+    load: Callable[[str], Any] = field(repr=False)
+    # Joined onto the input before the transform when the models were trained with it.
+    account_features: AccountFeatures | None = field(default=None, repr=False)
+    # Updated with every scored transaction, until the models are swapped.
+    velocity: VelocityStore | None = field(default=None, repr=False)
+
+    @cached_property
+    def model(self) -> Any:
+        return self.load('model')
+
+    @cached_property
+    def transformer(self) -> Any:
+        return self.load('transformer')
+
+    @cached_property
+    def target_enc(self) -> Any:
+        return self.load('target_enc')
+
+    def __iter__(self):
+        yield self.model
+        yield self.transformer
+        yield self.target_enc
+
+
+@dataclass
+class CacheStats:
+    loads: int = 0
+    hits: int = 0
+    swaps: int = 0
+    checks: int = 0
+
+
+class ModelCache:
+    def __init__(self, check_interval: float = 1.0, compile: bool = True) -> None:
+        """
+        Keep the latest saved models in memory and swap them when a newer one is saved.
+
+        :param check_interval: Seconds between two checks of the `saved_models` directory.
+            Requests within the interval are served from memory without touching the disk.
+        :param compile: Also build a `CompiledPredictor` for fast single-row inference.
+        """
+        self.check_interval = check_interval
+        self.compile = compile
+        self.stats = CacheStats()
+        self._bundle: ModelBundle | None = None
+        self._checked_at = 0.0
+        # Guards the bundle, the stats and `_checking`, never held while loading.
+        self._lock = threading.Lock()
+        self._checked = threading.Condition(self._lock)
+        self._checking = False
+
+    def _signature(self) -> tuple:
+        """Cheap fingerprint of the latest saved models: paths, mtime and size."""
+        saved_models = SavedModelConfig()
+        bundle_path = saved_models.bundle_path
+        paths = saved_models.get_saved_models_path() if bundle_path is None else (bundle_path,)
+        signature = []
+        for path in paths:
+            stat = path.stat()
+            signature.append((str(path), stat.st_mtime_ns, stat.st_size))
+        return tuple(signature)
+
+    def _load(self, signature: tuple) -> ModelBundle:
+        if len(signature) == 1:
+            return self._load_bundle(signature)
+
+        model_fp, transformer_fp, target_enc_fp = (Path(i[0]) for i in signature)
+        model = io.load_model(model_fp)
+        transformer = io.load_model(transformer_fp)
+        target_enc = io.load_model(target_enc_fp)
+        compiled = compile_models(model, transformer, target_enc) if self.compile else None
+        objects = {'model': model, 'transformer': transformer, 'target_enc': target_enc}
+        bundle = ModelBundle(signature, compiled, objects.__getitem__)
+        logger.info('Models loaded into cache from %s.', model_fp.parent)
+        return bundle
+
+    def _load_bundle(self, signature: tuple) -> ModelBundle:
+        """Memory-map a bundle, the forest arrays are shared with other processes."""
+        fp = Path(signature[0][0])
+        saved = Bundle(fp)
+        compiled = saved.compiled() if self.compile else None
+        bundle = ModelBundle(
+            signature,
+            compiled,
+            saved.load,
+            saved.account_features(),
+            saved.velocity_store(),
+        )
+        logger.info('Models bundle %s mapped into cache.', fp)
+        return bundle
+
+    def get(self) -> ModelBundle:
+        with self._lock:
+            # Without a resident bundle there is nothing to serve until it is loaded.
+            while self._bundle is None and self._checking:
+                self._checked.wait()
+            bundle = self._bundle
+            if bundle is not None and (
+                # Only one thread checks the disk; the others keep serving the resident bundle.
+                self._checking or time.monotonic() - self._checked_at < self.check_interval
+            ):
+                self.stats.hits += 1
+                return bundle
+            self._checking = True
+            self.stats.checks += 1
+
+        checked_at, new_bundle = None, None
+        try:
+            signature = self._signature()
+            checked_at = time.monotonic()
+            if bundle is not None and bundle.signature == signature:
+                new_bundle = bundle
+            else:
+                new_bundle = self._load(signature)
+        finally:
+            with self._lock:
+                self._checking = False
+                self._checked.notify_all()
+                if checked_at is not None:
+                    self._checked_at = checked_at
+                if new_bundle is bundle is not None:
+                    self.stats.hits += 1
+                elif new_bundle is not None:
+                    self.stats.loads += 1
+                    if bundle is not None:
+                        self.stats.swaps += 1
+                        logger.info('Swapped cached models to %s.', Path(signature[0][0]).parent)
+                    self._bundle = new_bundle
+        return new_bundle
+
+    def invalidate(self) -> None:
+        """Force the next `get` call to check the `saved_models` directory."""
+        with self._lock:
+            self._checked_at = 0.0
+
+
+model_cache = ModelCache()
@@ -0,0 +1,259 @@
+"""
+Pandas-free "compiled" predictor for low latency inference.
+
+The fitted `ColumnTransformer` (StandardScaler + OneHotEncoder pipelines), the
+`RandomForestClassifier` and the target `LabelEncoder` are flattened into plain
+NumPy arrays. A row is then scored with a handful of vectorised array operations
+instead of going through pandas and sklearn input validation.
+
+The arithmetic mirrors sklearn exactly (float64 scaling, float32 tree inputs,
+per-tree probability normalisation summed in tree order), so the predictions are
+identical to the sklearn path.
+"""
+
+import copy
+from typing import Any, Iterable, Mapping, Sequence
+
+import numpy as np
+
+from src.core import get_logger
+
+logger = get_logger(__name__)
+
+Row = Mapping[str, Any] | Sequence[Any]
+
+
+class _Scaler:
+    def __init__(self, columns: list[int], mean: np.ndarray, scale: np.ndarray) -> None:
+        self.columns = columns
+        self.mean = mean
+        self.scale = scale
+        self.width = len(columns)
+
+    def fill(self, out: np.ndarray, rows: list[Sequence[Any]], start: int) -> None:
+        values = np.array([[row[i] for i in self.columns] for row in rows], dtype=np.float64)
+        values -= self.mean
+        values /= self.scale
+        out[:, start : start + self.width] = values
+
+    def fill_columns(self, out: np.ndarray, columns: list[np.ndarray], start: int) -> None:
+        values = np.column_stack([columns[i].astype(np.float64) for i in self.columns])
+        values -= self.mean
+        values /= self.scale
+        out[:, start : start + self.width] = values
+
+
+class _OneHot:
+    def __init__(self, columns: list[int], lookups: list[dict], ignore_unknown: bool) -> None:
+        self.columns = columns
+        self.lookups = lookups  # category -> output offset, -1 for the dropped category
+        self.ignore_unknown = ignore_unknown
+        self.width = sum(max(v for v in lookup.values()) + 1 for lookup in lookups)
+
+    def fill(self, out: np.ndarray, rows: list[Sequence[Any]], start: int) -> None:
+        offset = start
+        for i, (column, lookup) in enumerate(zip(self.columns, self.lookups)):
+            for r, row in enumerate(rows):
+                position = lookup.get(row[column])
+                if position is None:
+                    if self.ignore_unknown:
+                        continue
+                    raise ValueError(
+                        f'Found unknown categories {[row[column]]} in column {i} during transform'
+                    )
+                if position >= 0:
+                    out[r, offset + position] = 1.0
+            offset += max(lookup.values()) + 1
+
+    def fill_columns(self, out: np.ndarray, columns: list[np.ndarray], start: int) -> None:
+        offset = start
+        for i, (column, lookup) in enumerate(zip(self.columns, self.lookups)):
+            values = columns[column]
+            # -2 marks unknown categories, -1 the dropped one.
+            positions = np.fromiter(
+                (lookup.get(v, -2) for v in values), dtype=np.intp, count=len(values),
+            )
+            unknown = positions == -2
+            if unknown.any() and not self.ignore_unknown:
+                raise ValueError(
+                    f'Found unknown categories {list(values[unknown][:1])} '
+                    f'in column {i} during transform'
+                )
+            rows = np.flatnonzero(positions >= 0)
+            out[rows, offset + positions[rows]] = 1.0
+            offset += max(lookup.values()) + 1
+
+
+class CompiledPredictor:
+    # Forest buffers, the bulk of the predictor, see `split_arrays`.
+    ARRAYS = ('roots', 'left', 'right', 'feature', 'threshold', 'leaf_proba')
+
+    def __init__(self, model, transformer, target_enc) -> None:
+        """
+        Flatten fitted sklearn objects into NumPy arrays.
+
+        :raises NotImplementedError: If the objects use steps that cannot be compiled.
+        """
+        self.feature_names: list[str] = [str(i) for i in transformer.feature_names_in_]
+        self._steps = self._compile_transformer(transformer)
+        self.n_features = sum(step.width for step in self._steps)
+        self._compile_forest(model)
+        self.labels = np.asarray(target_enc.classes_)[model.classes_.astype(int)]
+
+    def _compile_transformer(self, transformer) -> list[_Scaler | _OneHot]:
+        from sklearn.pipeline import Pipeline
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        index = {name: i for i, name in enumerate(self.feature_names)}
+        steps = []
+        for name, estimator, columns in transformer.transformers_:
+            if estimator == 'drop' or len(columns) == 0:
+                continue
+            if isinstance(estimator, Pipeline):
+                if len(estimator.steps) != 1:
+                    raise NotImplementedError(f'Pipeline {name!r} must have a single step.')
+                estimator = estimator.steps[0][1]
+            col_idx = [index[c] for c in columns]
+
+            if isinstance(estimator, StandardScaler):
+                n = len(col_idx)
+                mean = estimator.mean_ if estimator.mean_ is not None else np.zeros(n)
+                scale = estimator.scale_ if estimator.scale_ is not None else np.ones(n)
+                steps.append(_Scaler(col_idx, mean.astype(np.float64), scale.astype(np.float64)))
+            elif isinstance(estimator, OneHotEncoder):
+                if any(i is not None for i in getattr(estimator, 'infrequent_categories_', [])):
+                    raise NotImplementedError('Infrequent categories are not supported.')
+                drop_idx = estimator.drop_idx_
+                lookups = []
+                for i, categories in enumerate(estimator.categories_):
+                    dropped = None if drop_idx is None else drop_idx[i]
+                    lookup = {}
+                    for j, category in enumerate(categories):
+                        if dropped is None or j < dropped:
+                            lookup[category] = j
+                        elif j == dropped:
+                            lookup[category] = -1
+                        else:
+                            lookup[category] = j - 1
+                    lookups.append(lookup)
+                ignore = estimator.handle_unknown != 'error'
+                steps.append(_OneHot(col_idx, lookups, ignore))
+            else:
+                raise NotImplementedError(f'Cannot compile {type(estimator).__name__}.')
+        return steps
+
+    def _compile_forest(self, model) -> None:
+        trees = [estimator.tree_ for estimator in model.estimators_]
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise NotImplementedError('Only single output forests are supported.')
+
+        node_counts = np.array([tree.node_count for tree in trees])
+        offsets = np.concatenate([[0], np.cumsum(node_counts)])
+        self.roots = offsets[:-1].astype(np.intp)
+        self.max_depth = max(tree.max_depth for tree in trees)
+
+        left, right, feature, threshold, proba = [], [], [], [], []
+        for tree, offset in zip(trees, offsets):
+            own = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
+            # Leaves point to themselves, so every row walks exactly `max_depth` steps.
+            left.append(np.where(is_leaf, own, tree.children_left + offset))
+            right.append(np.where(is_leaf, own, tree.children_right + offset))
+            feature.append(np.where(is_leaf, 0, tree.feature))
+            threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+
+            value = tree.value[:, 0, : model.n_classes_].astype(np.float64)
+            normalizer = value.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba.append(value / normalizer)
+
+        self.left = np.concatenate(left).astype(np.intp)
+        self.right = np.concatenate(right).astype(np.intp)
+        self.feature = np.concatenate(feature).astype(np.intp)
+        self.threshold = np.concatenate(threshold).astype(np.float64)
+        self.leaf_proba = np.concatenate(proba)
+
+    def split_arrays(self) -> tuple[dict[str, np.ndarray], 'CompiledPredictor']:
+        """Forest arrays and a copy of this predictor without them, for `join_arrays`."""
+        arrays = {name: getattr(self, name) for name in self.ARRAYS}
+        rest = copy.copy(self)
+        for name in self.ARRAYS:
+            setattr(rest, name, None)
+        return arrays, rest
+
+    @classmethod
+    def join_arrays(
+        cls,
+        rest: 'CompiledPredictor',
+        arrays: dict[str, np.ndarray],
+    ) -> 'CompiledPredictor':
+        """Inverse of `split_arrays`, the arrays are used as they are (e.g. memory-mapped)."""
+        for name in cls.ARRAYS:
+            setattr(rest, name, arrays[name])
+        return rest
+
+    def _as_sequences(self, rows: Iterable[Row]) -> list[Sequence[Any]]:
+        return [
+            [row[name] for name in self.feature_names] if isinstance(row, Mapping) else row
+            for row in rows
+        ]
+
+    def transform_columns(self, columns: Mapping[str, Any]) -> np.ndarray:
+        """Column-wise transform of e.g. a DataFrame, without a Python loop per row."""
+        arrays = [np.asarray(columns[name]) for name in self.feature_names]
+        out = np.zeros((len(arrays[0]), self.n_features), dtype=np.float64)
+        start = 0
+        for step in self._steps:
+            step.fill_columns(out, arrays, start)
+            start += step.width
+        return out
+
+    def transform(self, rows: Iterable[Row]) -> np.ndarray:
+        rows = self._as_sequences(rows)
+        out = np.zeros((len(rows), self.n_features), dtype=np.float64)
+        start = 0
+        for step in self._steps:
+            step.fill(out, rows, start)
+            start += step.width
+        return out
+
+    def predict_proba_transformed(self, X: np.ndarray) -> np.ndarray:
+        # sklearn trees compare float32 inputs against float64 thresholds.
+        X = np.asarray(X, dtype=np.float32)
+        rows = np.arange(X.shape[0])[:, np.newaxis]
+        nodes = np.broadcast_to(self.roots, (X.shape[0], len(self.roots))).copy()
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        # Sum over trees in tree order (axis 0), like sklearn's accumulation.
+        proba = self.leaf_proba[nodes.T].sum(axis=0)
+        proba /= len(self.roots)
+        return proba
+
+    def predict_transformed(self, X, batch_size: int = 4096) -> np.ndarray:
+        """Labels of an already transformed (dense or sparse) matrix, in batches of rows."""
+        labels = np.empty(X.shape[0], dtype=self.labels.dtype)
+        for start in range(0, X.shape[0], batch_size):
+            batch = X[start : start + batch_size]
+            if hasattr(batch, 'toarray'):
+                batch = batch.toarray()
+            proba = self.predict_proba_transformed(batch)
+            labels[start : start + batch_size] = self.labels[np.argmax(proba, axis=1)]
+        return labels
+
+    def predict(self, rows: Iterable[Row]) -> np.ndarray:
+        proba = self.predict_proba_transformed(self.transform(rows))
+        return self.labels[np.argmax(proba, axis=1)]
+
+    def predict_one(self, row: Row) -> Any:
+        return self.predict([row])[0]
+
+
+def compile_models(model, transformer, target_enc) -> CompiledPredictor | None:
+    """Compile the models, or return None if they cannot be compiled."""
+    try:
+        return CompiledPredictor(model, transformer, target_enc)
+    except (NotImplementedError, AttributeError) as e:
+        logger.warning('Models cannot be compiled, using sklearn path: %s', e)
+        return None
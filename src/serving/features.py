@@ -0,0 +1,72 @@
+"""
+Per-account features joined onto transactions by account ID.
+
+The table is computed once by a training stage (see `src.components.data.graph`) and
+saved with the model, so prediction only needs a sorted ID array and a NumPy lookup.
+"""
+
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src.core import get_logger
+
+logger = get_logger(__name__)
+
+# Transaction columns holding the account IDs, and the prefix of their joined features.
+ACCOUNT_COLUMNS = {'sourceid': 'source_', 'destinationid': 'destination_'}
+
+
+class AccountFeatures:
+    def __init__(self, ids: np.ndarray, values: np.ndarray, columns: list[str]) -> None:
+        """
+        :param ids: Sorted, unique account IDs.
+        :param values: Features of shape `(len(ids), len(columns))`, row `i` is `ids[i]`.
+        """
+        self.ids = ids
+        self.values = values
+        self.columns = columns
+
+    @property
+    def output_columns(self) -> list[str]:
+        """Columns added to a transaction by `join`."""
+        return [prefix + c for prefix in ACCOUNT_COLUMNS.values() for c in self.columns]
+
+    def lookup(self, ids) -> np.ndarray:
+        """Features of `ids`, zeros for accounts that are not in the table."""
+        ids = np.asarray(ids)
+        pos = np.searchsorted(self.ids, ids)
+        pos[pos == len(self.ids)] = 0
+        found = self.ids[pos] == ids if len(self.ids) else np.zeros(len(ids), dtype=bool)
+        out = np.zeros((len(ids), len(self.columns)), dtype=self.values.dtype)
+        out[found] = self.values[pos[found]]
+        return out
+
+    def join(self, df: pd.DataFrame) -> pd.DataFrame:
+        """`df` with the features of its source and destination accounts (replaced if any)."""
+        df = df.drop(columns=self.output_columns, errors='ignore')
+        new_cols = {}
+        for id_col, prefix in ACCOUNT_COLUMNS.items():
+            values = self.lookup(df[id_col].to_numpy())
+            for i, column in enumerate(self.columns):
+                new_cols[prefix + column] = values[:, i]
+        return df.assign(**new_cols)
+
+    def join_row(self, row: dict[str, Any]) -> dict[str, Any]:
+        row = dict(row)
+        for id_col, prefix in ACCOUNT_COLUMNS.items():
+            values = self.lookup([row[id_col]])[0]
+            row.update(zip((prefix + c for c in self.columns), values.tolist()))
+        return row
+
+    def to_frame(self) -> pd.DataFrame:
+        df = pd.DataFrame(self.values, columns=self.columns)
+        df.insert(0, 'id', self.ids)
+        return df
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> 'AccountFeatures':
+        columns = [c for c in df.columns if c != 'id']
+        values = np.column_stack([df[c].to_numpy() for c in columns])
+        return cls(df['id'].to_numpy(), values, columns)
@@ -0,0 +1,111 @@
+"""
+Inference-only entry point.
+
+Only what scoring needs is imported here: training, database and drift
+dependencies (sklearn, scipy, pymongo, dotenv) are never imported by this module.
+sklearn is only imported when a pickled model has to be loaded, i.e. for frames
+larger than `COMPILED_MAX_ROWS` or saved models without a compiled bundle.
+"""
+
+from pathlib import Path
+from typing import IO, Any, Iterator
+
+import pandas as pd
+
+from src.serving.cache import ModelBundle, model_cache
+
+# The compiled predictor walks every tree level by level in NumPy, which beats sklearn's
+# per-call overhead for a few rows but not its tree traversal for whole frames.
+COMPILED_MAX_ROWS = 256
+
+
+def get_latest_models():
+    model, transformer, target_enc = model_cache.get()
+    return model, transformer, target_enc
+
+
+def predict_features(features: pd.DataFrame, bundle: ModelBundle) -> Any:
+    """Predict `features`, already joined with the account and velocity features."""
+    if bundle.compiled is not None and len(features) <= COMPILED_MAX_ROWS:
+        # The compiled transform and (possibly memory-mapped) forest need neither sklearn
+        # nor the pickled models.
+        input_arr = bundle.compiled.transform_columns(features)
+        return bundle.compiled.predict_transformed(input_arr)
+    input_arr = bundle.transformer.transform(features[bundle.transformer.feature_names_in_])
+    prediction = bundle.model.predict(input_arr)
+    return bundle.target_enc.inverse_transform(prediction.astype(int))
+
+
+def _predict_with(df: pd.DataFrame, bundle: ModelBundle) -> tuple[pd.DataFrame, Any]:
+    # The joined account and velocity features are model inputs only, they are not returned.
+    features = df
+    if bundle.account_features is not None:
+        features = bundle.account_features.join(features)
+    if bundle.velocity is not None:
+        features = bundle.velocity.score_frame(features)
+    prediction = predict_features(features, bundle)
+    df['prediction'] = prediction
+    return df, prediction
+
+
+def predict(df: pd.DataFrame) -> tuple[pd.DataFrame, Any]:
+    return _predict_with(df, model_cache.get())
+
+
+def predict_row(row: dict) -> Any:
+    """Predict a single transaction, through the compiled fast path when available."""
+    bundle = model_cache.get()
+    if bundle.account_features is not None:
+        row = bundle.account_features.join_row(row)
+    if bundle.velocity is not None:
+        row = bundle.velocity.score_row(row)
+    if bundle.compiled is not None:
+        return bundle.compiled.predict_one(row)
+    # The row already has its account and velocity features.
+    return predict_features(pd.DataFrame([row]), bundle)[0]
+
+
+def predict_in_chunks(
+    input_: Path | str | IO,
+    chunksize: int = 100_000,
+) -> Iterator[pd.DataFrame]:
+    """
+    Lazily predict a CSV file chunk by chunk.
+
+    Only a single chunk of `chunksize` rows is in memory at a time. All chunks are
+    scored with the same models, even if a newer model is saved in between.
+
+    :returns: Iterator of chunks with the `prediction` column added.
+    """
+    bundle = model_cache.get()
+    with pd.read_csv(input_, chunksize=chunksize) as reader:
+        for chunk in reader:
+            yield _predict_with(chunk, bundle)[0]
+
+
+def predict_to_csv(
+    input_: Path | str | IO,
+    output: Path | str | IO,
+    chunksize: int = 100_000,
+) -> int:
+    """
+    Predict a CSV file and write the predictions incrementally into `output`.
+
+    The output always has a header, even for an empty input.
+
+    :returns: Number of predicted rows.
+    """
+    if isinstance(output, (str, Path)):
+        with open(output, 'w', newline='') as f:
+            return predict_to_csv(input_, f, chunksize)
+
+    n_rows, header = 0, True
+    try:
+        for chunk in predict_in_chunks(input_, chunksize):
+            chunk.to_csv(output, header=header, index=False)
+            n_rows, header = n_rows + len(chunk), False
+    except pd.errors.EmptyDataError:
+        pass
+    if header:
+        pd.DataFrame(columns=['prediction']).to_csv(output, index=False)
+    return n_rows
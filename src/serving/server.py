@@ -0,0 +1,171 @@
+"""
+Standalone HTTP scoring service with dynamic micro-batching.
+
+Usage: `python -m src.serving.server --port 8000`
+
+- `POST /predict` with a single transaction as JSON object.
+- `GET /metrics` for queue depth, batch-size and latency histograms.
+- `GET /metrics/pipeline` for the stage metrics of the latest training run, in the
+  Prometheus text format.
+- `GET /health` for liveness.
+"""
+
+import argparse
+import asyncio
+import json
+from http import HTTPStatus
+
+import pandas as pd
+
+from src.core import get_logger
+from src.core.metrics import load_latest_report, to_prometheus
+from src.serving.predict import COMPILED_MAX_ROWS, predict_features
+from src.serving.batcher import MicroBatcher
+from src.serving.cache import model_cache
+
+logger = get_logger(__name__)
+
+
+def predict_rows(rows: list[dict]) -> list:
+    """
+    Score a batch of rows. The rows are only added to the velocity store once the whole
+    batch is scored, as `MicroBatcher` scores a failed batch again row by row.
+    """
+    bundle = model_cache.get()
+    if bundle.account_features is not None:
+        rows = [bundle.account_features.join_row(row) for row in rows]
+    if bundle.velocity is not None:
+        rows = bundle.velocity.score_rows(rows, update=False)
+    if bundle.compiled is not None and len(rows) <= COMPILED_MAX_ROWS:
+        prediction = bundle.compiled.predict(rows).tolist()
+    else:
+        prediction = predict_features(pd.DataFrame(rows), bundle).tolist()
+    if bundle.velocity is not None:
+        bundle.velocity.add_rows(rows)
+    return prediction
+
+
+class ScoringServer:
+    def __init__(self, batcher: MicroBatcher) -> None:
+        self.batcher = batcher
+        self.requests = 0
+
+    async def _route(
+        self,
+        method: str,
+        target: str,
+        body: bytes,
+    ) -> tuple[HTTPStatus, dict | str]:
+        path = target.split('?', 1)[0]
+        if method == 'GET' and path == '/health':
+            return HTTPStatus.OK, {'status': 'ok'}
+        if method == 'GET' and path == '/metrics':
+            return HTTPStatus.OK, self.metrics()
+        if method == 'GET' and path == '/metrics/pipeline':
+            report = load_latest_report()
+            if report is None:
+                return HTTPStatus.NOT_FOUND, {'error': 'No training run report yet.'}
+            return HTTPStatus.OK, to_prometheus(report)
+        if path != '/predict':
+            return HTTPStatus.NOT_FOUND, {'error': f'Unknown path {path!r}.'}
+        if method != 'POST':
+            return HTTPStatus.METHOD_NOT_ALLOWED, {'error': 'Use POST for /predict.'}
+
+        try:
+            row = json.loads(body)
+        except json.JSONDecodeError as e:
+            return HTTPStatus.BAD_REQUEST, {'error': f'Invalid JSON: {e}'}
+        if not isinstance(row, dict):
+            return HTTPStatus.BAD_REQUEST, {'error': 'Expected a single transaction object.'}
+
+        self.requests += 1
+        try:
+            prediction = await self.batcher.submit(row)
+        except FileNotFoundError:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {'error': 'Model is not trained yet.'}
+        except (KeyError, ValueError) as e:
+            return HTTPStatus.UNPROCESSABLE_ENTITY, {'error': str(e)}
+        return HTTPStatus.OK, {'prediction': prediction}
+
+    def metrics(self) -> dict:
+        return {
+            'requests': self.requests,
+            'queue_depth': self.batcher.queue_depth,
+            **self.batcher.stats.to_dict(),
+            'model_cache': vars(model_cache.stats),
+        }
+
+    @staticmethod
+    def _write(
+        writer: asyncio.StreamWriter,
+        status: HTTPStatus,
+        payload: dict | str,
+        keep_alive: bool,
+    ):
+        if isinstance(payload, str):
+            body, content_type = payload.encode(), 'text/plain; version=0.0.4'
+        else:
+            body, content_type = json.dumps(payload).encode(), 'application/json'
+        head = (
+            f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: {content_type}\r\n'
+            f'Content-Length: {len(body)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        )
+        writer.write(head.encode('latin-1') + body)
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+
+                headers = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                try:
+                    status, payload = await self._route(method, target, body)
+                except Exception:
+                    # E.g. a TypeError of a badly typed value, the client still gets a response.
+                    logger.exception('Error while handling %s %s.', method, target)
+                    status, payload = HTTPStatus.INTERNAL_SERVER_ERROR, {'error': 'Internal error.'}
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self._write(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError) as e:
+            logger.warning('Dropping connection: %s', e)
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int) -> None:
+        server = await asyncio.start_server(self.handle, host, port)
+        batcher_task = asyncio.create_task(self.batcher.run())
+        logger.info('Scoring server listening on %s:%s.', host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher_task.cancel()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description='Money laundering scoring server.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=5.0)
+    args = parser.parse_args()
+
+    batcher = MicroBatcher(predict_rows, args.max_batch_size, args.max_wait_ms)
+    asyncio.run(ScoringServer(batcher).serve(args.host, args.port))
+
+
+if __name__ == '__main__':
+    main()
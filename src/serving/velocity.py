@@ -0,0 +1,352 @@
+"""
+Per-account transaction velocity.
+
+Time is cut into buckets of `bucket_minutes`. The velocity of a transaction over a
+window of `k` buckets is the number and total amount of the earlier transactions of
+its source account in the current bucket and the `k - 1` buckets before it.
+
+- `velocity_features` computes the velocity of every transaction of a history at
+  once, with sorts and prefix sums (training).
+- `VelocityStore` keeps a ring of the latest buckets of every recently active account
+  in memory and is updated as transactions are scored (serving). Scoring a
+  transaction costs O(number of buckets), whatever the number of accounts.
+
+Both give the same features as long as the transactions of an account arrive in time
+order. The store is in-process: every scoring process keeps its own, seeded with the
+training history saved with the model.
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src.core import get_logger
+
+logger = get_logger(__name__)
+
+ID_COLUMN = 'sourceid'
+AMOUNT_COLUMN = 'amountofmoney'
+DATE_COLUMN = 'date'
+
+
+def to_buckets(timestamps, bucket_minutes: int) -> np.ndarray:
+    ns = np.asarray(timestamps, dtype='datetime64[ns]').astype(np.int64)
+    return ns // (bucket_minutes * 60 * 10**9)
+
+
+def feature_columns(windows: tuple[int, ...]) -> list[str]:
+    return [f'velocity_{kind}_{k}' for k in windows for kind in ('count', 'amount')]
+
+
+def velocity_features(
+    ids: np.ndarray,
+    buckets: np.ndarray,
+    amounts: np.ndarray,
+    windows: tuple[int, ...],
+    order_by: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    Velocity of every transaction from the transactions before it.
+
+    :param order_by: Time of the transactions, finer than their bucket. Transactions
+        with the same time are taken in the given order.
+    :returns: Array of shape `(len(ids), 2 * len(windows))`, see `feature_columns`.
+    """
+    n = len(ids)
+    out = np.zeros((n, 2 * len(windows)))
+    if n == 0:
+        return out
+    order = np.lexsort((np.arange(n), buckets if order_by is None else order_by, ids))
+    ids, buckets = ids[order], buckets[order]
+    amounts = np.asarray(amounts, dtype=np.float64)[order]
+
+    # Dense account codes and a key sorted by (account, bucket) for the window starts.
+    codes = np.concatenate([[0], np.cumsum(ids[1:] != ids[:-1])])
+    low = buckets.min()
+    span = int(buckets.max() - low) + 1
+    keys = codes * span + (buckets - low)
+    position = np.arange(n)
+    cum_amounts = np.concatenate([[0.0], np.cumsum(amounts)])
+
+    features = np.empty_like(out)
+    for i, k in enumerate(windows):
+        start = codes * span + np.maximum(buckets - low - k + 1, 0)
+        first = np.searchsorted(keys, start, side='left')
+        features[:, 2 * i] = position - first
+        features[:, 2 * i + 1] = cum_amounts[position] - cum_amounts[first]
+    out[order] = features
+    return out
+
+
+def history_features(
+    df: pd.DataFrame,
+    windows: tuple[int, ...],
+    bucket_minutes: int,
+) -> np.ndarray:
+    """`velocity_features` of every transaction of a history with its date column."""
+    timestamps = df[DATE_COLUMN].to_numpy().astype('datetime64[ns]')
+    return velocity_features(
+        df[ID_COLUMN].to_numpy(),
+        to_buckets(timestamps, bucket_minutes),
+        df[AMOUNT_COLUMN].to_numpy(),
+        windows,
+        timestamps.astype(np.int64),
+    )
+
+
+class VelocityStore:
+    def __init__(
+        self,
+        windows: tuple[int, ...] = (1, 6, 24),
+        bucket_minutes: int = 60,
+        capacity: int = 500_000,
+    ) -> None:
+        """
+        :param windows: Window lengths, in buckets.
+        :param capacity: Maximum number of accounts kept. Accounts idle for longer than
+            the largest window are evicted first (losslessly), then the least recently
+            active ones.
+        """
+        self.windows = tuple(windows)
+        self.bucket_minutes = bucket_minutes
+        self.capacity = capacity
+        self.n_buckets = max(self.windows)
+        self.evictions = 0
+        # Account -> row of the arrays, from the least to the most recently active.
+        self._rows: OrderedDict[Any, int] = OrderedDict()
+        self._free: list[int] = []
+        self._latest = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros((0, self.n_buckets), dtype=np.int32)
+        self._sums = np.zeros((0, self.n_buckets), dtype=np.float64)
+        self._lock = threading.Lock()
+
+    @property
+    def columns(self) -> list[str]:
+        return feature_columns(self.windows)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __getstate__(self) -> dict:
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _slot_buckets(self, latest: np.ndarray) -> np.ndarray:
+        """Bucket held by each ring slot of accounts whose latest bucket is `latest`."""
+        slots = np.arange(self.n_buckets)
+        latest = latest[:, np.newaxis]
+        return latest - (latest - slots) % self.n_buckets
+
+    def _state_features(self, rows: np.ndarray, buckets: np.ndarray) -> np.ndarray:
+        out = np.zeros((len(rows), 2 * len(self.windows)))
+        found = np.flatnonzero(rows >= 0)
+        for start in range(0, len(found), 4096):
+            batch = found[start : start + 4096]
+            r, b = rows[batch], buckets[batch, np.newaxis]
+            slot_buckets = self._slot_buckets(self._latest[r])
+            counts, sums = self._counts[r], self._sums[r]
+            for i, k in enumerate(self.windows):
+                in_window = (slot_buckets > b - k) & (slot_buckets <= b)
+                out[batch, 2 * i] = (counts * in_window).sum(axis=1)
+                out[batch, 2 * i + 1] = (sums * in_window).sum(axis=1)
+        return out
+
+    def _evict(self, current_bucket: int) -> None:
+        # Accounts idle for longer than every window only have empty windows left.
+        while self._rows:
+            account, row = next(iter(self._rows.items()))
+            if self._latest[row] > current_bucket - self.n_buckets:
+                break
+            del self._rows[account]
+            self._free.append(row)
+
+    def _allocate(self, account) -> int:
+        if not self._free and len(self._rows) >= self.capacity:
+            _, row = self._rows.popitem(last=False)
+            self.evictions += 1
+            self._free.append(row)
+        if not self._free:
+            size = len(self._latest)
+            new_size = min(max(2 * size, 1024), self.capacity)
+            self._latest = np.resize(self._latest, new_size)
+            self._counts = np.resize(self._counts, (new_size, self.n_buckets))
+            self._sums = np.resize(self._sums, (new_size, self.n_buckets))
+            self._free.extend(range(new_size - 1, size - 1, -1))
+        row = self._free.pop()
+        self._counts[row] = 0
+        self._sums[row] = 0.0
+        self._rows[account] = row
+        return row
+
+    def _rows_of(self, ids: np.ndarray) -> np.ndarray:
+        return np.fromiter((self._rows.get(i, -1) for i in ids.tolist()), np.intp, len(ids))
+
+    def _update(self, ids: np.ndarray, buckets: np.ndarray, amounts: np.ndarray) -> None:
+        accounts, inverse = np.unique(ids, return_inverse=True)
+        if len(accounts) > self.capacity:
+            raise ValueError(f'More accounts in a batch than the capacity {self.capacity}.')
+        latest = np.full(len(accounts), np.iinfo(np.int64).min)
+        np.maximum.at(latest, inverse, buckets)
+        # Nothing of this batch can fall in the windows of accounts idle since before it.
+        self._evict(int(buckets.min()))
+
+        rows = np.empty(len(accounts), dtype=np.intp)
+        is_new = np.zeros(len(accounts), dtype=bool)
+        for i, account in enumerate(accounts.tolist()):
+            row = self._rows.get(account)
+            if row is None:
+                row, is_new[i] = self._allocate(account), True
+            else:
+                self._rows.move_to_end(account)
+            rows[i] = row
+
+        # Clear the slots of buckets that fall out of the ring of existing accounts.
+        old = rows[~is_new]
+        previous = self._latest[old]
+        latest[~is_new] = np.maximum(latest[~is_new], previous)
+        stale = self._slot_buckets(previous) != self._slot_buckets(latest[~is_new])
+        self._counts[old] *= ~stale
+        self._sums[old] *= ~stale
+        self._latest[rows] = latest
+
+        keep = buckets > latest[inverse] - self.n_buckets
+        slots = (rows[inverse[keep]], buckets[keep] % self.n_buckets)
+        np.add.at(self._counts, slots, 1)
+        np.add.at(self._sums, slots, np.asarray(amounts, dtype=np.float64)[keep])
+
+    def _score_one(self, account, bucket: int, amount: float, update: bool) -> list[float]:
+        """`score` of a single transaction, without the batch machinery."""
+        features = [0.0] * (2 * len(self.windows))
+        row = self._rows.get(account)
+        if row is not None:
+            slot_buckets = self._slot_buckets(self._latest[row : row + 1])[0]
+            for i, k in enumerate(self.windows):
+                in_window = (slot_buckets > bucket - k) & (slot_buckets <= bucket)
+                features[2 * i] = float(self._counts[row, in_window].sum())
+                features[2 * i + 1] = float(self._sums[row, in_window].sum())
+        if not update:
+            return features
+
+        self._evict(bucket)
+        row = self._rows.get(account)
+        if row is None:
+            row = self._allocate(account)
+            self._latest[row] = bucket
+        else:
+            self._rows.move_to_end(account)
+            latest = self._latest[row]
+            if bucket > latest:
+                stale = self._slot_buckets(np.array([latest])) != self._slot_buckets(
+                    np.array([bucket])
+                )
+                self._counts[row, stale[0]] = 0
+                self._sums[row, stale[0]] = 0.0
+                self._latest[row] = bucket
+        if bucket > self._latest[row] - self.n_buckets:
+            self._counts[row, bucket % self.n_buckets] += 1
+            self._sums[row, bucket % self.n_buckets] += amount
+        return features
+
+    def score(
+        self,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        amounts: np.ndarray,
+        update: bool = True,
+    ) -> np.ndarray:
+        """
+        Velocity of a batch of transactions, then add them to the store.
+
+        :returns: Array of shape `(len(ids), 2 * len(windows))`, see `columns`.
+        """
+        ids = np.asarray(ids)
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        buckets = to_buckets(timestamps, self.bucket_minutes)
+        within_batch = velocity_features(
+            ids, buckets, amounts, self.windows, timestamps.astype(np.int64),
+        )
+        with self._lock:
+            features = self._state_features(self._rows_of(ids), buckets) + within_batch
+            if update:
+                self._update(ids, buckets, amounts)
+        return features
+
+    def score_frame(self, df: pd.DataFrame, update: bool = True) -> pd.DataFrame:
+        """
+        `df` with its velocity columns.
+
+        :raises ValueError: If `df` has no date. The model was trained with the velocity
+            as of each transaction's date, so timing them now would skew its inputs.
+        """
+        if DATE_COLUMN not in df.columns or df[DATE_COLUMN].isna().any():
+            raise ValueError(f'Velocity features need the "{DATE_COLUMN}" of every transaction.')
+        timestamps = pd.to_datetime(df[DATE_COLUMN]).to_numpy()
+        features = self.score(
+            df[ID_COLUMN].to_numpy(), timestamps, df[AMOUNT_COLUMN].to_numpy(), update,
+        )
+        return df.assign(**dict(zip(self.columns, features.T)))
+
+    def score_row(self, row: dict[str, Any], update: bool = True) -> dict[str, Any]:
+        if row.get(DATE_COLUMN) is None:
+            raise ValueError(f'Velocity features need the "{DATE_COLUMN}" of the transaction.')
+        timestamp = pd.Timestamp(row[DATE_COLUMN]).to_datetime64()
+        bucket = int(to_buckets(timestamp, self.bucket_minutes))
+        with self._lock:
+            features = self._score_one(row[ID_COLUMN], bucket, row[AMOUNT_COLUMN], update)
+        return {**row, **dict(zip(self.columns, features))}
+
+    def _row_arrays(self, rows: list[dict[str, Any]]) -> tuple[np.ndarray, ...]:
+        if any(row.get(DATE_COLUMN) is None for row in rows):
+            raise ValueError(f'Velocity features need the "{DATE_COLUMN}" of every transaction.')
+        ids = np.array([row[ID_COLUMN] for row in rows])
+        timestamps = np.array(
+            [pd.Timestamp(row[DATE_COLUMN]).to_datetime64() for row in rows],
+            dtype='datetime64[ns]',
+        )
+        amounts = np.array([row[AMOUNT_COLUMN] for row in rows], dtype=np.float64)
+        return ids, timestamps, amounts
+
+    def score_rows(
+        self,
+        rows: list[dict[str, Any]],
+        update: bool = True,
+    ) -> list[dict[str, Any]]:
+        """`score_row` of a batch, the transactions of an account see the earlier ones."""
+        features = self.score(*self._row_arrays(rows), update=update)
+        return [{**row, **dict(zip(self.columns, f))} for row, f in zip(rows, features.tolist())]
+
+    def add_rows(self, rows: list[dict[str, Any]]) -> None:
+        """Add transactions scored with `score_rows(rows, update=False)` to the store."""
+        ids, timestamps, amounts = self._row_arrays(rows)
+        with self._lock:
+            self._update(ids, to_buckets(timestamps, self.bucket_minutes), amounts)
+
+    @classmethod
+    def from_history(
+        cls,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        amounts: np.ndarray,
+        chunksize: int = 1_000_000,
+        **kwargs,
+    ) -> 'VelocityStore':
+        """Store seeded with past transactions, added in time order."""
+        store = cls(**kwargs)
+        timestamps = np.asarray(timestamps, dtype='datetime64[ns]')
+        order = np.argsort(timestamps, kind='stable')
+        chunksize = min(chunksize, store.capacity)
+        amounts = np.asarray(amounts)
+        for start in range(0, len(order), chunksize):
+            part = order[start : start + chunksize]
+            buckets = to_buckets(timestamps[part], store.bucket_minutes)
+            store._update(np.asarray(ids)[part], buckets, amounts[part])
+        logger.info('Velocity store seeded with %s account(s).', len(store))
+        return store
@@ -0,0 +1,30 @@
+import shutil
+from pathlib import Path
+
+import pytest
+
+from src.core import logger
+
+REPO_DIR = Path(__file__).resolve().parents[1]
+SCHEMA_PATH = Path('src/database/schema.json')
+BASE_DATA_PATH = REPO_DIR / 'data' / 'base_data.csv'
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch) -> Path:
+    """Empty working directory with the schema, for artifacts and saved models."""
+    (tmp_path / SCHEMA_PATH.parent).mkdir(parents=True)
+    shutil.copyfile(REPO_DIR / SCHEMA_PATH, tmp_path / SCHEMA_PATH)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture(autouse=True)
+def log_file(tmp_path, monkeypatch) -> Path:
+    """Log records of the test go to its temporary directory, not to the repository."""
+    path = tmp_path / 'logs.jsonl'
+    # The writer picks up `LOG_FILE` when it starts, on the next record.
+    logger._stop_listener()
+    monkeypatch.setenv('LOG_FILE', str(path))
+    yield path
+    logger._stop_listener()
@@ -0,0 +1,73 @@
+import os
+import stat
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.entity.saved_model import SavedModelConfig
+from src.main import start_model_training
+from src.serving.bundle import Bundle, write_bundle
+from tests.conftest import BASE_DATA_PATH
+
+NAMES = ('model', 'transformer', 'target_enc')
+ROW = {
+    'sourceid': 30105,
+    'destinationid': 8692,
+    'amountofmoney': 494528,
+    'month': 5,
+    'typeofaction': 'cash-in',
+    'typeoffraud': 'type1',
+}
+
+
+@pytest.fixture
+def bundle_path(workdir):
+    start_model_training(BASE_DATA_PATH)
+    saved = Bundle(SavedModelConfig().bundle_path)
+    fp = workdir / 'bundle.bin'
+    write_bundle(fp, *(saved.load(name) for name in NAMES), compiled=saved.compiled())
+    return fp
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_round_trip(bundle_path):
+    assert stat.S_IMODE(os.stat(bundle_path).st_mode) == 0o644
+
+    bundle = Bundle(bundle_path, verify=True)
+    model, transformer, target_enc = (bundle.load(name) for name in NAMES)
+    X = transformer.transform(pd.DataFrame([ROW])[transformer.feature_names_in_])
+    expected = target_enc.inverse_transform(model.predict(X).astype(int))
+
+    compiled = bundle.compiled()
+    assert not compiled.left.flags.writeable
+    np.testing.assert_array_equal(compiled.predict([ROW]), expected)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_checksum_mismatch(bundle_path):
+    bundle = Bundle(bundle_path)
+    meta = bundle.manifest['sections']['model']
+    offset = bundle._data_start + meta['offset'] + meta['nbytes'] // 2
+    del bundle
+    with open(bundle_path, 'r+b') as f:
+        f.seek(offset)
+        byte = f.read(1)
+        f.seek(offset)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    with pytest.raises(ValueError, match="Checksum mismatch of section 'model'"):
+        Bundle(bundle_path, verify=True)
+    bundle = Bundle(bundle_path)
+    assert bundle.load('transformer') is not None
+    with pytest.raises(ValueError, match='Checksum mismatch'):
+        bundle.load('model')
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.parametrize('size', [0, 4, 100, -1])
+def test_truncated_file(bundle_path, size):
+    size = size if size >= 0 else bundle_path.stat().st_size - 1
+    os.truncate(bundle_path, size)
+    with pytest.raises(ValueError, match='not a model bundle|truncated'):
+        Bundle(bundle_path)
@@ -0,0 +1,26 @@
+import threading
+
+import pytest
+
+from src.main import start_model_training
+from src.serving.cache import ModelCache
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_stats_count_every_get(workdir):
+    start_model_training(BASE_DATA_PATH)
+    cache = ModelCache(check_interval=0.0005)
+
+    def get_many():
+        for _ in range(5_000):
+            cache.get()
+
+    threads = [threading.Thread(target=get_many) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Every call is a hit, except the one which loaded the models.
+    assert cache.stats.loads == 1
+    assert cache.stats.hits == 8 * 5_000 - 1
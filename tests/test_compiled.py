@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+from src.core import io
+from src.main import start_model_training
+from src.serving.cache import ModelCache
+from src.serving.compiled import CompiledPredictor
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_compiled_forest_matches_sklearn(workdir):
+    start_model_training(BASE_DATA_PATH)
+    bundle = ModelCache().get()
+    model, transformer, target_enc = bundle
+    df = io.load_frame(next(workdir.glob('artifacts/*/data_ingestion/train')))
+    df = df[transformer.feature_names_in_]
+
+    expected = model.predict_proba(transformer.transform(df))
+    labels = target_enc.inverse_transform(model.predict(transformer.transform(df)).astype(int))
+    for compiled in (bundle.compiled, CompiledPredictor(model, transformer, target_enc)):
+        proba = compiled.predict_proba_transformed(compiled.transform_columns(df))
+        np.testing.assert_array_equal(proba, expected)
+        np.testing.assert_array_equal(compiled.predict(df.to_dict('records')), labels)
@@ -0,0 +1,22 @@
+from datetime import datetime, timedelta
+
+from src.entity.config import DataIngestionConfig, ModelTrainerConfig, PipelineConfig
+
+
+class _Clock:
+    """`datetime` whose `now` moves a minute forward on every call."""
+
+    current = datetime(2024, 1, 1, 12, 59, 59)
+
+    @classmethod
+    def now(cls) -> datetime:
+        cls.current += timedelta(minutes=1)
+        return cls.current
+
+
+def test_run_shares_one_artifact_dir(workdir, monkeypatch):
+    monkeypatch.setattr('src.entity.config.datetime', _Clock)
+    with PipelineConfig.run() as config:
+        assert DataIngestionConfig().artifact_dir == config.artifact_dir
+        assert ModelTrainerConfig().artifact_dir == config.artifact_dir
+    assert PipelineConfig().artifact_dir != config.artifact_dir
@@ -0,0 +1,30 @@
+import pytest
+
+from src.components.model.evaluation import ModelEvaluation
+from src.entity.saved_model import SavedModelConfig
+from src.main import start_model_training
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_train_without_velocity_after_velocity_model(workdir, in_memory):
+    start_model_training(BASE_DATA_PATH, in_memory=in_memory, velocity_features=True)
+    assert SavedModelConfig().latest_saved_dir is not None
+
+    # The saved model is scored with its own velocity features, not a KeyError.
+    start_model_training(BASE_DATA_PATH, in_memory=in_memory)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_cached_champion_is_not_loaded(workdir, monkeypatch):
+    start_model_training(BASE_DATA_PATH)
+    start_model_training(BASE_DATA_PATH)
+    cached = list(workdir.glob('saved_models/cache/*/*.json'))
+    assert len(cached) == 1
+
+    def score_champion(self, test_df):
+        raise AssertionError('The saved model is evaluated again.')
+
+    monkeypatch.setattr(ModelEvaluation, '_score_champion', score_champion)
+    start_model_training(BASE_DATA_PATH)
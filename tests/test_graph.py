@@ -0,0 +1,34 @@
+import shutil
+
+import pandas as pd
+import pytest
+
+from src.components.data.graph import DataGraph
+from src.entity.saved_model import SavedModelConfig
+from src.main import start_model_training
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.fixture
+def graph_workdir(workdir):
+    (workdir / 'data').mkdir()
+    shutil.copyfile(BASE_DATA_PATH.with_name('MLtag.csv'), workdir / 'data' / 'MLtag.csv')
+    return workdir
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+@pytest.mark.parametrize('in_memory', [False, True])
+def test_graph_features_pass_quality_gate(graph_workdir, in_memory):
+    # `ModelTrainer._check_model_fitting` raises if the scores are below the expected ones.
+    start_model_training(BASE_DATA_PATH, in_memory=in_memory, graph_features=True)
+    assert SavedModelConfig().latest_saved_dir is not None
+
+
+def test_train_rows_do_not_see_their_own_edges(graph_workdir):
+    df = pd.read_csv(BASE_DATA_PATH)
+    joined = DataGraph(None)._join_out_of_fold(df, None)
+
+    # An account sending a single transaction has no out-going edge in the other folds.
+    single = df['sourceid'].map(df['sourceid'].value_counts()) == 1
+    assert single.any()
+    assert (joined.loc[single, 'source_out_degree'] == 0).all()
@@ -0,0 +1,74 @@
+import pandas as pd
+import pytest
+
+from src.components.data.profile import ReferenceProfile
+from src.components.model.incremental import load_champion
+from src.core import io
+from src.main import start_model_training
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.fixture
+def split_data(workdir):
+    """Base data as history and a tail of new, non-fraud rows only."""
+    df = pd.read_csv(BASE_DATA_PATH)
+    df.iloc[:-340].to_csv(workdir / 'history.csv', index=False)
+    df.iloc[-340:].to_csv(workdir / 'delta.csv', index=False)
+    return workdir / 'history.csv', workdir / 'delta.csv'
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_incremental_update_without_every_class_is_skipped(split_data):
+    history, delta = split_data
+    start_model_training(history)
+    n_trees = len(load_champion().model.estimators_)
+
+    start_model_training(delta, incremental=True)
+    assert len(load_champion().model.estimators_) == n_trees
+
+
+def test_incremental_update_from_database_needs_snapshot_rows(split_data):
+    history, _ = split_data
+    start_model_training(history)
+
+    with pytest.raises(ValueError, match='new rows are unknown'):
+        start_model_training(incremental=True)
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_incremental_update_reads_new_snapshot_rows_only(workdir, monkeypatch):
+    df = pd.read_csv(BASE_DATA_PATH).sample(frac=1, random_state=0, ignore_index=True)
+    # One document per second, as ObjectIds in hex.
+    df['_id'] = [f'{1_700_000_000 + i:08x}{0:016x}' for i in range(len(df))]
+    documents = [df.iloc[:1800]]
+
+    def fetch(after_id=None, with_id=False):
+        new = documents[-1]
+        return new[new['_id'] > after_id] if after_id is not None else new
+
+    def count(up_to_id=None):
+        return int((documents[-1]['_id'] <= up_to_id).sum())
+
+    monkeypatch.setattr('src.components.data.ingestion.from_mongodb_to_dataframe', fetch)
+    monkeypatch.setattr('src.components.data.ingestion.count_documents', count)
+    start_model_training()
+    assert load_champion().snapshot_rows == 1800
+
+    documents.append(df)
+    start_model_training(incremental=True)
+    base_paths = workdir.glob('artifacts/*/data_ingestion/base')
+    base_path = max(base_paths, key=lambda path: path.stat().st_mtime)
+    assert len(io.load_frame(base_path)) == len(df) - 1800
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_incremental_update_merges_reference_profile(split_data, workdir):
+    history, delta = split_data
+    start_model_training(history)
+    start_model_training(delta, incremental=True)
+
+    profile_paths = workdir.glob('artifacts/*/data_validation/reference_profile.json')
+    profile_path = max(profile_paths, key=lambda path: path.stat().st_mtime)
+    profile = ReferenceProfile.load(profile_path)
+    rows = len(pd.read_csv(BASE_DATA_PATH))
+    assert all(col.rows == rows for col in profile.columns.values())
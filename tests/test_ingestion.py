@@ -0,0 +1,96 @@
+import pandas as pd
+import pytest
+
+from src.components.data.ingestion import DataIngestion
+from src.core import io
+from src.database import from_mongodb_to_dataframe, iter_mongodb_dataframes
+
+
+@pytest.fixture
+def collection(workdir, monkeypatch) -> list[dict]:
+    """Documents of a fake `base_data` collection, with ObjectIds in hex."""
+    documents = []
+
+    def fetch(after_id=None, with_id=False):
+        df = pd.DataFrame(documents)
+        if after_id is not None:
+            df = df[df['_id'] > after_id]
+        # Like the database reader, columns without any value are not returned.
+        return df.dropna(axis=1, how='all').reset_index(drop=True)
+
+    def count(up_to_id=None):
+        return sum(doc['_id'] <= up_to_id for doc in documents)
+
+    monkeypatch.setattr('src.components.data.ingestion.from_mongodb_to_dataframe', fetch)
+    monkeypatch.setattr('src.components.data.ingestion.count_documents', count)
+    return documents
+
+
+def document(seconds: int, counter: int, **values) -> dict:
+    return {
+        '_id': f'{seconds:08x}{counter:016x}',
+        'sourceid': counter,
+        'typeofaction': 'cash-in',
+        'amountofmoney': 1.0,
+        'date': pd.Timestamp('2020-01-01'),
+        **values,
+    }
+
+
+def test_snapshot_refresh(collection):
+    ingestion = DataIngestion()
+    collection += [document(100, 5), document(101, 9)]
+    ingestion._refresh_snapshot()
+
+    # Another writer's document of the same second has a lower ObjectId.
+    collection += [document(101, 1, typeofaction=None), document(102, 1, typeofaction=None)]
+    ingestion._refresh_snapshot()
+    ingestion._refresh_snapshot()
+    snapshot = io.load_frame(ingestion.snapshot_dir)
+    assert sorted(snapshot['sourceid']) == [1, 1, 5, 9]
+    assert snapshot['typeofaction'].isna().sum() == 2
+
+    # Documents arriving later than the overlap, or deleted, rebuild the snapshot.
+    collection.append(document(50, 2))
+    ingestion._refresh_snapshot()
+    assert sorted(io.load_frame(ingestion.snapshot_dir)['sourceid']) == [1, 1, 2, 5, 9]
+    collection.pop(0)
+    ingestion._refresh_snapshot()
+    assert sorted(io.load_frame(ingestion.snapshot_dir)['sourceid']) == [1, 1, 2, 9]
+
+
+class _Collection:
+    """Collection whose `find` cursor counts the documents read from it."""
+
+    def __init__(self, documents: list[dict]) -> None:
+        self.documents = documents
+        self.read = 0
+
+    def find(self, query, projection, batch_size):
+        for doc in self.documents:
+            self.read += 1
+            yield {col: value for col, value in doc.items() if projection.get(col)}
+
+
+def test_database_streaming(workdir):
+    documents = [document(100, i) for i in range(10)]
+    documents[0]['isfraud'] = 1
+    collection = _Collection(documents)
+    chunks = iter_mongodb_dataframes(4, collection)
+
+    assert len(next(chunks)) == 4
+    assert collection.read == 4
+    chunks = [*chunks]
+    assert [len(chunk) for chunk in chunks] == [4, 2]
+    assert all('isfraud' in chunk.columns for chunk in chunks)
+
+    df = pd.concat([next(iter_mongodb_dataframes(4, collection)), *chunks], ignore_index=True)
+    pd.testing.assert_frame_equal(df, from_mongodb_to_dataframe(_Collection(documents)))
+
+
+@pytest.mark.parametrize('snapshot_offset', [None, 2])
+def test_empty_database_fails_clearly(collection, snapshot_offset):
+    if snapshot_offset:
+        collection += [document(100, 5), document(101, 9)]
+    with pytest.raises(ValueError, match='Ingested dataset is empty'):
+        DataIngestion(snapshot_offset=snapshot_offset).initiate()
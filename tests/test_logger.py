@@ -0,0 +1,30 @@
+import json
+import os
+from uuid import uuid4
+
+from src.core import logger as logger_module
+from src.core.logger import get_logger
+
+
+def _messages(path) -> list[str]:
+    with open(path) as f:
+        return [json.loads(line)['msg'] for line in f]
+
+
+def test_forked_worker_records_are_written(tmp_path, monkeypatch, log_file):
+    logger = get_logger(__name__)
+    parent, child = f'parent {uuid4()}', f'child {uuid4()}'
+    logger.info(parent)
+
+    pid = os.fork()
+    if pid == 0:
+        # Like a process pool worker: no atexit handlers run.
+        monkeypatch.chdir(tmp_path.parent)
+        logger.info(child)
+        os._exit(0)
+    os.waitpid(pid, 0)
+    logger_module._stop_listener()
+
+    messages = _messages(log_file)
+    assert parent in messages
+    assert child in messages
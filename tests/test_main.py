@@ -0,0 +1,26 @@
+import pytest
+
+from src.core import io
+from src.main import start_model_training
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_in_memory_artifacts_are_on_disk_on_return(workdir):
+    start_model_training(BASE_DATA_PATH, in_memory=True)
+
+    run_dir = next(workdir.glob('artifacts/*'))
+    assert io.frame_exists(run_dir / 'data_ingestion' / 'train')
+    assert io.frame_exists(run_dir / 'data_ingestion' / 'test')
+    assert list(run_dir.glob('data_transformation/**/*.npy'))
+    assert list(run_dir.glob('model_trainer/*.pkl'))
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_failed_background_write_fails_the_run(workdir, monkeypatch):
+    def dump_frame(*args):
+        raise OSError('No space left on device.')
+
+    monkeypatch.setattr(io, 'dump_frame', dump_frame)
+    with pytest.raises(OSError, match='No space left'):
+        start_model_training(BASE_DATA_PATH, in_memory=True)
@@ -0,0 +1,73 @@
+import pandas as pd
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure
+
+from src.database.mongodb import LOAD_ID_FIELD, ROW_FIELD, dump_data_to_mongodb
+
+
+class _Collection:
+    """
+    In-memory collection with the unique index on the load and row of a document.
+
+    :param lost_acks: Number of `insert_many` calls whose documents are inserted, but
+        which then fail as if the connection dropped before the reply.
+    """
+
+    def __init__(self, lost_acks: int = 0) -> None:
+        self.documents: dict[tuple, dict] = {}
+        self.lost_acks = lost_acks
+        self.indexes = []
+
+    def create_index(self, keys, **kwargs) -> None:
+        self.indexes.append((keys, kwargs))
+
+    def insert_many(self, docs: list[dict], ordered: bool = True) -> None:
+        errors = []
+        for index, doc in enumerate(docs):
+            doc.setdefault('_id', ObjectId())
+            key = (doc[LOAD_ID_FIELD], doc[ROW_FIELD])
+            if key in self.documents:
+                errors.append({'index': index, 'code': 11000})
+            else:
+                self.documents[key] = dict(doc)
+        if self.lost_acks:
+            self.lost_acks -= 1
+            raise ConnectionFailure('Connection reset.')
+        if errors:
+            raise BulkWriteError({'nInserted': len(docs) - len(errors), 'writeErrors': errors})
+
+
+def _frame(start: int, rows: int) -> pd.DataFrame:
+    return pd.DataFrame({'sourceid': range(start, start + rows), 'amountofmoney': 1.0})
+
+
+def test_back_to_back_loads_insert_every_row():
+    collection = _Collection()
+    first = dump_data_to_mongodb(_frame(0, 5), chunk_size=2, collection=collection)
+    second = dump_data_to_mongodb(_frame(5, 5), chunk_size=2, collection=collection)
+
+    assert (first.inserted, second.inserted) == (5, 5)
+    assert second.duplicates == 0
+    assert first.load_id != second.load_id
+    assert sorted(doc['sourceid'] for doc in collection.documents.values()) == [*range(10)]
+
+
+def test_resumed_load_inserts_every_row_once():
+    df = _frame(0, 6)
+    # Each chunk is inserted by its first attempt, the lost replies exhaust the retries.
+    collection = _Collection(lost_acks=3)
+    report = dump_data_to_mongodb(
+        df, chunk_size=3, max_workers=1, max_retries=2, collection=collection,
+    )
+    assert report.failed_rows == [0]
+
+    resumed = dump_data_to_mongodb(
+        df,
+        chunk_size=3,
+        chunk_rows=report.failed_rows,
+        collection=collection,
+        load_id=report.load_id,
+    )
+    assert resumed.failed_rows == []
+    assert (resumed.inserted, resumed.duplicates) == (0, 3)
+    assert sorted(doc['sourceid'] for doc in collection.documents.values()) == [*range(6)]
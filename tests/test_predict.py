@@ -0,0 +1,25 @@
+import io
+
+import pandas as pd
+import pytest
+
+from src.main import start_model_training
+from src.serving.predict import predict_to_csv
+from tests.conftest import BASE_DATA_PATH
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_predict_to_csv_writes_header_of_empty_input(workdir):
+    start_model_training(BASE_DATA_PATH)
+    df = pd.read_csv(BASE_DATA_PATH, nrows=3)
+    df['month'] = pd.to_datetime(df.pop('date')).dt.month
+
+    header_only, empty = io.StringIO(df.head(0).to_csv(index=False)), io.StringIO('')
+    for input_, header in ((header_only, [*df.columns, 'prediction']), (empty, ['prediction'])):
+        output = io.StringIO()
+        assert predict_to_csv(input_, output) == 0
+        assert output.getvalue().splitlines() == [','.join(header)]
+
+    output = io.StringIO()
+    assert predict_to_csv(io.StringIO(df.to_csv(index=False)), output, chunksize=1) == 3
+    assert len(output.getvalue().splitlines()) == 4
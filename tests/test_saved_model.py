@@ -0,0 +1,28 @@
+import os
+
+import pytest
+
+from src.entity.saved_model import SavedModelConfig
+
+
+def _no_link(src, dst):
+    raise OSError('Hard links are not supported.')
+
+
+@pytest.mark.parametrize('hard_links', [True, False])
+def test_prune_keeps_objects_of_kept_versions(workdir, monkeypatch, hard_links):
+    if not hard_links:
+        monkeypatch.setattr(os, 'link', _no_link)
+    saved_models = SavedModelConfig(keep_versions=2)
+    (workdir / 'transformer.pkl').write_text('transformer')
+    for i in range(4):
+        (workdir / 'model.pkl').write_text(f'model {i}')
+        saved_models.publish({
+            'model.pkl': workdir / 'model.pkl',
+            'transformer.pkl': workdir / 'transformer.pkl',
+        })
+
+    assert sorted(os.listdir(saved_models.versions_dir)) == ['2', '3']
+    # The models of both kept versions and the transformer they share.
+    assert len(os.listdir(saved_models.objects_dir)) == 3
+    assert (saved_models.latest_saved_dir / 'model.pkl').read_text() == 'model 3'
@@ -0,0 +1,110 @@
+import asyncio
+import json
+import time
+
+from src.serving.batcher import MicroBatcher
+from src.serving.server import ScoringServer
+
+
+def predict_fn(rows: list[dict]) -> list:
+    """Echo each row's `id`, fail the whole batch if any row is `bad`."""
+    for row in rows:
+        if row.get('bad'):
+            raise ValueError(f'Bad row {row["id"]}.')
+    return [row['id'] * 10 for row in rows]
+
+
+async def _submit_all(batcher: MicroBatcher, rows: list[dict]) -> list:
+    task = asyncio.create_task(batcher.run())
+    try:
+        return await asyncio.gather(*(batcher.submit(row) for row in rows), return_exceptions=True)
+    finally:
+        task.cancel()
+
+
+def test_results_keep_request_order():
+    batcher = MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=50)
+    results = asyncio.run(_submit_all(batcher, [{'id': i} for i in range(20)]))
+
+    assert results == [i * 10 for i in range(20)]
+    assert batcher.stats.batch_size.total == 3
+    assert batcher.stats.batch_size.sum == 20
+
+
+def test_partial_batch_is_flushed_after_max_wait():
+    batcher = MicroBatcher(predict_fn, max_batch_size=64, max_wait_ms=20)
+    started = time.perf_counter()
+    results = asyncio.run(_submit_all(batcher, [{'id': i} for i in range(3)]))
+
+    assert results == [0, 10, 20]
+    assert batcher.stats.batch_size.total == 1
+    # Flushed once the first row waited 20 ms, not when 64 rows arrived.
+    assert time.perf_counter() - started < 1
+
+
+def test_failing_row_fails_alone():
+    calls = []
+
+    def predict(rows):
+        calls.append(len(rows))
+        return predict_fn(rows)
+
+    batcher = MicroBatcher(predict, max_batch_size=8, max_wait_ms=50)
+    rows = [{'id': i, 'bad': i == 2} for i in range(5)]
+    results = asyncio.run(_submit_all(batcher, rows))
+
+    assert results[:2] + results[3:] == [0, 10, 30, 40]
+    assert isinstance(results[2], ValueError)
+    assert batcher.stats.errors == 1
+    # The whole batch once, then row by row.
+    assert calls == [5, 1, 1, 1, 1, 1]
+
+
+async def _request(port: int, method: str, path: str, body: bytes = b'') -> tuple[int, dict]:
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(
+        f'{method} {path} HTTP/1.1\r\nContent-Length: {len(body)}\r\n'
+        f'Connection: close\r\n\r\n'.encode() + body
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    head, _, payload = response.partition(b'\r\n\r\n')
+    return int(head.split()[1]), json.loads(payload)
+
+
+async def _serve_requests(requests: list[tuple[str, str, bytes]]) -> tuple[list, ScoringServer]:
+    scoring = ScoringServer(MicroBatcher(predict_fn, max_batch_size=8, max_wait_ms=20))
+    server = await asyncio.start_server(scoring.handle, '127.0.0.1', 0)
+    port = server.sockets[0].getsockname()[1]
+    batcher_task = asyncio.create_task(scoring.batcher.run())
+    try:
+        responses = await asyncio.gather(*(_request(port, *request) for request in requests))
+    finally:
+        batcher_task.cancel()
+        server.close()
+        await server.wait_closed()
+    return responses, scoring
+
+
+def test_server_routes_each_prediction_to_its_request():
+    rows = [{'id': i, 'bad': i == 3} for i in range(6)]
+    requests = [('POST', '/predict', json.dumps(row).encode()) for row in rows]
+    requests += [
+        ('POST', '/predict', b'{not json'),
+        ('POST', '/predict', b'[1, 2]'),
+        ('GET', '/predict', b''),
+        ('GET', '/health', b''),
+        ('GET', '/unknown', b''),
+    ]
+    responses, scoring = asyncio.run(_serve_requests(requests))
+
+    for i, (status, payload) in enumerate(responses[:6]):
+        if i == 3:
+            assert (status, payload) == (422, {'error': 'Bad row 3.'})
+        else:
+            assert (status, payload) == (200, {'prediction': i * 10})
+    assert [status for status, _ in responses[6:]] == [400, 400, 405, 200, 404]
+    assert scoring.requests == 6
+    assert scoring.metrics()['errors'] == 1
+
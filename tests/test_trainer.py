@@ -0,0 +1,34 @@
+import ast
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.components.model.trainer import ModelTrainer
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_halving_search_fits_chosen_parameters(workdir):
+    rng = np.random.default_rng(0)
+    X = rng.uniform(-1, 1, (600, 4))
+    # Needs more than one split, so stumps lose against deep trees.
+    y = ((X[:, 0] > 0) ^ (X[:, 1] > 0)).astype(int)
+
+    trainer = ModelTrainer()
+    trainer.search = True
+    trainer.search_space = {'max_depth': [1, None], 'n_estimators': [5, 20]}
+    trainer.search_n_candidates = 4
+    trainer.search_factor = 2
+    trainer.search_n_jobs = 1
+    model = trainer._model(X, y)
+
+    results = pd.read_csv(trainer.search_results_path)
+    # Successive halving ran more than one round.
+    assert results['iter'].nunique() > 1
+    best = results[results['iter'] == results['iter'].max()]
+    best = best.sort_values('mean_test_score', ascending=False).iloc[0]
+    params = ast.literal_eval(best['params'])
+    assert params['max_depth'] is None
+    assert {name: model.get_params()[name] for name in params} == params
+    assert model.n_jobs is None
+    assert (model.predict(X) == y).mean() > 0.95
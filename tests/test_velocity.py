@@ -0,0 +1,57 @@
+import pytest
+
+from src.main import start_model_training
+from src.serving.batcher import MicroBatcher
+from src.serving.cache import model_cache
+from src.serving.predict import predict_row
+from src.serving.server import predict_rows
+from tests.conftest import BASE_DATA_PATH
+
+ROW = {
+    'sourceid': 30105,
+    'destinationid': 8692,
+    'amountofmoney': 494528,
+    'month': 5,
+    'typeofaction': 'cash-in',
+    'typeoffraud': 'type1',
+}
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_velocity_model_needs_transaction_date(workdir):
+    start_model_training(BASE_DATA_PATH, velocity_features=True)
+
+    with pytest.raises(ValueError, match='"date"'):
+        predict_row(ROW)
+    assert predict_row({**ROW, 'date': '2019-05-01 12:00:00'}) in (0, 1)
+
+
+def _count(store, row) -> float:
+    """Transactions of the row's account in the velocity store, within the first window."""
+    return store.score_row(row, update=False)[store.columns[0]]
+
+
+@pytest.fixture
+def velocity_model(workdir):
+    start_model_training(BASE_DATA_PATH, velocity_features=True)
+    return {**ROW, 'date': '2019-05-01 12:00:00', 'sourceid': 123_456_789}
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_uncompiled_prediction_counts_transaction_once(velocity_model, monkeypatch):
+    monkeypatch.setattr(model_cache, 'compile', False)
+    model_cache.invalidate()
+    predict_row(velocity_model)
+    predict_row(velocity_model)
+    assert _count(model_cache.get().velocity, velocity_model) == 2
+    model_cache.invalidate()
+
+
+@pytest.mark.filterwarnings('ignore::UserWarning')
+def test_failed_batch_counts_transactions_once(velocity_model):
+    bad_row = {key: value for key, value in velocity_model.items() if key != 'typeofaction'}
+    results = MicroBatcher(predict_rows)._score([velocity_model, bad_row])
+
+    assert results[0] in (0, 1)
+    assert isinstance(results[1], KeyError)
+    assert _count(model_cache.get().velocity, velocity_model) == 1